@@ -26,6 +26,20 @@ Copyright (c) University of Toronto
 # implemented within that task, and previous tasks before it
 
 from society_hierarchy import *
+from society_index import index_of
+from society_loader import add_citizens, load_society
+from society_columnar import columnar_from_society
+from society_parallel import create_society_from_file_parallel
+from society_snapshot import save_snapshot, load_snapshot
+from society_journal import JournaledSimulator
+from society_batch import run_batch
+from society_server import SocietyServer
+from society_loadgen import run_load
+from society_concurrent import RWLock, ConcurrentSimulator, \
+    ConcurrentSociety
+from society_persistent import PersistentSociety
+from society_history import UndoableSimulator
+from client_code import SocietySimulator
 
 
 def sample_society0() -> Society:
@@ -282,6 +296,1164 @@ def test_delete_citizen() -> None:
     assert s.get_citizen(6) is None
 
 
+def test_delete_head() -> None:
+    s = simple_society_example()
+    s.delete_citizen(6)
+    head = s.get_head()
+    assert head.cid == 8 and head.get_superior() is None
+    assert [c.cid for c in head.get_direct_subordinates()] == [2, 3, 5]
+    assert s.get_citizen(6) is None
+    for cid in [8, 2, 3, 5, 9, 7]:
+        s.delete_citizen(cid)
+    assert s.get_head() is None and s.get_all_citizens() == []
+
+
+def test_delete_head_with_several_subordinates() -> None:
+    s = sample_society1()
+    s.delete_citizen(1)
+    head = s.get_head()
+    assert head.cid == 3 and head.get_superior() is None
+    assert [c.cid for c in head.get_direct_subordinates()] == [2, 4]
+    assert s.get_citizen(1) is None
+    assert [c.cid for c in s.get_all_citizens()] == \
+        [2, 3, 4, 5, 6, 7, 8, 9, 10]
+    assert s.get_citizen(9).get_district_name() == 'D2'
+    assert_consistent(s)
+
+    s = sample_society0()
+    s.get_citizen(4).rating = 82
+    s.delete_citizen(1)
+    head = s.get_head()
+    assert head.cid == 3
+    assert [c.cid for c in head.get_direct_subordinates()] == [2, 4]
+    assert head.get_highest_rated_subordinate().cid == 4
+    assert_consistent(s)
+
+
+###########################################################################
+# Tests for the Society cid index
+###########################################################################
+
+def test_citizen_index_tracks_direct_links() -> None:
+    s = sample_society0()
+    c11 = Citizen(11, 'Citizen 11', 3011, 'Watcher', 25)
+    c12 = Citizen(12, 'Citizen 12', 3012, 'Watcher', 25)
+    c12.become_subordinate_to(c11)
+    c11.become_subordinate_to(s.get_citizen(7))
+    assert s.get_citizen(11) is c11
+    assert s.get_citizen(12) is c12
+
+
+def test_citizen_index_tracks_mutations() -> None:
+    s = sample_society1()
+    new_c6 = s.change_citizen_type(6, 'D6')
+    assert s.get_citizen(6) is new_c6
+    s.delete_citizen(6)
+    assert s.get_citizen(6) is None
+    assert s.get_citizen(8).get_superior() is s.get_citizen(2)
+    s.promote_citizen(5)
+    assert [c.cid for c in s.get_all_citizens()] == \
+           [1, 2, 3, 4, 5, 7, 8, 9, 10]
+    assert all(s.get_citizen(c.cid) is c for c in s.get_all_citizens())
+
+
+def test_citizen_index_forgets_detached_subtrees() -> None:
+    s = simple_society_example()
+    s.get_citizen(5).become_subordinate_to(None)
+    assert s.get_citizen(5) is None and s.get_citizen(9) is None
+    assert s.get_citizens_with_job('Engineer') == []
+    assert [c.cid for c in s.get_all_citizens()] == [2, 3, 6, 8]
+
+    s = simple_society_example()
+    c5 = s.get_citizen(5)
+    s.get_head().remove_subordinate(5)
+    assert s.get_citizen(7) is None
+    assert [c.cid for c in s.get_citizens_with_job('Manager')] == [2]
+    s.add_citizen(c5, 8)
+    assert s.get_citizen(9).get_superior() is c5
+    assert [c.cid for c in s.get_citizens_with_job('Engineer')] == [9]
+
+
+def test_citizen_index_keeps_moved_subtrees() -> None:
+    s = simple_society_example()
+    s.get_citizen(5).become_subordinate_to(s.get_citizen(8))
+    assert s.get_citizen(9).get_superior().cid == 5
+    assert [c.cid for c in s.get_citizens_with_job('Engineer')] == [9]
+    assert [c.cid for c in s.get_all_citizens()] == [2, 3, 5, 6, 7, 8, 9]
+
+
+###########################################################################
+# Tests for the k-way subordinate merge
+###########################################################################
+
+def test_get_all_subordinates_interleaved() -> None:
+    s = sample_society0()
+    head = s.get_head()
+    assert [c.cid for c in head.get_all_subordinates()] == \
+           [2, 3, 4, 5, 6, 7, 8, 9, 10]
+    assert list(head.iter_all_subordinates()) == head.get_all_subordinates()
+    assert [c.cid for c in s.get_citizen(6).iter_all_subordinates()] == \
+           [8, 9, 10]
+
+
+def test_merge_all() -> None:
+    c = [Citizen(i, 'Citizen', 3000, 'Job', 10) for i in range(6)]
+    assert merge_all([[c[1], c[4]], [], [c[0], c[5]], [c[2], c[3]]]) == c
+    assert merge_all([]) == []
+
+
+###########################################################################
+# Tests for the Society interval labels
+###########################################################################
+
+def test_interval_labels_follow_mutations() -> None:
+    s = sample_society0()
+    index = index_of(s)
+    assert index.is_in_subtree(10, 2)
+    assert not index.is_in_subtree(7, 2)
+    assert [c.cid for c in index.get_subtree(2)] == [2, 5, 6, 8, 9, 10]
+    s.add_citizen(Citizen(11, 'Citizen 11', 3011, 'Cook', 30), 7)
+    assert index.is_in_subtree(11, 4)
+    s.delete_citizen(6)
+    assert [c.cid for c in index.get_subtree(2)] == [2, 5, 8, 9, 10]
+    assert not index.is_in_subtree(6, 1)
+
+
+def test_closest_common_superior_in_society() -> None:
+    s = sample_society0()
+    assert s.get_citizen(8).get_closest_common_superior(5).cid == 2
+    assert s.get_citizen(8).get_closest_common_superior(7).cid == 1
+    assert s.get_citizen(6).get_closest_common_superior(10).cid == 6
+    assert s.get_citizen(10).get_closest_common_superior(6).cid == 6
+
+
+###########################################################################
+# Tests for the closest common superior index
+###########################################################################
+
+def random_society(n: int, seed: int = 148) -> Society:
+    """Return a Society of <n> Citizens with randomly chosen superiors.
+    """
+    import random
+    rng = random.Random(seed)
+    s = Society()
+    cids = rng.sample(range(1, 10 * n), n)
+    s.add_citizen(Citizen(cids[0], 'Citizen', 3000, 'Job', 50))
+    for i in range(1, n):
+        citizen = Citizen(cids[i], 'Citizen', 3000 + i, f'Job {i % 7}',
+                          rng.randint(0, 100))
+        s.add_citizen(citizen, cids[rng.randrange(i)])
+    return s
+
+
+def test_closest_common_superior_index() -> None:
+    s = random_society(200)
+    citizens = s.get_all_citizens()
+    for a in citizens[::7]:
+        ancestors = []
+        current = a
+        while current is not None:
+            ancestors.append(current)
+            current = current.get_superior()
+        for b in citizens[::11]:
+            expected = next(c for c in ancestors if c.get_citizen(b.cid))
+            assert index_of(s).get_closest_common_superior(a.cid, b.cid) \
+                is expected
+    assert index_of(s).get_closest_common_superior(citizens[0].cid, 0) \
+        is None
+
+
+def test_closest_common_superior_index_dense_cids() -> None:
+    s = sample_society0()
+    index = index_of(s)
+    assert index.get_closest_common_superior(8, 5).cid == 2
+    assert index.get_closest_common_superior(7, 10).cid == 1
+    assert index.get_closest_common_superior(10, 6).cid == 6
+    assert index.get_closest_common_superior(3, 99) is None
+    s.promote_citizen(5)
+    assert s.get_head().cid == 5
+    assert index.get_closest_common_superior(2, 6) is \
+        s.get_citizen(2).get_closest_common_superior(6)
+    assert index.get_closest_common_superior(1, 3).cid == 5
+    labels = index.labels()
+    assert len(labels.exits) == len(labels.depths) == 10
+
+
+def test_closest_common_superior_through_citizen_and_simulator() -> None:
+    s = random_society(200)
+    citizens = s.get_all_citizens()
+    a, b = citizens[5], citizens[150]
+    expected = index_of(s).get_closest_common_superior(a.cid, b.cid)
+    s.add_citizen(Citizen(2000, 'Citizen', 3000, 'Job', 50), a.cid)
+    assert not index_of(s).is_current()
+    assert a.get_closest_common_superior(b.cid) is expected
+    assert index_of(s).is_current()
+    sim = SocietySimulator()
+    sim.current_society = s
+    sim.current_citizen = b
+    s.delete_citizen(2000)
+    assert sim.get_common_superior(a.cid) is expected
+    assert index_of(s).is_current()
+
+
+###########################################################################
+# Tests for the district leader pointers
+###########################################################################
+
+def test_district_name_cache_follows_changes() -> None:
+    s = sample_society1()
+    c10 = s.get_citizen(10)
+    assert c10.get_district_name() == 'D2'
+    s.get_citizen(2).rename_district('Renamed')
+    assert c10.get_district_name() == 'Renamed'
+    s.change_citizen_type(6, 'D6')
+    assert c10.get_district_name() == 'D6'
+    s.delete_citizen(6)
+    assert c10.get_district_name() == 'Renamed'
+    c10.become_subordinate_to(s.get_citizen(7))
+    assert c10.get_district_name() == 'D7'
+    c10.rename_district('D10')
+    assert s.get_citizen(7).get_district_name() == 'D10'
+
+
+def closest_leader(citizen: Citizen) -> Optional[DistrictLeader]:
+    while citizen is not None and not isinstance(citizen, DistrictLeader):
+        citizen = citizen.get_superior()
+    return citizen
+
+
+def test_district_leaders_follow_type_changes() -> None:
+    s = sample_society1()
+    assert s.get_citizen(10)._get_district_leader().cid == 2
+    assert s.get_citizen(3)._get_district_leader() is None
+    s.change_citizen_type(6, 'D6')
+    assert [s.get_citizen(cid)._get_district_leader().cid
+            for cid in [6, 8, 9, 10]] == [6, 6, 6, 6]
+    assert s.get_citizen(5)._get_district_leader().cid == 2
+    s.change_citizen_type(2)
+    assert s.get_citizen(5)._get_district_leader() is None
+    assert s.get_citizen(10)._get_district_leader().cid == 6
+    assert s.get_citizen(7)._get_district_leader().cid == 7
+
+
+def test_district_leaders_follow_every_change() -> None:
+    import random
+    s = random_society(300)
+    rng = random.Random(5)
+    for step in range(300):
+        citizens = s.get_all_citizens()
+        citizen = rng.choice(citizens)
+        if step % 5 == 0:
+            s.change_citizen_type(citizen.cid, f'D{step}')
+        elif step % 5 == 1 and not isinstance(citizen, DistrictLeader):
+            s.promote_citizen(citizen.cid)
+        elif step % 5 == 2 and len(citizens) > 100:
+            s.delete_citizen(citizen.cid)
+        elif step % 5 == 3 and citizen is not s.get_head():
+            superior = rng.choice(citizens)
+            if not index_of(s).is_in_subtree(superior.cid, citizen.cid):
+                citizen.become_subordinate_to(superior)
+        else:
+            add_citizens(s, [(Citizen(10000 + step, 'Lab', 3000, 'Cook', 5),
+                              citizen.cid)])
+        for checked in s.get_all_citizens():
+            assert checked._get_district_leader() is closest_leader(checked)
+    head = s.get_head()
+    s.delete_citizen(head.cid)
+    assert head._get_district_leader() in (head, None)
+    add_citizens(s, [(DistrictLeader(99999, 'Lab', 3000, 'Boss', 5, 'Top'),
+                      None)])
+    for checked in s.get_all_citizens():
+        assert checked._get_district_leader() is closest_leader(checked)
+
+
+###########################################################################
+# Tests for the job index
+###########################################################################
+
+def test_job_index_follows_mutations() -> None:
+    s = sample_society0()
+    s.add_citizen(Citizen(11, 'Citizen 11', 3011, 'Farmer', 30), 7)
+    assert [c.cid for c in s.get_citizens_with_job('Farmer')] == [5, 8, 9, 11]
+    s.delete_citizen(8)
+    assert [c.cid for c in s.get_citizens_with_job('Farmer')] == [5, 9, 11]
+    s._swap_up(s.get_citizen(5))
+    assert [c.cid for c in s.get_citizens_with_job('Farmer')] == [2, 9, 11]
+    assert [c.cid for c in s.get_citizens_with_job('Bank robber')] == [5]
+    new_c9 = s.change_citizen_type(9, 'D9')
+    assert s.get_citizens_with_job('Farmer')[1] is new_c9
+    assert s.get_citizens_with_job('Astronaut') == []
+
+
+def test_job_index_follows_job_assignment() -> None:
+    s = sample_society0()
+    s.get_citizen(10).job = 'Farmer'
+    assert [c.cid for c in s.get_citizens_with_job('Farmer')] == \
+           [5, 8, 9, 10]
+    assert s.get_citizens_with_job('Driver') == []
+    c11 = Citizen(11, 'Citizen 11', 3011, 'Cook', 30)
+    c11.job = 'Farmer'
+    s.add_citizen(c11, 7)
+    assert [c.cid for c in s.get_citizens_with_job('Farmer')] == \
+           [5, 8, 9, 10, 11]
+    c8 = s.get_citizen(8)
+    s.get_citizen(2).remove_subordinate(6)
+    c8.job = 'Cook'
+    assert c8.job == 'Cook'
+    assert [c.cid for c in s.get_citizens_with_job('Cook')] == [3, 4]
+
+
+###########################################################################
+# Tests for the columnar society
+###########################################################################
+
+def test_columnar_society_matches_society() -> None:
+    s = random_society(150)
+    for i, citizen in enumerate(s.get_all_citizens()):
+        if i % 10 == 0:
+            s.change_citizen_type(citizen.cid, f'D{citizen.cid}')
+    columnar = columnar_from_society(s)
+
+    def cids(citizens: list[Citizen]) -> list[int]:
+        return [c.cid for c in citizens]
+
+    assert len(columnar) == 150
+    assert cids(columnar.get_all_citizens()) == cids(s.get_all_citizens())
+    assert cids(columnar.get_citizens_with_job('Job 3')) == \
+           cids(s.get_citizens_with_job('Job 3'))
+    citizens = s.get_all_citizens()
+    for citizen in citizens[::5]:
+        cid = citizen.cid
+        assert columnar.get_citizen(cid).rating == citizen.rating
+        assert cids(columnar.get_direct_subordinates(cid)) == \
+               cids(citizen.get_direct_subordinates())
+        assert cids(columnar.get_all_subordinates(cid)) == \
+               cids(citizen.get_all_subordinates())
+        assert columnar.get_district_name(cid) == citizen.get_district_name()
+        if isinstance(citizen, DistrictLeader):
+            assert cids(columnar.get_district_citizens(cid)) == \
+                   cids(citizen.get_district_citizens())
+        other = citizens[-1].cid
+        assert columnar.get_closest_common_superior(cid, other).cid == \
+               index_of(s).get_closest_common_superior(cid, other).cid
+    assert columnar.get_citizen(0) is None
+
+
+###########################################################################
+# Tests for the sorted subordinate lists
+###########################################################################
+
+def test_add_and_remove_subordinates_keep_order() -> None:
+    import random
+    rng = random.Random(148)
+    boss = Citizen(1, 'Citizen 1', 3001, 'Big boss', 10)
+    cids = rng.sample(range(2, 5000), 500)
+    for cid in cids:
+        boss.add_subordinate(Citizen(cid, 'Citizen', 3000, 'Job', 10))
+    assert [c.cid for c in boss.get_direct_subordinates()] == \
+           list(sorted(cids))
+    for cid in cids[:250]:
+        boss.remove_subordinate(cid)
+    assert [c.cid for c in boss.get_direct_subordinates()] == \
+           list(sorted(cids[250:]))
+    boss.remove_subordinate(5001)
+    assert len(boss.get_direct_subordinates()) == 250
+
+
+###########################################################################
+# Tests for the recursion-free traversals
+###########################################################################
+
+def test_deep_chain_of_command() -> None:
+    depth = 5000
+    head = DistrictLeader(1, 'Citizen 1', 3001, 'Big boss', 10, 'D1')
+    bottom = head
+    for cid in range(2, depth + 1):
+        citizen = Citizen(cid, 'Citizen', 3000, 'Job', 10)
+        citizen.become_subordinate_to(bottom)
+        bottom = citizen
+    assert bottom.get_society_head() is head
+    assert head.get_citizen(depth) is bottom
+    assert len(head.get_all_subordinates()) == depth - 1
+    assert bottom.get_district_name() == 'D1'
+    bottom.rename_district('D2')
+    assert head.get_district_name() == 'D2'
+    assert bottom.get_closest_common_superior(2).cid == 2
+    assert str(head).count('\n') == depth - 1
+    s = Society(head)
+    assert index_of(s).get_closest_common_superior(depth, depth // 2).cid \
+        == depth // 2
+    assert len(s.get_all_citizens()) == depth
+
+
+###########################################################################
+# Tests for the streaming tree renderer
+###########################################################################
+
+def test_render_window_of_society() -> None:
+    from io import StringIO
+    s = sample_society1()
+    out = StringIO()
+    assert s.render(out) == 10
+    assert out.getvalue() == str(s) + '\n'
+    out = StringIO()
+    assert s.render(out, start_cid=2, max_depth=1) == 3
+    assert out.getvalue().splitlines() == [
+        '2 (rating = 19) --> District Leader for D2',
+        '  5 (rating = 100)',
+        '  6 (rating = 56)']
+    out = StringIO()
+    assert s.render(out, max_lines=4) == 4
+    assert out.getvalue().splitlines()[-1] == '    6 (rating = 56)'
+    assert s.render(StringIO(), start_cid=99) == 0
+
+
+###########################################################################
+# Tests for promotion by pointer surgery
+###########################################################################
+
+def assert_consistent(s: Society) -> None:
+    """Check the representation invariants of every Citizen in <s> and that
+    the Society's indexes agree with its hierarchy.
+    """
+    head = s.get_head()
+    assert head.get_superior() is None
+    citizens = [head] + head.get_all_subordinates()
+    for citizen in citizens:
+        subordinates = citizen.get_direct_subordinates()
+        assert [c.cid for c in subordinates] == \
+               sorted(c.cid for c in subordinates)
+        assert all(c.get_superior() is citizen for c in subordinates)
+        assert s.get_citizen(citizen.cid) is citizen
+    for job in {c.job for c in citizens}:
+        assert s.get_citizens_with_job(job) == \
+               sorted((c for c in citizens if c.job == job),
+                      key=lambda c: c.cid)
+
+
+def test_promote_citizen_by_rating() -> None:
+    s = sample_society0()
+    s.add_citizen(Citizen(11, 'Citizen 11', 3011, 'Spy', 50), 10)
+    s.promote_citizen(11)
+    c11 = s.get_citizen(11)
+    assert c11.get_superior().cid == 6
+    assert c11.job == 'Driver'
+    assert [c.cid for c in c11.get_direct_subordinates()] == [10]
+    assert [c.cid for c in s.get_citizen(6).get_direct_subordinates()] \
+           == [8, 9, 11]
+    assert_consistent(s)
+
+
+def test_promote_citizen_to_head() -> None:
+    s = sample_society0()
+    s.promote_citizen(3)
+    assert s.get_head().cid == 3
+    assert s.get_head().job == 'Watcher'
+    assert s.get_citizen(1).get_superior() is s.get_head()
+    assert_consistent(s)
+
+
+###########################################################################
+# Tests for in-place role changes
+###########################################################################
+
+def test_change_citizen_type_in_place() -> None:
+    sim = SocietySimulator()
+    sim.current_society = sample_society1()
+    sim.display_citizen(6)
+    c6 = sim.current_citizen
+    sim.become_district_leader('D6')
+    assert sim.current_citizen is c6 and isinstance(c6, DistrictLeader)
+    assert sim.current_society.get_citizen(8).get_district_name() == 'D6'
+    assert [c.cid for c in sim.find_district_citizens()] == [6, 8, 9, 10]
+    sim.become_citizen()
+    assert sim.current_citizen is c6 and not isinstance(c6, DistrictLeader)
+    assert sim.current_society.get_citizen(8).get_district_name() == 'D2'
+    assert sim.get_current_citizen_district() == 'D2'
+    assert_consistent(sim.current_society)
+
+
+###########################################################################
+# Tests for bulk insertion
+###########################################################################
+
+def test_add_citizens_matches_add_citizen() -> None:
+    import random
+    expected = random_society(300)
+    records = [(Citizen(c.cid, c.manufacturer, c.model_year, c.job, c.rating),
+                None if c.get_superior() is None else c.get_superior().cid)
+               for c in expected.get_all_citizens()]
+    random.Random(1).shuffle(records)
+    s = Society()
+    assert add_citizens(s, records) == ([], [])
+    assert str(s) == str(expected)
+    assert_consistent(s)
+    cid1, cid2 = records[0][0].cid, records[1][0].cid
+    assert index_of(s).get_closest_common_superior(cid1, cid2).cid == \
+           index_of(expected).get_closest_common_superior(cid1, cid2).cid
+
+
+def test_add_citizens_into_existing_society() -> None:
+    s = sample_society0()
+    new_head = Citizen(20, 'Citizen 20', 3020, 'Farmer', 99)
+    orphans, cycles = add_citizens(s, [
+        (Citizen(12, 'Citizen 12', 3012, 'Farmer', 1), 11),
+        (Citizen(11, 'Citizen 11', 3011, 'Farmer', 1), 2),
+        (Citizen(13, 'Citizen 13', 3013, 'Farmer', 1), 30),
+        (Citizen(14, 'Citizen 14', 3014, 'Farmer', 1), 13),
+        (new_head, None)])
+    assert (orphans, cycles) == ([13, 14], [])
+    assert s.get_head() is new_head
+    assert [c.cid for c in s.get_citizen(2).get_direct_subordinates()] == \
+           [5, 6, 11]
+    assert [c.cid for c in s.get_citizens_with_job('Farmer')] == \
+           [5, 8, 9, 11, 12, 20]
+    assert s.get_citizen(13) is None
+    assert_consistent(s)
+
+
+###########################################################################
+# Tests for load_society
+###########################################################################
+
+def test_load_society_chunked() -> None:
+    with open('citizens.csv') as f:
+        expected = create_society_from_file(f)
+    for chunk_size in [None, 1, 3, 100]:
+        with open('citizens.csv') as f:
+            s = load_society(f, chunk_size=chunk_size)
+        assert str(s) == str(expected)
+        assert_consistent(s)
+        assert s.get_citizen(10).get_district_name() == 'District A'
+
+
+def test_load_society_errors() -> None:
+    lines = ['3,"Lab, Inc.",3003,Cook,30,2',
+             '2,Lab,3002,Cook,20,1,"North, East"',
+             '4,Lab,3004,Cook',
+             '1,Lab,3001,Boss,10,',
+             '2,Lab,3002,Cook,20,1',
+             '5,Lab,3005,Cook,50,6',
+             '6,Lab,3006,Cook,60,5',
+             '7,Lab,3007,Cook,70,,']
+    problems = []
+    s = load_society(lines, chunk_size=2, errors=problems)
+    assert sorted(line for line, _ in problems) == [3, 5, 6, 7, 8]
+    assert s.get_citizen(3).manufacturer == 'Lab, Inc.'
+    assert s.get_citizen(3).get_district_name() == 'North, East'
+    assert [c.cid for c in s.get_all_citizens()] == [1, 2, 3]
+    try:
+        load_society(lines)
+    except ValueError as error:
+        assert str(error).startswith('line 3:')
+    else:
+        assert False
+
+
+###########################################################################
+# Tests for create_society_from_file_parallel
+###########################################################################
+
+def test_create_society_from_file_parallel(tmp_path) -> None:
+    lines = ['3,"Lab, Inc.",3003,Cook,30,2',
+             '2,Lab,3002,Cook,20,1,"North, East"',
+             '4,Lab,3004,Cook',
+             '',
+             '1,Lab,3001,Boss,10,',
+             '2,Lab,3002,Cook,20,1',
+             '5,Lab,3005,Cook,50,6',
+             '6,Lab,3006,Cook,60,5',
+             '7,Lab,3007,Cook,70,,',
+             '200,Lab,3000,Cook,50,0',
+             '201,Lab,3000,Cook,50,200'] + \
+            [f'{cid},Lab,3000,Cook,{cid % 7},{cid // 2}'
+             for cid in range(8, 200)]
+    path = tmp_path / 'citizens.csv'
+    path.write_text('\n'.join(lines) + '\n')
+    expected_problems = []
+    expected = load_society(lines, errors=expected_problems)
+    for workers in [1, 3]:
+        problems = []
+        s = create_society_from_file_parallel(str(path), workers=workers,
+                                              errors=problems)
+        assert str(s) == str(expected)
+        assert problems == sorted(expected_problems)
+        assert (10, 'superior 0 does not exist') in problems
+        assert_consistent(s)
+        assert s.get_citizen(3).get_district_name() == 'North, East'
+    try:
+        create_society_from_file_parallel(str(path), workers=2)
+    except ValueError as error:
+        assert str(error).startswith('line 3:')
+    else:
+        assert False
+
+
+###########################################################################
+# Tests for snapshots
+###########################################################################
+
+def test_snapshot_round_trip(tmp_path) -> None:
+    s = random_society(300)
+    s.change_citizen_type(s.get_head().cid, 'Café District')
+    path = str(tmp_path / 'society.snap')
+    save_snapshot(s, path)
+    snapshot = load_snapshot(path)
+    assert len(snapshot) == 300
+    for citizen in s.get_all_citizens()[::7]:
+        cid = citizen.cid
+        assert snapshot.get_district_name(cid) == citizen.get_district_name()
+        assert [c.cid for c in snapshot.get_all_subordinates(cid)] == \
+            [c.cid for c in citizen.get_all_subordinates()]
+    assert snapshot.get_head().get_district_name() == 'Café District'
+
+    sim = SocietySimulator()
+    sim.file_to_society(path)
+    assert str(sim.current_society) == str(s)
+    assert_consistent(sim.current_society)
+
+
+def test_load_snapshot_rejects_other_files() -> None:
+    try:
+        load_snapshot('citizens.csv')
+    except ValueError:
+        pass
+    else:
+        assert False
+
+
+###########################################################################
+# Tests for the journal
+###########################################################################
+
+def run_journaled_operations(sim: SocietySimulator) -> None:
+    sim.create_citizen(1, 'Lab', 3001, 10, 'Boss', 0)
+    for cid in range(2, 30):
+        sim.create_citizen(cid, 'Lab', 3000, cid * 3 % 50, 'Cook', cid // 2)
+    sim.display_citizen(4)
+    sim.become_district_leader('East')
+    sim.display_citizen(9)
+    sim.rename_current_district('West')
+    sim.display_citizen(17)
+    sim.promote_citizen(17)
+    sim.delete_citizen(5)
+    sim.display_citizen(8)
+    sim.become_citizen()
+
+
+def test_journal_replays_operations(tmp_path) -> None:
+    expected = SocietySimulator()
+    run_journaled_operations(expected)
+    sim = JournaledSimulator(str(tmp_path))
+    run_journaled_operations(sim)
+    sim.close()
+    reopened = JournaledSimulator(str(tmp_path))
+    assert str(reopened.current_society) == str(expected.current_society)
+    assert_consistent(reopened.current_society)
+    reopened.close()
+
+
+def test_journal_compacts_into_snapshots(tmp_path) -> None:
+    expected = SocietySimulator()
+    run_journaled_operations(expected)
+    sim = JournaledSimulator(str(tmp_path), sync_every=3, compact_at=300)
+    run_journaled_operations(sim)
+    sim.close()
+    names = sorted(path.name for path in tmp_path.iterdir())
+    assert any(name.endswith('.snap') for name in names)
+    assert len(names) <= 3
+    reopened = JournaledSimulator(str(tmp_path))
+    assert str(reopened.current_society) == str(expected.current_society)
+    reopened.close()
+
+
+def test_journal_discards_partly_written_line(tmp_path) -> None:
+    sim = JournaledSimulator(str(tmp_path))
+    sim.create_citizen(1, 'Lab', 3001, 10, 'Boss', 0)
+    sim.close()
+    segment = max(tmp_path.glob('journal-*.ndjson'))
+    with open(segment, 'a') as f:
+        f.write('{"seq":2,"op":"create_cit')
+    sim = JournaledSimulator(str(tmp_path))
+    sim.create_citizen(2, 'Lab', 3002, 20, 'Cook', 1)
+    sim.close()
+    sim = JournaledSimulator(str(tmp_path))
+    assert [c.cid for c in sim.current_society.get_all_citizens()] == [1, 2]
+    sim.close()
+
+
+###########################################################################
+# Tests for the batch command processor
+###########################################################################
+
+def test_run_batch_coalesces_queries() -> None:
+    import json
+    from io import StringIO
+
+    class CountingSimulator(SocietySimulator):
+        calls = 0
+
+        def find_citizens_with_job(self, job: str) -> list[Citizen]:
+            CountingSimulator.calls += 1
+            return SocietySimulator.find_citizens_with_job(self, job)
+
+    commands = [{'cmd': 'create_citizen', 'args': [1, 'Lab', 3001, 10,
+                                                   'Cook', 0]},
+                {'cmd': 'find_citizens_with_job', 'args': ['Cook']},
+                {'cmd': 'find_citizens_with_job', 'args': ['Cook']},
+                {'cmd': 'create_citizen', 'args': [2, 'Lab', 3002, 20,
+                                                   'Cook', 1]},
+                {'cmd': 'find_citizens_with_job', 'args': ['Cook']},
+                {'id': 'x', 'cmd': 'delete_citizen'}]
+    out = StringIO()
+    failures = run_batch([json.dumps(c) for c in commands], out,
+                         CountingSimulator())
+    responses = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert failures == 1
+    assert [r.get('result') for r in responses[1:5]] == \
+        [[1], [1], None, [1, 2]]
+    assert responses[5]['id'] == 'x' and 'error' in responses[5]
+    assert CountingSimulator.calls == 2
+
+
+###########################################################################
+# Tests for the query server
+###########################################################################
+
+def test_server_answers_pipelined_queries() -> None:
+    import asyncio
+    import json
+
+    s = random_society(200)
+    cids = [c.cid for c in s.get_all_citizens()]
+    head, a, b = s.get_head().cid, cids[5], cids[9]
+
+    async def scenario() -> list[dict]:
+        server = await SocietyServer(s).start()
+        port = server.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        requests = [{'id': 1, 'query': 'get_all_subordinates',
+                     'args': [head]},
+                    {'id': 2, 'query': 'get_citizen', 'args': [a]},
+                    {'id': 3, 'query': 'get_common_superior', 'args': [a, b]},
+                    {'id': 4, 'query': 'fly'}]
+        writer.write(b''.join(json.dumps(r).encode() + b'\n'
+                              for r in requests))
+        answers = [json.loads(await reader.readline()) for _ in requests]
+        writer.close()
+        report = await run_load(200, 4, 8, cids, ['Job 1'], port=port)
+        server.close()
+        await server.wait_closed()
+        assert report['errors'] == 0
+        return sorted(answers, key=lambda a: a['id'])
+
+    answers = asyncio.run(scenario())
+    assert answers[0]['result'] == [cid for cid in cids if cid != head]
+    assert answers[1]['result']['superior'] == \
+        s.get_citizen(a).get_superior().cid
+    assert answers[2]['result'] == \
+        index_of(s).get_closest_common_superior(a, b).cid
+    assert 'error' in answers[3]
+
+
+def test_server_shares_identical_queries() -> None:
+    import asyncio
+    from society_server import QUERIES
+
+    calls = []
+    function, _ = QUERIES['find_citizens_with_job']
+
+    def counting(society: Society, job: str) -> list[int]:
+        calls.append(job)
+        return function(society, job)
+
+    async def scenario() -> list:
+        server = SocietyServer(random_society(50))
+        QUERIES['find_citizens_with_job'] = (counting, True)
+        try:
+            return await asyncio.gather(
+                *(server.answer('find_citizens_with_job', ['Job 1'])
+                  for _ in range(10)))
+        finally:
+            QUERIES['find_citizens_with_job'] = (function, True)
+
+    answers = asyncio.run(scenario())
+    assert len(calls) == 1
+    assert all(answer == answers[0] for answer in answers)
+
+
+###########################################################################
+# Tests for concurrent access
+###########################################################################
+
+def test_rwlock_shares_reads_and_excludes_writes() -> None:
+    import threading
+    lock = RWLock()
+    both_reading = threading.Barrier(2, timeout=5)
+    events = []
+
+    def reader() -> None:
+        with lock.read_locked():
+            both_reading.wait()  # fails unless both readers hold the lock
+            with lock.read_locked():
+                events.append('read')
+
+    def writer() -> None:
+        with lock.write_locked():
+            with lock.read_locked():
+                events.append('write')
+
+    threads = [threading.Thread(target=f) for f in [reader, reader, writer]]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(events) == ['read', 'read', 'write']
+    with lock.read_locked():
+        try:
+            lock.acquire_write()
+        except RuntimeError:
+            pass
+        else:
+            assert False
+
+
+def test_concurrent_society_under_stress() -> None:
+    import random
+    import threading
+    s = ConcurrentSociety.from_society(random_society(400))
+    cids = [c.cid for c in s.get_all_citizens()]
+    errors = []
+    done = threading.Event()
+
+    def read(seed: int) -> None:
+        rng = random.Random(seed)
+        try:
+            while not done.is_set():
+                cid = rng.choice(cids)
+                with s.lock.read_locked():
+                    citizen = s.get_citizen(cid)
+                    if citizen is not None:
+                        subordinates = citizen.get_all_subordinates()
+                        assert subordinates == sorted(subordinates)
+                        citizen.get_district_name()
+                s.get_citizens_with_job('Job 3')
+                s.get_top_rated(cid, 3)
+                assert s.get_all_subordinates(cid) == \
+                    sorted(s.get_all_subordinates(cid))
+                s.get_district_citizens(cid)
+        except Exception as error:
+            errors.append(error)
+
+    readers = [threading.Thread(target=read, args=(i,)) for i in range(4)]
+    for thread in readers:
+        thread.start()
+    rng = random.Random(0)
+    for i in range(100):
+        cid = rng.choice(cids)
+        if s.get_citizen(cid) is s.get_head():
+            continue
+        if i % 4 == 0:
+            s.delete_citizen(cid)
+            cids.remove(cid)
+        elif i % 4 == 1:
+            s.set_rating(cid, rng.randint(0, 100))
+        elif i % 4 == 2:
+            s.set_job(cid, 'Job 3')
+        elif not isinstance(s.get_citizen(cid), DistrictLeader):
+            s.promote_citizen(cid)
+    done.set()
+    for thread in readers:
+        thread.join()
+    assert errors == []
+    assert_consistent(s)
+
+
+def test_concurrent_simulator() -> None:
+    sim = ConcurrentSimulator()
+    sim.file_to_society('citizens.csv')
+    sim.display_citizen(10)
+    assert sim.get_current_citizen_district() == 'District A'
+    with sim.lock.read_locked():
+        assert sim.current_citizen.get_superior() is not None
+        try:  # display_* change the simulator, so they need the write lock
+            sim.display_all_subordinates()
+        except RuntimeError:
+            pass
+        else:
+            assert False
+    sim.display_all_subordinates()
+    assert sim.current_subordinates == \
+        sim.current_citizen.get_all_subordinates()
+
+
+def test_concurrent_society_locked_queries() -> None:
+    s = ConcurrentSociety.from_society(random_society(50))
+    for citizen in s.get_all_citizens()[::5]:
+        s.change_citizen_type(citizen.cid, f'District {citizen.cid}')
+    for citizen in s.get_all_citizens():
+        assert s.get_all_subordinates(citizen.cid) == \
+            citizen.get_all_subordinates()
+        if isinstance(citizen, DistrictLeader):
+            assert s.get_district_citizens(citizen.cid) == \
+                citizen.get_district_citizens()
+        else:
+            assert s.get_district_citizens(citizen.cid) == []
+    assert s.get_all_subordinates(-1) == []
+    assert s.get_district_citizens(-1) == []
+
+
+###########################################################################
+# Tests for persistent societies
+###########################################################################
+
+def test_persistent_society_matches_society() -> None:
+    import random
+    s = random_society(300)
+    p = PersistentSociety.from_society(s)
+    versions = [(p, str(s))]
+    rng = random.Random(3)
+    for step in range(120):
+        cid = rng.choice([c.cid for c in s.get_all_citizens()])
+        citizen = s.get_citizen(cid)
+        if step % 4 == 0 and citizen is not s.get_head():
+            s.delete_citizen(cid)
+            p = p.delete_citizen(cid)
+        elif step % 4 == 1 and not isinstance(citizen, DistrictLeader):
+            s.promote_citizen(cid)
+            p = p.promote_citizen(cid)
+        elif step % 4 == 2:
+            s.change_citizen_type(cid, f'District {cid}')
+            p = p.change_citizen_type(cid, f'District {cid}')
+        else:
+            citizen.rename_district('Renamed')
+            p = p.rename_district(cid, 'Renamed')
+        versions.append((p, str(s)))
+    # Every earlier version is unchanged by the updates made after it.
+    for version, expected in versions:
+        assert str(version.to_society()) == expected
+    assert len(p) == len(s.get_all_citizens())
+    for citizen in s.get_all_citizens()[::10]:
+        assert p.get_district_name(citizen.cid) == \
+            citizen.get_district_name()
+        assert [c.cid for c in p.get_all_subordinates(citizen.cid)] == \
+            [c.cid for c in citizen.get_all_subordinates()]
+
+
+def test_persistent_society_add_and_delete_head() -> None:
+    p = PersistentSociety()
+    p = p.add_citizen(Citizen(2, 'Lab', 3002, 'Cook', 20))
+    p = p.add_citizen(Citizen(1, 'Lab', 3001, 'Boss', 10))
+    p = p.add_citizen(Citizen(3, 'Lab', 3003, 'Cook', 30), 1)
+    assert [c.cid for c in p.get_direct_subordinates(1)] == [2, 3]
+    q = p.delete_citizen(1)
+    assert q.get_head().cid == 3
+    assert q.get_superior(2).cid == 3
+    assert p.get_head().cid == 1
+    assert q.get_closest_common_superior(2, 3).cid == 3
+    assert len(q.delete_citizen(3).delete_citizen(2)) == 0
+
+
+###########################################################################
+# Tests for undo and redo
+###########################################################################
+
+def society_state(s: Society) -> tuple:
+    return str(s), [(c.cid, c.job, type(c).__name__, c.get_district_name())
+                    for c in s.get_all_citizens()]
+
+
+def test_undo_redo_restores_every_state() -> None:
+    import random
+    sim = UndoableSimulator(history_depth=1000)
+    sim.current_society = random_society(300)
+    sim.current_citizen = sim.current_society.get_head()
+    states = [society_state(sim.current_society)]
+    rng = random.Random(5)
+    for step in range(150):
+        society = sim.current_society
+        cid = rng.choice([c.cid for c in society.get_all_citizens()])
+        sim.display_citizen(cid)
+        if step % 6 == 0:
+            sim.create_citizen(10_000 + step, 'Lab', 3000, rng.randint(0, 100),
+                               'New', rng.choice([0, cid]))
+        elif step % 6 == 1:
+            sim.delete_citizen(cid if step % 5 else society.get_head().cid)
+        elif step % 6 == 2 and not sim.is_district_leader():
+            sim.promote_citizen(cid)
+        elif step % 6 == 3 and not sim.is_district_leader():
+            sim.become_district_leader(f'District {step}')
+        elif step % 6 == 4 and sim.is_district_leader():
+            sim.become_citizen()
+        else:
+            sim.rename_current_district(f'Renamed {step}')
+        states.append(society_state(sim.current_society))
+    for expected in reversed(states[:-1]):
+        assert sim.undo()
+        assert society_state(sim.current_society) == expected
+        assert_consistent(sim.current_society)
+    assert not sim.undo()
+    for expected in states[1:]:
+        assert sim.redo()
+        assert society_state(sim.current_society) == expected
+    assert not sim.redo()
+
+
+def test_undo_history_is_bounded() -> None:
+    sim = UndoableSimulator(history_depth=2)
+    sim.file_to_society('citizens.csv')
+    for cid in [5, 7, 9]:
+        sim.delete_citizen(cid)
+    assert sim.undo() and sim.undo() and not sim.undo()
+    assert sim.current_society.get_citizen(5) is None
+    assert sim.current_society.get_citizen(7) is not None
+    sim.create_citizen(2000, 'Lab', 3000, 10, 'Cook', 0)
+    assert not sim.can_redo()
+    sim.history_depth = 0
+    assert not sim.can_undo()
+
+
+###########################################################################
+# Tests for rating summaries
+###########################################################################
+
+def test_rating_summaries_follow_changes() -> None:
+    import random
+    s = random_society(300)
+    rng = random.Random(11)
+    for step in range(200):
+        citizens = s.get_all_citizens()
+        citizen = rng.choice(citizens)
+        if step % 5 == 0:
+            s.add_citizen(Citizen(5000 + step, 'Lab', 3000, 'New',
+                                  rng.randint(0, 100)),
+                          rng.choice([None, citizen.cid]))
+        elif step % 5 == 1 and len(citizens) > 1:
+            s.delete_citizen(citizen.cid)
+        elif step % 5 == 2 and not isinstance(citizen, DistrictLeader):
+            s.promote_citizen(citizen.cid)
+        else:
+            citizen.rating = rng.randint(0, 100)
+        for checked in rng.sample(s.get_all_citizens(), 5) + [s.get_head()]:
+            ratings = [c.rating for c in index_of(s).get_subtree(checked.cid)]
+            assert checked.get_rating_summary() == \
+                (len(ratings), sum(ratings), min(ratings), max(ratings))
+
+
+def test_rating_summaries_after_moves_and_bulk_adds() -> None:
+    s = random_society(300)
+    citizens = s.get_all_citizens()
+    citizens[10].become_subordinate_to(s.get_head())
+    superior = next(c for c in citizens[20:] if c.get_direct_subordinates())
+    superior.remove_subordinate(superior.get_direct_subordinates()[0].cid)
+    add_citizens(s, [(Citizen(5000 + i, 'Lab', 3000, 'New', i),
+                      citizens[7 * i].cid) for i in range(20)]
+                 + [(Citizen(6000, 'Lab', 3000, 'New', 100), None),
+                    (Citizen(6001, 'Lab', 3000, 'New', 0), 5003)])
+    for checked in s.get_all_citizens():
+        ratings = [c.rating for c in iter_preorder(checked)]
+        assert checked.get_rating_summary() == \
+            (len(ratings), sum(ratings), min(ratings), max(ratings))
+    # Summaries are kept by the Citizens themselves: no index is built.
+    assert s._index is None
+
+
+def test_simulator_district_rating_summary() -> None:
+    sim = SocietySimulator()
+    sim.file_to_society('citizens.csv')
+    sim.display_citizen(10)
+    leader = sim.current_citizen._get_district_leader()
+    ratings = [c.rating for c in leader.get_district_citizens()]
+    summary = sim.get_current_district_rating_summary()
+    assert summary == (len(ratings), sum(ratings), min(ratings), max(ratings))
+    assert summary.mean == sum(ratings) / len(ratings)
+
+
+###########################################################################
+# Tests for rating-ordered queries
+###########################################################################
+
+def by_rating(citizens: list[Citizen]) -> list[int]:
+    return [c.cid for c in sorted(citizens, key=lambda c: (-c.rating, c.cid))]
+
+
+def test_top_rated_follow_changes() -> None:
+    import random
+    s = random_society(300)
+    rng = random.Random(13)
+    for step in range(150):
+        citizen = rng.choice(s.get_all_citizens())
+        if step % 3 == 0 and citizen is not s.get_head():
+            s.delete_citizen(citizen.cid)
+        elif step % 3 == 1 and not isinstance(citizen, DistrictLeader):
+            s.promote_citizen(citizen.cid)
+        else:
+            citizen.rating = rng.randint(0, 100)
+        for checked in rng.sample(s.get_all_citizens(), 3):
+            k = rng.randint(1, 10)
+            index = index_of(s)
+            assert [c.cid for c in index.get_top_rated(checked.cid, k)] == \
+                by_rating(index.get_subtree(checked.cid))[:k]
+            if checked.get_direct_subordinates():
+                assert checked.get_highest_rated_subordinate().cid == \
+                    by_rating(checked.get_direct_subordinates())[0]
+
+
+def test_top_rated_right_after_a_change_visits_few_citizens(
+        monkeypatch) -> None:
+    import heapq
+    s = random_society(3000)
+    head = s.get_head()
+    index = index_of(s)
+    index.get_top_rated(head.cid, 5)
+    s.delete_citizen(head.get_all_subordinates()[-1].cid)
+    pushed = []
+    push = heapq.heappush
+
+    def counted_push(heap: list, item: tuple) -> None:
+        pushed.append(item)
+        push(heap, item)
+
+    monkeypatch.setattr(heapq, 'heappush', counted_push)
+    top = index.get_top_rated(head.cid, 5)
+    assert [c.cid for c in top] == by_rating(s.get_all_citizens())[:5]
+    assert len(pushed) < 200
+    assert not index.is_current()
+
+
+def test_highest_rated_subordinate_ties_and_rating_changes() -> None:
+    s = sample_society1()
+    who = s.get_citizen(2)
+    assert who.get_highest_rated_subordinate().cid == 5
+    s.get_citizen(6).rating = 100
+    assert who.get_highest_rated_subordinate().cid == 5
+    s.get_citizen(5).rating = 0
+    assert who.get_highest_rated_subordinate().cid == 6
+
+
+def test_highest_rated_subordinate_after_loading() -> None:
+    with open('citizens.csv') as f:
+        s = load_society(f, chunk_size=3)
+    for citizen in s.get_all_citizens():
+        if citizen.get_direct_subordinates():
+            assert citizen.get_highest_rated_subordinate().cid == \
+                by_rating(citizen.get_direct_subordinates())[0]
+    head = s.get_head()
+    for subordinate in head.get_direct_subordinates()[1:]:
+        head.remove_subordinate(subordinate.cid)
+    assert head.get_highest_rated_subordinate() is \
+        head.get_direct_subordinates()[0]
+
+
+def test_simulator_top_rated_district_citizens() -> None:
+    sim = SocietySimulator()
+    sim.file_to_society('citizens.csv')
+    sim.display_citizen(10)
+    leader = sim.current_citizen._get_district_leader()
+    assert [c.cid for c in sim.find_top_rated_district_citizens(3)] == \
+        by_rating(leader.get_district_citizens())[:3]
+
+
 if __name__ == '__main__':
     import pytest
 
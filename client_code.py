@@ -32,8 +32,10 @@ any changes, are expressly prohibited.
 """
 
 from typing import Optional
-from society_hierarchy import Citizen, Society, DistrictLeader, \
-    create_society_from_file
+from society_hierarchy import Citizen, Society, DistrictLeader, RatingSummary
+from society_index import index_of
+from society_loader import load_society
+from society_snapshot import is_snapshot, society_from_snapshot
 
 
 class SocietySimulator:
@@ -176,7 +178,8 @@ class SocietySimulator:
                         there is a Citizen with ID cid in the society
 
         """
-        return self.current_citizen.get_closest_common_superior(cid)
+        return index_of(self.current_society).get_closest_common_superior(
+            self.current_citizen.cid, cid)
 
     # === Uses code from Task 2 ===
     def is_district_leader(self) -> bool:
@@ -208,6 +211,31 @@ class SocietySimulator:
             return self.current_citizen.get_district_citizens()
         return []
 
+    def get_current_district_rating_summary(self) -> Optional[RatingSummary]:
+        """Return the count, total, lowest, highest (and mean) of the ratings
+        of the citizens in the current Citizen's immediate district and all
+        its subdistricts.
+
+        If there is no current Citizen, or it is not part of any districts,
+        return None.
+        """
+        if self.current_citizen:
+            return self.current_citizen.get_district_rating_summary()
+        return None
+
+    def find_top_rated_district_citizens(self, k: int) -> list[Citizen]:
+        """Return the <k> highest rated citizens in the current Citizen's
+        immediate district and all its subdistricts, from the highest rating
+        down (in order of increasing cids among equal ratings).
+
+        If there is no current Citizen, or it is not part of any districts,
+        return an empty list.
+        """
+        if self.current_citizen:
+            return index_of(self.current_society).get_top_rated_in_district(
+                self.current_citizen.cid, k)
+        return []
+
     def rename_current_district(self, district_name: str) -> None:
         """Change the current Citizen's immediate district leader's district to
         be <district_name>.
@@ -277,10 +305,16 @@ class SocietySimulator:
         """Read the Society data in the file named <filename>, creating a
         Society from it and setting it as the current Society.
         Set the current Citizen to the head of the Society.
+
+        The file may be in the format of citizens.csv or a snapshot written
+        by society_snapshot.save_snapshot.
         """
-        with open(filename) as f:
-            self.current_society = create_society_from_file(f)
-            self.current_citizen = self.current_society.get_head()
+        if is_snapshot(filename):
+            self.current_society = society_from_snapshot(filename)
+        else:
+            with open(filename) as f:
+                self.current_society = load_society(f)
+        self.current_citizen = self.current_society.get_head()
 
     def get_all_district_names(self) -> list[str]:
         """Return a list containing all the district names in
@@ -290,7 +324,7 @@ class SocietySimulator:
             return []
         district_names = []
         if society_head.get_district_name():
-            district_names.append(district_names)
+            district_names.append(society_head.get_district_name())
         for subordinate in society_head.get_all_subordinates():
             if isinstance(subordinate, DistrictLeader):
                 district_names.append(subordinate.get_district_name())
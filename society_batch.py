@@ -0,0 +1,179 @@
+"""Assignment 2: Batch Command Processor
+
+=== Module description ===
+This module runs SocietySimulator commands from a stream of JSON lines,
+without a user interface, so that scripted workloads can run without a
+display.
+
+Each line of input is a JSON object such as
+    {"id": 7, "cmd": "create_citizen", "args": [2, "Lab", 3024, 30, "Cook", 1]}
+where "cmd" is the name of a SocietySimulator method, "args" (optional) is
+the list of its arguments, and "id" (optional) is copied to the output so
+that results can be matched up with their commands. Blank lines are skipped.
+
+For each command, one line is written to the output: {"id": ..., "result":
+...} or, if the command failed, {"id": ..., "error": "..."}. Citizens in a
+result are written as their cids.
+
+A query (a command that changes nothing) that is repeated before the next
+change to the Society is answered from the result of its first run.
+
+Run this module with the name of a file of commands, or with no arguments to
+read commands from standard input; see --help for the options.
+"""
+from __future__ import annotations
+import argparse
+import json
+import sys
+from typing import Any, Iterable, Optional, TextIO
+
+from client_code import SocietySimulator
+from society_hierarchy import Citizen
+
+# Commands that only read from the simulator. Their results depend on the
+# Society and on the current Citizen.
+QUERIES = frozenset({
+    'get_current_citizen_details', 'get_current_superior',
+    'find_citizens_with_job', 'get_society_head', 'get_common_superior',
+    'is_district_leader', 'get_current_citizen_district',
+    'find_district_citizens', 'get_all_district_names',
+    'get_current_district_rating_summary',
+    'find_top_rated_district_citizens'})
+
+# Commands that only change what the simulator is displaying, not the
+# Society.
+VIEWS = frozenset({'display_citizen', 'display_direct_subordinates',
+                   'display_all_subordinates'})
+
+# Commands that change the Society.
+UPDATES = frozenset({
+    'create_citizen', 'rename_current_district', 'become_district_leader',
+    'become_citizen', 'delete_citizen', 'promote_citizen',
+    'file_to_society'})
+
+# The number of output lines to write between flushes of the output.
+FLUSH_EVERY = 1000
+
+
+def run_batch(commands: Iterable[str], out: TextIO,
+              simulator: Optional[SocietySimulator] = None,
+              stop_on_error: bool = False) -> int:
+    """Run each JSON-lines command in <commands> on <simulator> (or on a new
+    SocietySimulator if it is None), writing one JSON line per command to
+    <out>. Return the number of commands that failed.
+
+    If <stop_on_error> is True, stop after the first command that fails.
+
+    >>> from io import StringIO
+    >>> out = StringIO()
+    >>> run_batch(['{"cmd": "file_to_society", "args": ["citizens.csv"]}',
+    ...            '{"id": 1, "cmd": "display_citizen", "args": [10]}',
+    ...            '{"id": 2, "cmd": "get_current_citizen_district"}',
+    ...            '{"id": 3, "cmd": "get_common_superior", "args": [11]}',
+    ...            '{"id": 4, "cmd": "fly"}'],
+    ...           out)
+    1
+    >>> print(out.getvalue(), end='')
+    {"id":null,"result":null}
+    {"id":1,"result":null}
+    {"id":2,"result":"District A"}
+    {"id":3,"result":10}
+    {"id":4,"error":"ValueError: unknown command 'fly'"}
+    """
+    if simulator is None:
+        simulator = SocietySimulator()
+    results: dict[tuple[Any, ...], Any] = {}  # query results since a change
+    failures = 0
+    pending = 0
+    for line in commands:
+        if not line.strip():
+            continue
+        command_id = None
+        try:
+            command = json.loads(line)
+            command_id = command.get('id')
+            name = command['cmd']
+            args = command.get('args', [])
+            if name in QUERIES:
+                current = simulator.current_citizen
+                key = (name, json.dumps(args),
+                       None if current is None else current.cid)
+                if key not in results:
+                    results[key] = _to_json(getattr(simulator, name)(*args))
+                result = results[key]
+            elif name in VIEWS:
+                result = _to_json(getattr(simulator, name)(*args))
+            elif name in UPDATES:
+                results.clear()
+                result = _to_json(getattr(simulator, name)(*args))
+            else:
+                raise ValueError(f'unknown command {name!r}')
+            response = {'id': command_id, 'result': result}
+        except Exception as error:
+            response = {'id': command_id,
+                        'error': f'{type(error).__name__}: {error}'}
+            failures += 1
+        out.write(json.dumps(response, separators=(',', ':')) + '\n')
+        pending += 1
+        if pending >= FLUSH_EVERY:
+            out.flush()
+            pending = 0
+        if failures and stop_on_error:
+            break
+    out.flush()
+    return failures
+
+
+def _to_json(value: Any) -> Any:
+    """Return <value> with every Citizen in it replaced by its cid, and every
+    tuple by a list.
+    """
+    if isinstance(value, Citizen):
+        return value.cid
+    if isinstance(value, (list, tuple)):
+        return [_to_json(item) for item in value]
+    return value
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    """Run the batch command processor with the command-line arguments
+    <argv>, and return the exit status.
+    """
+    parser = argparse.ArgumentParser(
+        description='Run SocietySimulator commands from JSON lines.')
+    parser.add_argument('commands', nargs='?',
+                        help='file of commands (default: standard input)')
+    parser.add_argument('-o', '--output',
+                        help='file for the results (default: standard output)')
+    parser.add_argument('--society',
+                        help='citizens file or snapshot to load first')
+    parser.add_argument('--journal',
+                        help='journal directory to load from and record in')
+    parser.add_argument('--stop-on-error', action='store_true',
+                        help='stop after the first command that fails')
+    options = parser.parse_args(argv)
+
+    if options.journal:
+        from society_journal import JournaledSimulator
+        simulator = JournaledSimulator(options.journal)
+    else:
+        simulator = SocietySimulator()
+    if options.society:
+        simulator.file_to_society(options.society)
+
+    commands = open(options.commands) if options.commands else sys.stdin
+    out = open(options.output, 'w') if options.output else sys.stdout
+    try:
+        failures = run_batch(commands, out, simulator, options.stop_on_error)
+    finally:
+        if options.commands:
+            commands.close()
+        if options.output:
+            out.close()
+        if options.journal:
+            simulator.close()
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,612 @@
+"""Assignment 2: Benchmarks
+
+=== Module description ===
+This module contains benchmarks for the classes in society_hierarchy.py.
+
+Each benchmark builds its own synthetic Society, measures one thing, and
+returns the measurements as a dict so that they can be compared between
+versions of the code. Run this module to print the results of all of them.
+"""
+from __future__ import annotations
+import asyncio
+import copy
+import csv
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from typing import Any, Callable, Optional
+
+from society_hierarchy import Citizen, DistrictLeader, RatingSummary, \
+    Society
+from society_index import index_of
+from society_loader import add_citizens, load_society
+from society_snapshot import load_snapshot, save_snapshot, \
+    society_from_snapshot
+from society_batch import run_batch
+from society_concurrent import ConcurrentSociety, RWLock
+from society_loadgen import run_load
+from society_server import SocietyServer
+from society_journal import JournaledSimulator
+from society_persistent import PersistentSociety
+from society_history import UndoableSimulator
+from society_parallel import create_society_from_file_parallel, \
+    _parse_range, _split_lines
+
+
+# The slots of a Citizen that only cache what could be recomputed from the
+# rest of the hierarchy: its district, its subordinates in rating order and
+# the rating summary of its subtree.
+_CACHE_SLOTS = ('_district', '_rated_subordinates', '_count', '_total',
+                '_lowest', '_best')
+
+
+class _DictCitizen:
+    """A copy of a Citizen's attributes, stored the way every Citizen stored
+    them before Citizen declared __slots__: in a per-instance __dict__. Used
+    as the baseline in benchmark_memory.
+    """
+
+    def __init__(self, citizen: Citizen) -> None:
+        """Initialize this _DictCitizen with the attributes of <citizen>.
+        """
+        for name in Citizen.__slots__:
+            if hasattr(citizen, name):
+                setattr(self, name, getattr(citizen, name))
+
+
+def benchmark_memory(n: int = 100_000) -> dict[str, float]:
+    """Return the number of bytes allocated per citizen for a Society of <n>
+    citizens: as built, as it would be if every Citizen kept its attributes
+    in a __dict__, once its index has answered one query of each kind, and
+    the part of the built Society that is taken by the cache slots.
+
+    Each citizen's superior is chosen at random from the 50 citizens created
+    just before it. Strings are shared between all citizens, so only the
+    objects, their lists and the Society's indexes are counted. The Society
+    is built in one batch, so both layouts hold exactly the same structure.
+    """
+    rng = random.Random(148)
+    records = [(cid, rng.randint(0, 100), rng.randint(max(1, cid - 50),
+                                                      cid - 1))
+               for cid in range(2, n + 1)]
+    results = {}
+
+    tracemalloc.start()
+    s = Society(Citizen(1, 'Manufacturer', 3000, 'Job', 50))
+    add_citizens(s, ((Citizen(cid, 'Manufacturer', 3000, 'Job', rating),
+                      superior_id) for cid, rating, superior_id in records))
+    built = tracemalloc.get_traced_memory()[0]
+    index = index_of(s)
+    index.get_closest_common_superior(2, n)
+    index.get_top_rated(1, 10)
+    indexed = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    # Swap the size of each slotted Citizen for that of the same attributes
+    # in a __dict__; everything they refer to is shared by both layouts.
+    citizens = [s.get_citizen(cid) for cid in range(1, n + 1)]
+    tracemalloc.start()
+    copies = [_DictCitizen(citizen) for citizen in citizens]
+    as_dicts = tracemalloc.get_traced_memory()[0] - sys.getsizeof(copies)
+    tracemalloc.stop()
+    del copies
+    slotted = sum(map(sys.getsizeof, citizens))
+    results['bytes_per_citizen_before'] = (built - slotted + as_dicts) / n
+    results['bytes_per_citizen_after'] = built / n
+    results['bytes_per_citizen_indexed'] = indexed / n
+
+    caches = 8 * len(_CACHE_SLOTS) * n
+    for citizen in citizens:
+        if citizen._rated_subordinates is not None:
+            caches += sys.getsizeof(citizen._rated_subordinates)
+        caches += sum(sys.getsizeof(value) for value
+                      in (citizen._count, citizen._total) if value > 256)
+    results['bytes_per_citizen_in_caches'] = caches / n
+    return results
+
+
+def _timed(f: Callable[[], Any]) -> float:
+    """Return the number of seconds it takes to call <f>.
+    """
+    start = time.perf_counter()
+    f()
+    return time.perf_counter() - start
+
+
+def _build_chain(depth: int) -> Society:
+    """Return a Society that is a single chain of command <depth> Citizens
+    long, led by a DistrictLeader with cid 1 and ending with cid <depth>.
+
+    The chain is added in one batch: adding the Citizens one at a time would
+    update the rating summaries of the whole chain above each of them.
+    """
+    s = Society(DistrictLeader(1, 'Manufacturer', 3000, 'Commander', 50,
+                               'District 1'))
+    add_citizens(s, ((Citizen(cid, 'Manufacturer', 3000, 'Job', 50), cid - 1)
+                     for cid in range(2, depth + 1)))
+    return s
+
+
+def benchmark_deep_chain(depth: int = 1_000_000) -> dict[str, float]:
+    """Return the number of seconds each traversal takes on a chain of
+    command <depth> Citizens long (far deeper than the recursion limit).
+    """
+    results = {'build': 0.0}
+    start = time.perf_counter()
+    s = _build_chain(depth)
+    results['build'] = time.perf_counter() - start
+    head, bottom = s.get_head(), s.get_citizen(depth)
+    middle = s.get_citizen(depth // 2)
+    results['get_society_head'] = _timed(bottom.get_society_head)
+    results['get_citizen'] = _timed(lambda: head.get_citizen(depth))
+    results['get_all_subordinates'] = _timed(head.get_all_subordinates)
+    results['get_district_name'] = _timed(bottom.get_district_name)
+    results['rename_district'] = _timed(
+        lambda: bottom.rename_district('Renamed'))
+    results['get_closest_common_superior'] = _timed(
+        lambda: middle.get_closest_common_superior(depth))
+    return results
+
+
+def _build_district(managers: int, workers: int) -> Society:
+    """Return a Society whose head is a DistrictLeader with <managers>
+    direct subordinates, each of whom has <workers> subordinates of their
+    own. The head has rating 0, managers 10 and workers 20.
+    """
+    s = Society(DistrictLeader(1, 'Manufacturer', 3000, 'Commander', 0,
+                               'District 1'))
+    cid = 2
+    for _ in range(managers):
+        manager = cid
+        s.add_citizen(Citizen(manager, 'Manufacturer', 3000, 'Manager', 10),
+                      1)
+        cid += 1
+        for _ in range(workers):
+            s.add_citizen(Citizen(cid, 'Manufacturer', 3000, 'Worker', 20),
+                          manager)
+            cid += 1
+    return s
+
+
+def benchmark_promotion(managers: int = 1_000, workers: int = 100,
+                        promotions: int = 100) -> dict[str, float]:
+    """Return the average number of milliseconds a promotion takes in a
+    district of about <managers> * <workers> citizens. Each promotion swaps
+    a worker up past their manager and the DistrictLeader.
+    """
+    s = _build_district(managers, workers)
+    worker_cids = [2 + m * (workers + 1) + 1
+                   for m in range(0, managers, max(1, managers // promotions))]
+    worker_cids = worker_cids[:promotions]
+    start = time.perf_counter()
+    for rating, cid in enumerate(worker_cids, 30):
+        s.get_citizen(cid).rating = rating
+        s.promote_citizen(cid)
+    elapsed = time.perf_counter() - start
+    return {'district_size': float(len(s.get_all_citizens())),
+            'ms_per_promotion': 1000 * elapsed / len(worker_cids)}
+
+
+def _write_citizens_csv(path: str, rows: int) -> None:
+    """Write a file of <rows> citizens in the format of citizens.csv to
+    <path>. Every 1000th citizen is a DistrictLeader, and every citizen's
+    superior has a smaller cid but may appear later in the file.
+    """
+    rng = random.Random(148)
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow([1, 'Hookins National Lab', 3024, 'Commander', 20,
+                         '', 'District 1'])
+        for cid in range(2, rows + 1):
+            row = [cid, 'Starky Industries, Inc.', 3000 + cid % 150,
+                   f'Job {cid % 50}', cid % 101, rng.randrange(1, cid)]
+            if cid % 1000 == 0:
+                row.append(f'District {cid}')
+            writer.writerow(row)
+
+
+def benchmark_csv_load(rows: int = 10_000_000,
+                       chunk_size: int = 100_000) -> dict[str, float]:
+    """Return the throughput, in rows per second, of load_society
+    on a generated file of <rows> citizens, reading it all at once and
+    <chunk_size> lines at a time.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'citizens.csv')
+        _write_citizens_csv(path, rows)
+        results = {}
+        for label, size in [('rows_per_second', None),
+                            ('rows_per_second_chunked', chunk_size)]:
+            with open(path, newline='') as f:
+                start = time.perf_counter()
+                s = load_society(f, chunk_size=size)
+                results[label] = rows / (time.perf_counter() - start)
+            del s
+    return results
+
+
+def benchmark_snapshot(rows: int = 1_000_000) -> dict[str, float]:
+    """Return the number of seconds it takes to load a generated society of
+    <rows> citizens from CSV, to save it as a snapshot, to open that snapshot
+    and answer a query from it, and to turn it back into a Society.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'citizens.csv')
+        snapshot_path = os.path.join(directory, 'citizens.snap')
+        _write_citizens_csv(path, rows)
+        results = {}
+        with open(path, newline='') as f:
+            start = time.perf_counter()
+            s = load_society(f)
+            results['load_csv'] = time.perf_counter() - start
+        results['save_snapshot'] = _timed(
+            lambda: save_snapshot(s, snapshot_path))
+        del s
+        start = time.perf_counter()
+        snapshot = load_snapshot(snapshot_path)
+        snapshot.get_district_name(rows)
+        results['open_snapshot_and_query'] = time.perf_counter() - start
+        del snapshot
+        results['society_from_snapshot'] = _timed(
+            lambda: society_from_snapshot(snapshot_path))
+    return results
+
+
+def benchmark_journal(operations: int = 100_000,
+                      sync_every: int = 100) -> dict[str, float]:
+    """Return the throughput, in operations per second, of recording
+    <operations> create_citizen calls in a journal that calls fsync every
+    <sync_every> operations, and of replaying that journal.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        sim = JournaledSimulator(directory, sync_every=sync_every)
+        start = time.perf_counter()
+        sim.create_citizen(1, 'Manufacturer', 3000, 50, 'Job', 0)
+        for cid in range(2, operations + 1):
+            sim.create_citizen(cid, 'Manufacturer', 3000, cid % 101, 'Job',
+                               cid // 2)
+        sim.close()
+        results = {'append_per_second':
+                   operations / (time.perf_counter() - start)}
+        start = time.perf_counter()
+        JournaledSimulator(directory).close()
+        results['replay_per_second'] = \
+            operations / (time.perf_counter() - start)
+    return results
+
+
+def benchmark_batch(citizens: int = 100_000,
+                    queries: int = 400_000) -> dict[str, float]:
+    """Return the throughput, in commands per minute, of run_batch on a
+    script that creates <citizens> citizens and then runs <queries> mixed
+    views and queries on them.
+    """
+    rng = random.Random(148)
+    commands = [json.dumps({'cmd': 'create_citizen',
+                            'args': [1, 'Manufacturer', 3000, 50, 'Job', 0]})]
+    for cid in range(2, citizens + 1):
+        commands.append(json.dumps(
+            {'cmd': 'create_citizen', 'args': [cid, 'Manufacturer', 3000,
+                                               cid % 101, 'Job', cid // 2]}))
+    for i in range(queries // 2):
+        commands.append(json.dumps(
+            {'id': i, 'cmd': 'display_citizen',
+             'args': [rng.randrange(1, citizens + 1)]}))
+        commands.append(json.dumps(
+            {'id': i, 'cmd': rng.choice(['get_current_citizen_details',
+                                         'get_current_superior',
+                                         'get_current_citizen_district'])}))
+    start = time.perf_counter()
+    run_batch(commands, io.StringIO())
+    elapsed = time.perf_counter() - start
+    return {'commands_per_minute': 60 * len(commands) / elapsed}
+
+
+def benchmark_server(managers: int = 1_000, workers: int = 100,
+                     requests: int = 20_000) -> dict[str, float]:
+    """Return the throughput and p50/p99 latency of a SocietyServer for a
+    district of about <managers> * <workers> citizens, answering <requests>
+    requests from the load generator running in the same process.
+    """
+    s = _build_district(managers, workers)
+    cids = [c.cid for c in s.get_all_citizens()]
+
+    async def run() -> dict[str, float]:
+        server = await SocietyServer(s).start()
+        port = server.sockets[0].getsockname()[1]
+        try:
+            return await run_load(requests, 8, 16, cids,
+                                  ['Manager', 'Worker'], port=port)
+        finally:
+            server.close()
+            await server.wait_closed()
+
+    return asyncio.run(run())
+
+
+class _ExclusiveLock(RWLock):
+    """An RWLock that lets only one thread hold it, even for reading: the
+    single global mutex used as the baseline in benchmark_concurrent.
+    """
+
+    def acquire_read(self) -> None:
+        """Acquire this lock, exclusively.
+        """
+        self.acquire_write()
+
+    def release_read(self) -> None:
+        """Release this lock.
+        """
+        self.release_write()
+
+
+def benchmark_concurrent(readers: int = 8, writes: int = 200,
+                         managers: int = 100, workers: int = 100,
+                         interval: float = 0.01) -> dict[str, float]:
+    """Return the number of reads per second that <readers> threads complete
+    on a shared district of about <managers> * <workers> citizens while
+    another thread makes <writes> promotions and deletions, one due every
+    <interval> seconds, and the average number of milliseconds each of those
+    writes takes (including the wait for the lock), with a reader-writer
+    lock and with a single exclusive lock.
+
+    The writes are due at the same times with both locks, so that both pay
+    for the same number of index rebuilds per second.
+    """
+    results = {}
+    for label, lock in [('rwlock', RWLock()), ('mutex', _ExclusiveLock())]:
+        s = ConcurrentSociety.from_society(_build_district(managers, workers),
+                                           lock)
+        cids = [c.cid for c in s.get_all_citizens()]
+        done = threading.Event()
+        counts = [0] * readers
+
+        def read(index: int) -> None:
+            rng = random.Random(index)
+            while not done.is_set():
+                cid = rng.choice(cids)
+                s.get_subtree(cid)
+                s.get_citizens_with_job('Manager')
+                s.get_top_rated_in_district(cid, 10)
+                counts[index] += 3
+
+        threads = [threading.Thread(target=read, args=(i,))
+                   for i in range(readers)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        rng = random.Random(148)
+        written = 0
+        writing = 0.0
+        for i in range(writes):
+            time.sleep(max(0.0, start + i * interval - time.perf_counter()))
+            cid = rng.choice(cids[1:])
+            if s.get_citizen(cid) is None:
+                continue
+            written += 1
+            write_start = time.perf_counter()
+            if i % 10 == 0:
+                s.delete_citizen(cid)
+            else:
+                with s.lock.write_locked():
+                    s.set_rating(cid, 100)
+                    s.promote_citizen(cid)
+            writing += time.perf_counter() - write_start
+        done.set()
+        for thread in threads:
+            thread.join()
+        results[f'reads_per_second_{label}'] = \
+            sum(counts) / (time.perf_counter() - start)
+        results[f'ms_per_write_{label}'] = 1000 * writing / max(1, written)
+    return results
+
+
+def benchmark_what_if(managers: int = 1_000, workers: int = 100,
+                      scenarios: int = 20) -> dict[str, float]:
+    """Return the average number of milliseconds and bytes that one "what if
+    this worker were promoted" scenario costs in a district of about
+    <managers> * <workers> citizens, when each scenario deep-copies the
+    Society and when it forks a PersistentSociety.
+    """
+    s = _build_district(managers, workers)
+    worker_cids = [2 + m * (workers + 1) + 1
+                   for m in range(0, managers, max(1, managers // scenarios))]
+    for cid in worker_cids:
+        s.get_citizen(cid).rating = 30
+    results = {}
+
+    def deep_copy(cid: int) -> Any:
+        scenario = copy.deepcopy(s)
+        scenario.promote_citizen(cid)
+        return scenario
+
+    base = PersistentSociety.from_society(s)
+    for label, run in [('deepcopy', deep_copy),
+                       ('persistent', base.promote_citizen)]:
+        tracemalloc.start()
+        start = time.perf_counter()
+        kept = [run(cid) for cid in worker_cids]
+        elapsed = time.perf_counter() - start
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results[f'ms_per_scenario_{label}'] = 1000 * elapsed / len(kept)
+        results[f'bytes_per_scenario_{label}'] = current / len(kept)
+    return results
+
+
+def benchmark_undo(rows: int = 1_000_000,
+                   operations: int = 1_000) -> dict[str, float]:
+    """Return the average number of microseconds that undoing and redoing one
+    deletion or promotion takes in a generated Society of <rows> citizens,
+    and the number of seconds that reloading that Society from its file
+    (the only way to take a change back without undo) takes.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'citizens.csv')
+        _write_citizens_csv(path, rows)
+        sim = UndoableSimulator(history_depth=operations)
+        start = time.perf_counter()
+        sim.file_to_society(path)
+        reload_seconds = time.perf_counter() - start
+
+    rng = random.Random(148)
+    for i in range(operations):
+        citizen = None
+        while citizen is None:
+            citizen = sim.current_society.get_citizen(rng.randrange(2, rows))
+        if i % 2 and not isinstance(citizen, DistrictLeader):
+            sim.promote_citizen(citizen.cid)
+        else:
+            sim.delete_citizen(citizen.cid)
+    undo_seconds = _timed(lambda: [sim.undo() for _ in range(operations)])
+    redo_seconds = _timed(lambda: [sim.redo() for _ in range(operations)])
+    return {'us_per_undo': 1e6 * undo_seconds / operations,
+            'us_per_redo': 1e6 * redo_seconds / operations,
+            'reload_seconds': reload_seconds}
+
+
+def benchmark_rating_summary(managers: int = 1_000, workers: int = 100,
+                             refreshes: int = 100) -> dict[str, float]:
+    """Return the average number of milliseconds it takes to refresh the
+    rating summary of a district of about <managers> * <workers> citizens
+    after one worker's rating changes, by scanning get_district_citizens()
+    and by reading the summary the DistrictLeader keeps.
+    """
+    s = _build_district(managers, workers)
+    leader = s.get_head()
+    worker_cids = [2 + m * (workers + 1) + 1
+                   for m in range(0, managers, max(1, managers // refreshes))]
+
+    def scan() -> tuple[int, int, int, int]:
+        ratings = [citizen.rating for citizen in leader.get_district_citizens()]
+        return len(ratings), sum(ratings), min(ratings), max(ratings)
+
+    def look_up() -> Optional[RatingSummary]:
+        return leader.get_district_rating_summary()
+
+    results = {}
+    for label, refresh in [('scan', scan), ('summary', look_up)]:
+        start = time.perf_counter()
+        for rating, cid in enumerate(worker_cids):
+            s.get_citizen(cid).rating = rating % 101
+            refresh()
+        elapsed = time.perf_counter() - start
+        results[f'ms_per_refresh_{label}'] = 1000 * elapsed / len(worker_cids)
+    return results
+
+
+def benchmark_top_rated(managers: int = 1_000, workers: int = 100,
+                        queries: int = 100, k: int = 10) -> dict[str, float]:
+    """Return the average number of milliseconds it takes, in a district of
+    about <managers> * <workers> citizens, to find the <k> highest rated
+    citizens of the district after one worker's rating changes (by sorting
+    get_district_citizens() and with get_top_rated), to find them with
+    get_top_rated after one worker moves to another manager, and to find the
+    highest rated of the DistrictLeader's <managers> direct subordinates
+    after one of their ratings changes.
+    """
+    s = _build_district(managers, workers)
+    leader = s.get_head()
+    rng = random.Random(148)
+    worker_cids = [2 + m * (workers + 1) + 1
+                   for m in range(0, managers, max(1, managers // queries))]
+    manager_cids = [2 + m * (workers + 1) for m in range(managers)]
+
+    def sort_district() -> list[Citizen]:
+        return sorted(leader.get_district_citizens(),
+                      key=lambda c: (-c.rating, c.cid))[:k]
+
+    results = {}
+    for label, query in [('sort', sort_district),
+                         ('top_rated', lambda: index_of(s).get_top_rated(
+                             leader.cid, k))]:
+        start = time.perf_counter()
+        for cid in worker_cids:
+            s.get_citizen(cid).rating = rng.randint(0, 100)
+            query()
+        elapsed = time.perf_counter() - start
+        results[f'ms_per_top_{k}_{label}'] = 1000 * elapsed / len(worker_cids)
+
+    start = time.perf_counter()
+    for cid in worker_cids:
+        manager = s.get_citizen(rng.choice(manager_cids))
+        s.get_citizen(cid).become_subordinate_to(manager)
+        index_of(s).get_top_rated(leader.cid, k)
+    results[f'ms_per_top_{k}_after_move'] = \
+        1000 * (time.perf_counter() - start) / len(worker_cids)
+
+    start = time.perf_counter()
+    for _ in range(queries):
+        s.get_citizen(rng.choice(manager_cids)).rating = rng.randint(0, 100)
+        leader.get_highest_rated_subordinate()
+    results['ms_per_highest_rated_subordinate'] = \
+        1000 * (time.perf_counter() - start) / queries
+    return results
+
+
+def benchmark_parallel_load(rows: int = 10_000_000,
+                            workers: tuple[int, ...] = (1, 2, 4, 8)) \
+        -> dict[str, float]:
+    """Return the throughput, in rows per second, of
+    create_society_from_file_parallel on a generated file of <rows> citizens
+    with each number of <workers>, along with the throughput of load_society
+    and of the parsing step alone (which is the only part that runs in
+    parallel).
+
+    With one worker the file is loaded by load_society, so the two match.
+    More workers only help when there are CPUs to run them on, since
+    creating and linking the Citizens is serial in the parent process.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'citizens.csv')
+        _write_citizens_csv(path, rows)
+        results = {}
+        with open(path, newline='') as f:
+            results['rows_per_second_serial'] = rows / _timed(
+                lambda: load_society(f))
+        for count in workers:
+            start = time.perf_counter()
+            s = create_society_from_file_parallel(path, workers=count)
+            results[f'rows_per_second_{count}'] = \
+                rows / (time.perf_counter() - start)
+            del s
+        ranges = _split_lines(path, 1)
+        results['parse_rows_per_second_1'] = rows / _timed(
+            lambda: [_parse_range(path, start, end) for start, end in ranges])
+    return results
+
+
+def _report(name: str, results: dict[str, Any]) -> None:
+    """Print the <results> of the benchmark called <name>.
+    """
+    print(name)
+    for key, value in results.items():
+        if isinstance(value, float):
+            print(f'  {key}: {value:,.3f}')
+        else:
+            print(f'  {key}: {value}')
+
+
+if __name__ == '__main__':
+    start = time.perf_counter()
+    _report('memory', benchmark_memory())
+    _report('deep chain', benchmark_deep_chain())
+    _report('promotion', benchmark_promotion())
+    _report('csv load', benchmark_csv_load())
+    _report('parallel load', benchmark_parallel_load())
+    _report('snapshot', benchmark_snapshot())
+    _report('journal', benchmark_journal())
+    _report('batch', benchmark_batch())
+    _report('server', benchmark_server())
+    _report('concurrent', benchmark_concurrent())
+    _report('what if', benchmark_what_if())
+    _report('undo', benchmark_undo())
+    _report('rating summary', benchmark_rating_summary())
+    _report('top rated', benchmark_top_rated())
+    print(f'total time: {time.perf_counter() - start:.1f}s')
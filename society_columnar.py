@@ -0,0 +1,480 @@
+"""Assignment 2: Columnar Society
+
+=== Module description ===
+This module contains ColumnarSociety, an alternative representation of a
+Society for analytics over very large, read-only hierarchies.
+
+Instead of one object per citizen, a ColumnarSociety stores each attribute in
+its own typed column (an array.array, or any other sequence of ints such as a
+memoryview), with manufacturers, jobs and district names dictionary-encoded
+as integer codes into string tables. Citizen and DistrictLeader objects are
+only created when a query returns them; those objects are detached copies
+that have no superior or subordinates.
+"""
+from __future__ import annotations
+import csv
+import gc
+from array import array
+from bisect import bisect_left
+from typing import Iterable, Optional, Sequence, TextIO, Any
+
+from society_hierarchy import Citizen, DistrictLeader, Society, \
+    iter_preorder
+from society_loader import add_citizens
+
+# A citizen as a record: (cid, manufacturer, model_year, job, rating,
+# superior_id, district_name). superior_id is None for the head, and
+# district_name is None for citizens who are not DistrictLeaders.
+Record = tuple[int, str, int, str, int, Optional[int], Optional[str]]
+
+# The names of the integer columns and of the string tables of a
+# ColumnarSociety.
+INT_COLUMNS = ('cid', 'model_year', 'rating', 'parent', 'subtree_end',
+               'manufacturer', 'job', 'district', 'child_offsets',
+               'children', 'sorted_cid', 'by_cid', 'job_offsets', 'job_rows',
+               'subtree_offsets', 'subtree_rows')
+STRING_TABLES = ('manufacturers', 'jobs', 'district_names')
+
+
+class ColumnarSociety:
+    """A read-only society whose citizens are stored in typed columns.
+
+    Rows are numbered in preorder: each citizen comes before its
+    subordinates, and siblings are in ascending order by cid. So the subtree
+    of the citizen in row i is exactly rows i up to (but not including)
+    subtree_end[i].
+
+    === Private Attributes ===
+    _cid, _model_year, _rating:
+        The cid, model year and rating of the citizen in each row.
+    _parent:
+        The row of each citizen's superior, or -1 for the head.
+    _subtree_end:
+        One past the last row of each citizen's subtree.
+    _manufacturer, _job:
+        The code of each citizen's manufacturer and job, as an index into
+        _manufacturers and _jobs respectively.
+    _district:
+        For DistrictLeaders, the index of their district's name in
+        _district_names; -1 for every other citizen.
+    _child_offsets, _children:
+        The direct subordinates of each citizen in CSR form: the rows of the
+        subordinates of row i are _children[_child_offsets[i]:
+        _child_offsets[i + 1]], in ascending order by cid.
+    _sorted_cid, _by_cid:
+        Every cid in ascending order, and the row of each of those cids.
+    _job_offsets, _job_rows:
+        The citizens with each job in CSR form: the rows of the citizens whose
+        job has code j are _job_rows[_job_offsets[j]:_job_offsets[j + 1]], in
+        ascending order by cid.
+    _subtree_offsets, _subtree_rows:
+        The subtree of each citizen in CSR form: the rows of the citizen in
+        row i and all of its subordinates are _subtree_rows[
+        _subtree_offsets[i]:_subtree_offsets[i + 1]], in ascending order by
+        cid. Each citizen appears once for itself and once for each of its
+        superiors.
+    _manufacturers, _jobs, _district_names:
+        The string tables that the codes above refer to.
+    _job_codes:
+        Maps each job in _jobs to its code.
+
+    === Representation Invariants ===
+    - All integer columns except _child_offsets, _children, _sorted_cid,
+      _by_cid, _job_offsets, _job_rows, _subtree_offsets and _subtree_rows
+      have one entry per row; _child_offsets and _subtree_offsets have one
+      more, and _job_offsets has one more than there are jobs.
+    - If there is at least one row, row 0 is the head of the society.
+    """
+    _cid: Sequence[int]
+    _model_year: Sequence[int]
+    _rating: Sequence[int]
+    _parent: Sequence[int]
+    _subtree_end: Sequence[int]
+    _manufacturer: Sequence[int]
+    _job: Sequence[int]
+    _district: Sequence[int]
+    _child_offsets: Sequence[int]
+    _children: Sequence[int]
+    _sorted_cid: Sequence[int]
+    _by_cid: Sequence[int]
+    _job_offsets: Sequence[int]
+    _job_rows: Sequence[int]
+    _subtree_offsets: Sequence[int]
+    _subtree_rows: Sequence[int]
+    _manufacturers: Sequence[str]
+    _jobs: Sequence[str]
+    _district_names: Sequence[str]
+    _job_codes: dict[str, int]
+
+    def __init__(self, columns: dict[str, Sequence[int]],
+                 strings: dict[str, Sequence[str]]) -> None:
+        """Initialize this ColumnarSociety from its integer <columns> and its
+        string tables <strings>, keyed by the names in INT_COLUMNS and
+        STRING_TABLES.
+
+        Use columnar_from_records, columnar_from_society or
+        columnar_from_file rather than building the columns by hand.
+        """
+        for name in INT_COLUMNS:
+            setattr(self, '_' + name, columns[name])
+        for name in STRING_TABLES:
+            setattr(self, '_' + name, strings[name])
+        self._job_codes = {job: code for code, job in enumerate(self._jobs)}
+
+    def __len__(self) -> int:
+        """Return the number of citizens in this society.
+        """
+        return len(self._cid)
+
+    def get_columns(self) -> dict[str, Sequence[int]]:
+        """Return the integer columns of this society, keyed by the names in
+        INT_COLUMNS.
+        """
+        return {name: getattr(self, '_' + name) for name in INT_COLUMNS}
+
+    def get_strings(self) -> dict[str, Sequence[str]]:
+        """Return the string tables of this society, keyed by the names in
+        STRING_TABLES.
+        """
+        return {name: getattr(self, '_' + name) for name in STRING_TABLES}
+
+    def _row(self, cid: int) -> int:
+        """Return the row of the citizen with ID <cid>, or -1 if there is no
+        such citizen.
+        """
+        i = bisect_left(self._sorted_cid, cid)
+        if i < len(self._sorted_cid) and self._sorted_cid[i] == cid:
+            return self._by_cid[i]
+        return -1
+
+    def _make_citizen(self, row: int) -> Citizen:
+        """Return a new, detached Citizen (or DistrictLeader) with the data of
+        the citizen in <row>.
+        """
+        district = self._district[row]
+        args = (self._cid[row], self._manufacturers[self._manufacturer[row]],
+                self._model_year[row], self._jobs[self._job[row]],
+                self._rating[row])
+        if district >= 0:
+            return DistrictLeader(*args, self._district_names[district])
+        return Citizen(*args)
+
+    def _subtree(self, row: int) -> Sequence[int]:
+        """Return the rows of the citizen in <row> and all of its
+        subordinates, in ascending order of cid.
+        """
+        offsets = self._subtree_offsets
+        return self._subtree_rows[offsets[row]:offsets[row + 1]]
+
+    def get_head(self) -> Optional[Citizen]:
+        """Return the head of this society, or None if it is empty.
+        """
+        if not self._cid:
+            return None
+        return self._make_citizen(0)
+
+    def get_citizen(self, cid: int) -> Optional[Citizen]:
+        """Return the citizen with ID <cid>, or None if there is none.
+        """
+        row = self._row(cid)
+        return None if row < 0 else self._make_citizen(row)
+
+    def get_all_citizens(self) -> list[Citizen]:
+        """Return a list of all citizens, in order of increasing cid.
+        """
+        return [self._make_citizen(row) for row in self._by_cid]
+
+    def get_citizens_with_job(self, job: str) -> list[Citizen]:
+        """Return a list of all citizens with the job <job>, in order of
+        increasing cid.
+        """
+        code = self._job_codes.get(job)
+        if code is None:
+            return []
+        start, end = self._job_offsets[code], self._job_offsets[code + 1]
+        return [self._make_citizen(row) for row in self._job_rows[start:end]]
+
+    def get_superior(self, cid: int) -> Optional[Citizen]:
+        """Return the superior of the citizen with ID <cid>, or None if that
+        citizen is the head (or does not exist).
+        """
+        row = self._row(cid)
+        if row < 0 or self._parent[row] < 0:
+            return None
+        return self._make_citizen(self._parent[row])
+
+    def get_direct_subordinates(self, cid: int) -> list[Citizen]:
+        """Return the direct subordinates of the citizen with ID <cid>, in
+        order of increasing cid.
+        """
+        row = self._row(cid)
+        if row < 0:
+            return []
+        start, end = self._child_offsets[row], self._child_offsets[row + 1]
+        return [self._make_citizen(child)
+                for child in self._children[start:end]]
+
+    def get_all_subordinates(self, cid: int) -> list[Citizen]:
+        """Return all of the (direct and indirect) subordinates of the citizen
+        with ID <cid>, in order of increasing cid.
+        """
+        row = self._row(cid)
+        if row < 0:
+            return []
+        return [self._make_citizen(sub) for sub in self._subtree(row)
+                if sub != row]
+
+    def get_district_name(self, cid: int) -> str:
+        """Return the name of the immediate district that the citizen with ID
+        <cid> belongs to (or leads), or '' if it is not part of any district.
+        """
+        row = self._row(cid)
+        while row >= 0:
+            if self._district[row] >= 0:
+                return self._district_names[self._district[row]]
+            row = self._parent[row]
+        return ''
+
+    def get_district_citizens(self, cid: int) -> list[Citizen]:
+        """Return all citizens in the district led by the citizen with ID
+        <cid> (including that citizen and all subdistricts), in order of
+        increasing cid.
+
+        Return an empty list if that citizen is not a DistrictLeader.
+        """
+        row = self._row(cid)
+        if row < 0 or self._district[row] < 0:
+            return []
+        return [self._make_citizen(sub) for sub in self._subtree(row)]
+
+    def get_closest_common_superior(self, cid1: int,
+                                    cid2: int) -> Optional[Citizen]:
+        """Return the closest common superior of the citizens with IDs <cid1>
+        and <cid2>. If one of them is a superior of the other, that citizen is
+        returned.
+
+        Return None if either citizen does not exist.
+        """
+        row, other = self._row(cid1), self._row(cid2)
+        if row < 0 or other < 0:
+            return None
+        while not row <= other < self._subtree_end[row]:
+            row = self._parent[row]
+        return self._make_citizen(row)
+
+
+def columnar_from_records(records: Iterable[Record]) -> ColumnarSociety:
+    """Return a ColumnarSociety containing the citizens in <records>, which may
+    be in any order.
+
+    Raise ValueError if the records do not form a single hierarchy (there is
+    not exactly one head, a superior is missing, or there is a cycle).
+
+    >>> s = columnar_from_records([(2, 'Lab', 3024, 'Cook', 30, 1, None),
+    ...                            (1, 'Lab', 3001, 'Boss', 10, None, 'D1')])
+    >>> s.get_district_name(2)
+    'D1'
+    >>> [c.cid for c in s.get_all_citizens()]
+    [1, 2]
+    """
+    cids, years, ratings, superiors = [], [], [], []
+    encoded: dict[str, tuple[list[int], dict[str, int]]] = \
+        {name: ([], {}) for name in STRING_TABLES}
+    for cid, manufacturer, model_year, job, rating, superior, district \
+            in records:
+        cids.append(cid)
+        years.append(model_year)
+        ratings.append(rating)
+        superiors.append(superior)
+        for name, value in [('manufacturers', manufacturer), ('jobs', job),
+                            ('district_names', district)]:
+            codes, table = encoded[name]
+            if value is None:
+                codes.append(-1)
+            else:
+                codes.append(table.setdefault(value, len(table)))
+
+    n = len(cids)
+    index_of = {cid: i for i, cid in enumerate(cids)}
+    if len(index_of) != n:
+        raise ValueError('duplicate cid')
+    heads = [i for i in range(n) if superiors[i] is None]
+    if n and len(heads) != 1:
+        raise ValueError('records must contain exactly one head')
+    children: list[list[int]] = [[] for _ in range(n)]
+    parent_index = [-1] * n
+    for i, superior in enumerate(superiors):
+        if superior is not None:
+            if superior not in index_of:
+                raise ValueError(f'superior {superior} of {cids[i]} is missing')
+            parent_index[i] = index_of[superior]
+            children[parent_index[i]].append(i)
+    del index_of, superiors
+
+    # Lay the rows out in preorder, visiting siblings in ascending cid order.
+    order = []
+    to_visit = heads[:]
+    while to_visit:
+        i = to_visit.pop()
+        order.append(i)
+        kids = children[i]
+        kids.sort(key=cids.__getitem__, reverse=True)
+        to_visit.extend(kids)
+    if len(order) != n:
+        raise ValueError('records contain a cycle')
+    del children
+
+    new_row = [0] * n
+    for row, i in enumerate(order):
+        new_row[i] = row
+    parent = array('q', (-1 if parent_index[i] < 0 else new_row[parent_index[i]]
+                         for i in order))
+    return _assemble(
+        {'cid': array('q', (cids[i] for i in order)),
+         'model_year': array('q', (years[i] for i in order)),
+         'rating': array('q', (ratings[i] for i in order)),
+         'parent': parent,
+         'manufacturer': array('q', (encoded['manufacturers'][0][i]
+                                     for i in order)),
+         'job': array('q', (encoded['jobs'][0][i] for i in order)),
+         'district': array('q', (encoded['district_names'][0][i]
+                                 for i in order))},
+        {name: list(encoded[name][1]) for name in STRING_TABLES})
+
+
+def columnar_from_society(society: Society) -> ColumnarSociety:
+    """Return a ColumnarSociety with the same citizens and hierarchy as
+    <society>.
+
+    >>> from society_hierarchy import district_society_example
+    >>> s = columnar_from_society(district_society_example())
+    >>> s.get_district_name(9)
+    'Finance'
+    >>> s.get_closest_common_superior(9, 3).cid
+    6
+    """
+    head = society.get_head()
+    if head is None:
+        return columnar_from_records([])
+    return columnar_from_records(
+        (c.cid, c.manufacturer, c.model_year, c.job, c.rating,
+         None if c.get_superior() is None else c.get_superior().cid,
+         c.get_district_name() if isinstance(c, DistrictLeader) else None)
+        for c in iter_preorder(head))
+
+
+def society_from_columnar(columnar: ColumnarSociety) -> Society:
+    """Return a new Society with the same citizens and hierarchy as
+    <columnar>.
+
+    >>> from society_hierarchy import district_society_example
+    >>> o = district_society_example()
+    >>> str(society_from_columnar(columnar_from_society(o))) == str(o)
+    True
+    """
+    # Nothing created here becomes garbage, so pause the cyclic garbage
+    # collector instead of letting it repeatedly scan the new objects.
+    collecting = gc.isenabled()
+    gc.disable()
+    try:
+        columns = columnar.get_columns()
+        cids, years = list(columns['cid']), list(columns['model_year'])
+        ratings, parents = list(columns['rating']), list(columns['parent'])
+        strings = {name: list(table)
+                   for name, table in columnar.get_strings().items()}
+        districts = strings['district_names']
+        manufacturers = [strings['manufacturers'][code]
+                         for code in columns['manufacturer']]
+        jobs = [strings['jobs'][code] for code in columns['job']]
+        records = []
+        for row, district in enumerate(columns['district']):
+            args = (cids[row], manufacturers[row], years[row], jobs[row],
+                    ratings[row])
+            if district >= 0:
+                citizen = DistrictLeader(*args, districts[district])
+            else:
+                citizen = Citizen(*args)
+            parent = parents[row]
+            records.append((citizen, None if parent < 0 else cids[parent]))
+        society = Society()
+        add_citizens(society, records)
+    finally:
+        if collecting:
+            gc.enable()
+    return society
+
+
+def columnar_from_file(file: TextIO) -> ColumnarSociety:
+    """Return the ColumnarSociety represented by the information in <file>,
+    which is in the same format as citizens.csv.
+
+    >>> s = columnar_from_file(open('citizens.csv'))
+    >>> s.get_head().manufacturer
+    'Hookins National Lab'
+    >>> len(s.get_all_subordinates(1))
+    11
+    """
+    return columnar_from_records(
+        (int(row[0]), row[1], int(row[2]), row[3], int(row[4]),
+         int(row[5]) if row[5] else None,
+         row[6] if len(row) > 6 and row[6] else None)
+        for row in csv.reader(file) if row)
+
+
+def _assemble(columns: dict[str, Any],
+              strings: dict[str, list[str]]) -> ColumnarSociety:
+    """Return a ColumnarSociety built from the preorder-laid-out <columns>
+    'cid', 'model_year', 'rating', 'parent', 'manufacturer', 'job' and
+    'district', computing the remaining columns from them.
+    """
+    parent = columns['parent']
+    n = len(parent)
+    subtree_end = array('q', range(1, n + 1))
+    child_counts = [0] * (n + 1)
+    for row in range(n - 1, 0, -1):
+        subtree_end[parent[row]] = max(subtree_end[parent[row]],
+                                       subtree_end[row])
+        child_counts[parent[row] + 1] += 1
+    child_offsets = array('q', child_counts)
+    for row in range(n):
+        child_offsets[row + 1] += child_offsets[row]
+    children = array('q', bytes(8 * max(0, n - 1)))
+    cursor = array('q', child_offsets)
+    for row in range(1, n):
+        children[cursor[parent[row]]] = row
+        cursor[parent[row]] += 1
+
+    cids = columns['cid']
+    by_cid = array('q', sorted(range(n), key=cids.__getitem__))
+
+    # Group the rows by job, keeping each group in ascending order of cid.
+    jobs = columns['job']
+    job_offsets = array('q', bytes(8 * (len(strings['jobs']) + 1)))
+    for row in range(n):
+        job_offsets[jobs[row] + 1] += 1
+    for code in range(len(strings['jobs'])):
+        job_offsets[code + 1] += job_offsets[code]
+    job_rows = array('q', bytes(8 * n))
+    cursor = array('q', job_offsets)
+    for row in by_cid:
+        job_rows[cursor[jobs[row]]] = row
+        cursor[jobs[row]] += 1
+
+    # Each subtree is a slice of the rows, so sorting the ranks (positions
+    # in by_cid) of that slice puts the subtree in ascending order of cid.
+    rank = array('q', bytes(8 * n))
+    for position, row in enumerate(by_cid):
+        rank[row] = position
+    subtree_offsets = array('q', [0])
+    subtree_rows = array('q')
+    for row in range(n):
+        subtree_rows.extend(map(by_cid.__getitem__,
+                                sorted(rank[row:subtree_end[row]])))
+        subtree_offsets.append(len(subtree_rows))
+
+    columns.update(subtree_end=subtree_end, child_offsets=child_offsets,
+                   children=children, by_cid=by_cid,
+                   sorted_cid=array('q', (cids[row] for row in by_cid)),
+                   job_offsets=job_offsets, job_rows=job_rows,
+                   subtree_offsets=subtree_offsets, subtree_rows=subtree_rows)
+    return ColumnarSociety(columns, strings)
@@ -0,0 +1,417 @@
+"""Assignment 2: Concurrent Access to a Society
+
+=== Module description ===
+This module contains the classes needed to share one Society between many
+threads:
+- RWLock, a reader-writer lock: any number of threads can hold it for
+  reading at once, but a thread holding it for writing holds it alone.
+- ConcurrentSociety, a Society whose methods hold its lock for reading or
+  writing while they run.
+- ConcurrentSimulator, a SocietySimulator whose methods do the same.
+
+Every change to the hierarchy (including all the steps of a promotion)
+happens while the lock is held for writing, so readers never see a change
+half-made. Readers may still build the lazily built indexes of the Society
+at the same time as each other; that is safe because they all build the
+same index from the same (unchanging) hierarchy.
+
+Citizens returned by these classes are the Society's own Citizens: call
+their methods inside "with society.lock.read_locked():" (or write_locked)
+if other threads might be changing the Society, or use the locked
+ConcurrentSociety.get_all_subordinates and get_district_citizens. Change a
+Citizen's rating or job with ConcurrentSociety.set_rating or set_job rather
+than by assigning to the Citizen, since that also updates the Society's
+indexes.
+"""
+from __future__ import annotations
+import threading
+from contextlib import contextmanager
+from functools import wraps
+from typing import Any, Callable, Iterable, Iterator, Optional
+
+from client_code import SocietySimulator
+from society_hierarchy import Citizen, DistrictLeader, Society, \
+    RatingSummary
+from society_index import index_of
+from society_loader import add_citizens
+
+
+class RWLock:
+    """A reader-writer lock that prefers writers: once a writer is waiting,
+    new readers wait until it is done, so a steady stream of readers cannot
+    starve writers.
+
+    The lock is reentrant: a thread that holds it can acquire it again for
+    reading, and a writer can also acquire it again for writing. A reader
+    cannot acquire it for writing without releasing it first.
+
+    === Private Attributes ===
+    _mutex:
+        Guards every other attribute.
+    _condition:
+        A condition on _mutex, notified whenever a writer releases this lock
+        or the last reader releases it while a writer is waiting.
+    _readers:
+        The number of threads holding this lock for reading.
+    _writer:
+        The identifier of the thread holding this lock for writing, or None.
+    _writes:
+        The number of times the writer has acquired this lock for writing
+        without releasing it.
+    _waiting_writers:
+        The number of threads waiting to acquire this lock for writing.
+    _local:
+        Per-thread state: .reads is the number of times the thread has
+        acquired this lock for reading without releasing it, and .counted is
+        whether the thread is one of the _readers.
+
+    === Representation Invariants ===
+    - _readers == 0 or _writer is None
+    - _writes > 0 if and only if _writer is not None
+    """
+    _mutex: threading.Lock
+    _condition: threading.Condition
+    _readers: int
+    _writer: Optional[int]
+    _writes: int
+    _waiting_writers: int
+    _local: threading.local
+
+    def __init__(self) -> None:
+        """Initialize this RWLock, unlocked.
+        """
+        self._mutex = threading.Lock()
+        self._condition = threading.Condition(self._mutex)
+        self._readers = 0
+        self._writer = None
+        self._writes = 0
+        self._waiting_writers = 0
+        self._local = threading.local()
+
+    def acquire_read(self) -> None:
+        """Acquire this lock for reading, waiting until no other thread holds
+        it (or is waiting to hold it) for writing.
+        """
+        local = self._local
+        reads = getattr(local, 'reads', 0)
+        if reads == 0:
+            with self._mutex:
+                if self._writer is None and not self._waiting_writers:
+                    self._readers += 1
+                    local.counted = True
+                else:
+                    local.counted = self._writer != threading.get_ident()
+                    if local.counted:
+                        while self._writer is not None \
+                                or self._waiting_writers:
+                            self._condition.wait()
+                        self._readers += 1
+        local.reads = reads + 1
+
+    def release_read(self) -> None:
+        """Release this lock after acquiring it for reading.
+        """
+        local = self._local
+        local.reads -= 1
+        if local.reads == 0 and local.counted:
+            with self._mutex:
+                self._readers -= 1
+                if self._readers == 0 and self._waiting_writers:
+                    self._condition.notify_all()
+
+    def acquire_write(self) -> None:
+        """Acquire this lock for writing, waiting until no other thread holds
+        it.
+
+        Raise RuntimeError if this thread holds this lock only for reading.
+        """
+        me = threading.get_ident()
+        with self._mutex:
+            if self._writer == me:
+                self._writes += 1
+                return
+            if getattr(self._local, 'reads', 0):
+                raise RuntimeError('cannot upgrade a read lock to a write lock')
+            self._waiting_writers += 1
+            while self._writer is not None or self._readers:
+                self._condition.wait()
+            self._waiting_writers -= 1
+            self._writer = me
+            self._writes = 1
+
+    def release_write(self) -> None:
+        """Release this lock after acquiring it for writing.
+        """
+        with self._mutex:
+            self._writes -= 1
+            if self._writes == 0:
+                self._writer = None
+                self._condition.notify_all()
+
+    @contextmanager
+    def read_locked(self) -> Iterator[None]:
+        """Hold this lock for reading for the duration of a with statement.
+        """
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextmanager
+    def write_locked(self) -> Iterator[None]:
+        """Hold this lock for writing for the duration of a with statement.
+        """
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
+
+
+def _reading(method: Callable) -> Callable:
+    """Return a version of <method> that holds self.lock for reading while it
+    runs.
+    """
+    @wraps(method)
+    def locked(self: Any, *args: Any, **kwargs: Any) -> Any:
+        lock = self.lock
+        lock.acquire_read()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            lock.release_read()
+    return locked
+
+
+def _writing(method: Callable) -> Callable:
+    """Return a version of <method> that holds self.lock for writing while it
+    runs.
+    """
+    @wraps(method)
+    def locked(self: Any, *args: Any, **kwargs: Any) -> Any:
+        with self.lock.write_locked():
+            return method(self, *args, **kwargs)
+    return locked
+
+
+class ConcurrentSociety(Society):
+    """A Society that can be shared by many threads: each of its methods
+    holds its lock for reading or for writing while it runs.
+
+    >>> from society_hierarchy import simple_society_example
+    >>> o = ConcurrentSociety.from_society(simple_society_example())
+    >>> [c.cid for c in o.get_subtree(5)]
+    [5, 7, 9]
+    >>> o.set_rating(9, 99)
+    >>> o.promote_citizen(9)
+    >>> o.get_head().cid
+    9
+
+    === Public Attributes ===
+    lock:
+        The lock that guards this Society.
+    """
+    lock: RWLock
+
+    def __init__(self, head: Optional[Citizen] = None,
+                 lock: Optional[RWLock] = None) -> None:
+        """Initialize this ConcurrentSociety with the head <head>, guarded by
+        <lock> (or by a new RWLock, if it is None).
+        """
+        self.lock = lock or RWLock()
+        Society.__init__(self, head)
+
+    __str__ = _reading(Society.__str__)
+    render = _reading(Society.render)
+    get_head = _reading(Society.get_head)
+    get_citizen = _reading(Society.get_citizen)
+    get_all_citizens = _reading(Society.get_all_citizens)
+    get_citizens_with_job = _reading(Society.get_citizens_with_job)
+
+    set_head = _writing(Society.set_head)
+    add_citizen = _writing(Society.add_citizen)
+    change_citizen_type = _writing(Society.change_citizen_type)
+    promote_citizen = _writing(Society.promote_citizen)
+    delete_citizen = _writing(Society.delete_citizen)
+
+    @_reading
+    def is_in_subtree(self, cid: int, root_cid: int) -> bool:
+        """Return SocietyIndex.is_in_subtree(cid, root_cid) for this Society.
+        """
+        return index_of(self).is_in_subtree(cid, root_cid)
+
+    @_reading
+    def get_closest_common_superior(self, cid1: int,
+                                    cid2: int) -> Optional[Citizen]:
+        """Return SocietyIndex.get_closest_common_superior(cid1, cid2) for
+        this Society.
+        """
+        return index_of(self).get_closest_common_superior(cid1, cid2)
+
+    @_reading
+    def get_subtree(self, cid: int) -> list[Citizen]:
+        """Return SocietyIndex.get_subtree(cid) for this Society.
+        """
+        return index_of(self).get_subtree(cid)
+
+    @_reading
+    def get_top_rated(self, cid: int, k: int) -> list[Citizen]:
+        """Return SocietyIndex.get_top_rated(cid, k) for this Society.
+        """
+        return index_of(self).get_top_rated(cid, k)
+
+    @_reading
+    def get_top_rated_in_district(self, cid: int, k: int) -> list[Citizen]:
+        """Return SocietyIndex.get_top_rated_in_district(cid, k) for this
+        Society.
+        """
+        return index_of(self).get_top_rated_in_district(cid, k)
+
+    @_reading
+    def get_all_subordinates(self, cid: int) -> list[Citizen]:
+        """Return all of the (direct and indirect) subordinates of the Citizen
+        with ID <cid>, in order of ascending IDs, or an empty list if there is
+        no such Citizen.
+
+        >>> from society_hierarchy import simple_society_example
+        >>> o = ConcurrentSociety.from_society(simple_society_example())
+        >>> [c.cid for c in o.get_all_subordinates(5)]
+        [7, 9]
+        """
+        citizen = Society.get_citizen(self, cid)
+        return [] if citizen is None else citizen.get_all_subordinates()
+
+    @_reading
+    def get_district_citizens(self, cid: int) -> list[Citizen]:
+        """Return the citizens in the district of the DistrictLeader with ID
+        <cid>, as in DistrictLeader.get_district_citizens, or an empty list if
+        there is no such DistrictLeader.
+        """
+        citizen = Society.get_citizen(self, cid)
+        if not isinstance(citizen, DistrictLeader):
+            return []
+        return citizen.get_district_citizens()
+
+    @_reading
+    def get_rating_summary(self, cid: int) -> Optional[RatingSummary]:
+        """Return the RatingSummary of the Citizen with ID <cid> and all of
+        its subordinates, or None if there is no such Citizen.
+        """
+        citizen = self.get_citizen(cid)
+        return None if citizen is None else citizen.get_rating_summary()
+
+    @_writing
+    def add_citizens(self, records: Iterable[tuple[Citizen, Optional[int]]]
+                     ) -> tuple[list[int], list[int]]:
+        """Add <records> to this Society as in society_loader.add_citizens.
+        """
+        return add_citizens(self, records)
+
+    @_writing
+    def set_rating(self, cid: int, rating: int) -> None:
+        """Set the rating of the Citizen with ID <cid> to <rating>.
+
+        Precondition: there is a Citizen with ID <cid> in this Society.
+        """
+        Society.get_citizen(self, cid).rating = rating
+
+    @_writing
+    def set_job(self, cid: int, job: str) -> None:
+        """Set the job of the Citizen with ID <cid> to <job>.
+
+        Precondition: there is a Citizen with ID <cid> in this Society.
+        """
+        Society.get_citizen(self, cid).job = job
+
+    @classmethod
+    def from_society(cls, society: Society,
+                     lock: Optional[RWLock] = None) -> ConcurrentSociety:
+        """Return a new ConcurrentSociety, guarded by <lock> (or by a new
+        RWLock, if it is None), that takes over every Citizen in <society>.
+        <society> is left empty.
+
+        Precondition: no other thread is using <society>.
+
+        >>> from society_hierarchy import simple_society_example
+        >>> old = simple_society_example()
+        >>> o = ConcurrentSociety.from_society(old)
+        >>> o.get_citizen(9).get_superior().cid
+        5
+        >>> old.get_head() is None
+        True
+        """
+        shared = cls(lock=lock)
+        shared._head = society._head
+        shared._citizens = society._citizens
+        shared._jobs = society._jobs
+        for citizen in shared._citizens.values():
+            citizen._society = shared
+        society._head = None
+        society._citizens = {}
+        society._jobs = {}
+        society._index = None
+        society._tree_changed()
+        return shared
+
+
+class ConcurrentSimulator(SocietySimulator):
+    """A SocietySimulator that can be shared by many threads: each of its
+    methods holds the lock of its ConcurrentSociety for reading or for
+    writing while it runs.
+    """
+    current_society: ConcurrentSociety
+
+    def __init__(self) -> None:
+        """Initialize this ConcurrentSimulator with an empty Society.
+        """
+        SocietySimulator.__init__(self)
+        self.current_society = ConcurrentSociety()
+
+    @property
+    def lock(self) -> RWLock:
+        """The lock of the current Society.
+        """
+        return self.current_society.lock
+
+    get_current_citizen_details = _reading(
+        SocietySimulator.get_current_citizen_details)
+    get_current_superior = _reading(SocietySimulator.get_current_superior)
+    find_citizens_with_job = _reading(SocietySimulator.find_citizens_with_job)
+    get_society_head = _reading(SocietySimulator.get_society_head)
+    get_common_superior = _reading(SocietySimulator.get_common_superior)
+    is_district_leader = _reading(SocietySimulator.is_district_leader)
+    get_current_citizen_district = _reading(
+        SocietySimulator.get_current_citizen_district)
+    find_district_citizens = _reading(SocietySimulator.find_district_citizens)
+    get_current_district_rating_summary = _reading(
+        SocietySimulator.get_current_district_rating_summary)
+    find_top_rated_district_citizens = _reading(
+        SocietySimulator.find_top_rated_district_citizens)
+    get_all_district_names = _reading(SocietySimulator.get_all_district_names)
+
+    # These only read the Society, but they change what this simulator is
+    # displaying, which other threads may be reading.
+    display_citizen = _writing(SocietySimulator.display_citizen)
+    display_direct_subordinates = _writing(
+        SocietySimulator.display_direct_subordinates)
+    display_all_subordinates = _writing(
+        SocietySimulator.display_all_subordinates)
+
+    create_citizen = _writing(SocietySimulator.create_citizen)
+    rename_current_district = _writing(
+        SocietySimulator.rename_current_district)
+    become_district_leader = _writing(SocietySimulator.become_district_leader)
+    become_citizen = _writing(SocietySimulator.become_citizen)
+    delete_citizen = _writing(SocietySimulator.delete_citizen)
+    promote_citizen = _writing(SocietySimulator.promote_citizen)
+
+    def file_to_society(self, filename: str) -> None:
+        """Read the Society in the file named <filename> as in
+        SocietySimulator.file_to_society, and share it between threads.
+
+        Precondition: no other thread is using this simulator.
+        """
+        SocietySimulator.file_to_society(self, filename)
+        self.current_society = ConcurrentSociety.from_society(
+            self.current_society)
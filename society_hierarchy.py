@@ -22,7 +22,54 @@ REMINDER: You must NOT use list.sort() or sorted() in your code. Instead, use
 the merge() function we provide for you below.
 """
 from __future__ import annotations
-from typing import Optional, TextIO, Any
+from typing import Optional, TextIO, Any, Callable, Iterator, NamedTuple
+
+
+def _cid_of(citizen: Citizen) -> int:
+    """Return the cid of <citizen>, the key that orders lists of Citizens.
+    """
+    return citizen.cid
+
+
+def _by_rating(citizen: Citizen) -> tuple[int, int]:
+    """Return the key that orders Citizens from the highest rating down, and
+    in ascending order of cid among Citizens with the same rating.
+    """
+    return -citizen._rating, citizen.cid
+
+
+def _by_best(citizen: Citizen) -> tuple[int, int]:
+    """Return the _by_rating key of the first Citizen in the subtree of
+    <citizen> from the highest rating down.
+    """
+    best = citizen._best
+    return -best._rating, best.cid
+
+
+def _position(lst: list, key: Any,
+              key_of: Optional[Callable[[Any], Any]] = None) -> int:
+    """Return the position of the first element of <lst> whose key (that is,
+    key_of(element), or the element itself if <key_of> is None) is not less
+    than <key>, found by binary search in <lst>, which is in order of key.
+    """
+    low, high = 0, len(lst)
+    while low < high:
+        middle = (low + high) // 2
+        item = lst[middle] if key_of is None else key_of(lst[middle])
+        if item < key:
+            low = middle + 1
+        else:
+            high = middle
+    return low
+
+
+def _insert(lst: list, item: Any,
+            key_of: Optional[Callable[[Any], Any]] = None) -> None:
+    """Insert <item> into <lst>, keeping <lst> in ascending order of key
+    (see _position).
+    """
+    key = item if key_of is None else key_of(item)
+    lst.insert(_position(lst, key, key_of), item)
 
 
 def merge(lst1: list, lst2: list) -> list:
@@ -55,6 +102,123 @@ def merge(lst1: list, lst2: list) -> list:
     return new_list
 
 
+def iter_preorder(root: Citizen) -> Iterator[Citizen]:
+    """Yield <root> and then all of its subordinates, each Citizen before
+    its own subordinates and siblings in ascending order by ID.
+    """
+    to_visit = [root]
+    while to_visit:
+        citizen = to_visit.pop()
+        yield citizen
+        to_visit.extend(reversed(citizen._subordinates))
+
+
+def iter_ancestors(citizen: Citizen) -> Iterator[Citizen]:
+    """Yield <citizen> and then each of its superiors in turn.
+    """
+    while citizen is not None:
+        yield citizen
+        citizen = citizen._superior
+
+
+def _heap_push(heap: list, item: Any) -> None:
+    """Add <item> to <heap>, a list in which the item at each position i is
+    no greater than those at positions 2 * i + 1 and 2 * i + 2.
+    """
+    heap.append(item)
+    i = len(heap) - 1
+    while i > 0 and item < heap[(i - 1) // 2]:
+        heap[i] = heap[(i - 1) // 2]
+        i = (i - 1) // 2
+    heap[i] = item
+
+
+def _heap_pop(heap: list) -> Any:
+    """Remove and return the smallest item in <heap>, a list in heap order
+    (see _heap_push).
+
+    Precondition: <heap> is not empty.
+    """
+    smallest = heap[0]
+    item = heap.pop()
+    if heap:
+        i, child, size = 0, 1, len(heap)
+        while child < size:
+            if child + 1 < size and heap[child + 1] < heap[child]:
+                child += 1
+            if not heap[child] < item:
+                break
+            heap[i] = heap[child]
+            i = child
+            child = 2 * i + 1
+        heap[i] = item
+    return smallest
+
+
+def merge_all(lists: list[list]) -> list:
+    """Return a new list with the elements of all of the lists in <lists>, in
+    ascending order.
+
+    The two shortest lists are merged first, taking O(n log k) time.
+
+    Precondition: Each list in <lists> is in ascending order.
+
+    >>> merge_all([[5], [1, 4], [2], [3, 6]])
+    [1, 2, 3, 4, 5, 6]
+    """
+    heap = []
+    for i, lst in enumerate(lists):
+        if lst:
+            _heap_push(heap, (len(lst), i, lst))
+    if not heap:
+        return []
+    count = len(lists)
+    while len(heap) > 1:
+        lst1 = _heap_pop(heap)[2]
+        lst2 = _heap_pop(heap)[2]
+        _heap_push(heap, (len(lst1) + len(lst2), count, merge(lst1, lst2)))
+        count += 1
+    result = heap[0][2]
+    # A single non-empty input list has not been copied yet.
+    return result if count > len(lists) else result[:]
+
+
+def iter_merge_all(lists: list[list]) -> Iterator:
+    """Return an iterator over the elements of all of the lists in <lists>,
+    in ascending order.
+
+    Precondition: Each list in <lists> is in ascending order.
+
+    >>> list(iter_merge_all([[5], [1, 4], [], [2, 3]]))
+    [1, 2, 3, 4, 5]
+    """
+    heap = []
+    for i, lst in enumerate(lists):
+        if lst:
+            _heap_push(heap, (lst[0], i, 0))
+    while heap:
+        item, i, position = _heap_pop(heap)
+        yield item
+        if position + 1 < len(lists[i]):
+            _heap_push(heap, (lists[i][position + 1], i, position + 1))
+
+
+class RatingSummary(NamedTuple):
+    """The number, total, lowest and highest of the ratings of a group of
+    Citizens.
+    """
+    count: int
+    total: int
+    lowest: int
+    highest: int
+
+    @property
+    def mean(self) -> float:
+        """The mean of the ratings.
+        """
+        return self.total / self.count
+
+
 ###########################################################################
 # Task 1: Citizen and Society
 ###########################################################################
@@ -80,6 +244,21 @@ class Citizen:
     _subordinates:
         A list of this Citizen's direct subordinates (that is, Citizens that
         work directly under this Citizen).
+    _society:
+        The Society this Citizen is registered in, or None.
+    _district_name:
+        Only set on DistrictLeaders (declared here to allow class changes).
+    _district:
+        A list of just the closest DistrictLeader at or above this Citizen,
+        shared by its whole district, or None.
+    _job, _rating:
+        The job and rating of this Citizen (see the properties).
+    _rated_subordinates:
+        This Citizen's direct subordinates in ascending order of _by_best,
+        or None if it has fewer than two.
+    _count, _total, _lowest, _best:
+        The number, total and lowest of the ratings in this Citizen's
+        subtree, and its first Citizen in order of _by_rating.
 
     === Representation Invariants ===
     - self.cid > 0
@@ -87,14 +266,27 @@ class Citizen:
     - self._subordinates is in ascending order by the subordinates' IDs
     - self._superior is None or self in self._superior._subordinates
     - all(sub._superior is self for sub in self._subordinates)
+    - self._rated_subordinates is None if len(self._subordinates) < 2, and
+      otherwise holds the same Citizens in ascending order of _by_best
     """
+    __slots__ = ('cid', 'manufacturer', 'model_year', '_job', '_rating',
+                 '_superior', '_subordinates', '_society', '_district_name',
+                 '_district', '_rated_subordinates', '_count', '_total',
+                 '_lowest', '_best')
     cid: int
     manufacturer: str
     model_year: int
-    job: str
-    rating: int
+    _job: str
+    _rating: int
     _superior: Optional[Citizen]
     _subordinates: list[Citizen]
+    _society: Optional[Society]
+    _district: Optional[list[DistrictLeader]]
+    _rated_subordinates: Optional[list[Citizen]]
+    _count: int
+    _total: int
+    _lowest: int
+    _best: Citizen
 
     def __init__(self, cid: int, manufacturer: str, model_year: int,
                  job: str, rating: int) -> None:
@@ -112,10 +304,43 @@ class Citizen:
         self.cid = cid
         self.manufacturer = manufacturer
         self.model_year = model_year
-        self.job = job
-        self.rating = rating
+        self._job = job
+        self._rating = rating
         self._superior = None
         self._subordinates = []
+        self._society = None
+        self._district = None
+        self._rated_subordinates = None
+        self._count = 1
+        self._total = self._lowest = rating
+        self._best = self
+
+    @property
+    def job(self) -> str:
+        """The name of this Citizen's job within the Society. Setting it
+        keeps the job index of this Citizen's Society up to date.
+        """
+        return self._job
+
+    @job.setter
+    def job(self, job: str) -> None:
+        if self._society is not None:
+            self._society._set_job(self, job)
+        else:
+            self._job = job
+
+    @property
+    def rating(self) -> int:
+        """The rating of this Citizen. Setting it updates the rating
+        summaries and the subordinate orders of its superiors.
+        """
+        return self._rating
+
+    @rating.setter
+    def rating(self, rating: int) -> None:
+        previous, key = self._rating, _by_rating(self)
+        self._rating = rating
+        self._update_summaries(0, rating - previous, rating, previous, key)
 
     def __lt__(self, other: Any) -> bool:
         """Return True if <other> is a Citizen and this Citizen's cid is less
@@ -136,22 +361,40 @@ class Citizen:
     def __str__(self) -> str:
         """Return a string representation of the tree rooted at this Citizen.
         """
-        return self._str_indented().strip()
+        return '\n'.join(self.iter_lines())
 
-    def _str_indented(self, depth: int = 0) -> str:
-        """Return an indented string representation of this tree.
+    def iter_lines(self, max_depth: Optional[int] = None) -> Iterator[str]:
+        """Yield the lines of the string representation of the tree rooted at
+        this Citizen, one at a time.
 
-        The indentation level is specified by the <depth> parameter.
+        Each line is indented by two spaces per level below this Citizen.
+        Citizens more than <max_depth> levels below it are never visited.
         """
-        me = f'{str(self.cid)} (rating = {self.rating})'
-        if isinstance(self, DistrictLeader):
-            me += f' --> District Leader for {self._district_name}'
-        s = '  ' * depth + me + '\n'
-        for subordinate in self.get_direct_subordinates():
-            # Note that the 'depth' argument to the recursive call is
-            # modified.
-            s += subordinate._str_indented(depth + 1)
-        return s
+        to_visit = [(self, 0)]
+        while to_visit:
+            citizen, depth = to_visit.pop()
+            line = f'{"  " * depth}{citizen.cid} (rating = {citizen.rating})'
+            if isinstance(citizen, DistrictLeader):
+                line += f' --> District Leader for {citizen._district_name}'
+            yield line
+            if max_depth is None or depth < max_depth:
+                to_visit.extend((subordinate, depth + 1) for subordinate
+                                in reversed(citizen._subordinates))
+
+    def render(self, out: TextIO, max_depth: Optional[int] = None,
+               max_lines: Optional[int] = None) -> int:
+        """Write the string representation of the tree rooted at this Citizen
+        to <out>, one line at a time, and return the number of lines written.
+
+        <max_depth> is as for iter_lines; at most <max_lines> are written.
+        """
+        count = 0
+        for line in self.iter_lines(max_depth):
+            if max_lines is not None and count >= max_lines:
+                break
+            out.write(line + '\n')
+            count += 1
+        return count
 
     def get_superior(self) -> Optional[Citizen]:
         """Return the superior of this Citizen or None if no superior exists.
@@ -202,7 +445,9 @@ class Citizen:
         """Add <subordinate> to this Citizen's list of direct subordinates,
         keeping the list of subordinates in ascending order by their ID.
 
-        Update the new subordinate's superior to be this Citizen.
+        Update the new subordinate's superior to be this Citizen. If this
+        Citizen belongs to a Society, <subordinate> (and everyone under it) is
+        registered in that Society's cid index.
 
         Precondition: The <subordinate> has no existing superior
 
@@ -214,21 +459,24 @@ class Citizen:
         >>> c1.get_superior() is c2
         True
         """
-
-        i = 0
-        while i < len(self._subordinates) and self._subordinates[i].cid < subordinate.cid:
-            i += 1
-
-        self._subordinates.insert(i, subordinate)
-
+        _insert(self._subordinates, subordinate, _cid_of)
         subordinate._superior = self
+        subordinate._set_district(self._district)
+        self._add_rated([subordinate])
+        self._update_summaries(subordinate._count, subordinate._total,
+                               subordinate._lowest, None)
+        if self._society is not None:
+            self._society._register(subordinate)
+            self._society._tree_changed()
 
     def remove_subordinate(self, cid: int) -> None:
         """Remove the direct subordinate with the ID <cid> from this Citizen's
         list of subordinates.
 
         Furthermore, remove that (former) subordinate from the hierarchy by
-        setting its superior to None.
+        setting its superior to None. If this Citizen belongs to a Society,
+        the former subordinate (and everyone under it) is no longer part of
+        that Society, so it is removed from the Society's indexes.
 
         Precondition: This Citizen has a direct subordinate with ID <cid>.
 
@@ -243,11 +491,29 @@ class Citizen:
         >>> c1.get_superior() is None
         True
         """
-        for subordinate in self._subordinates:
-            if subordinate.cid == cid:
-                self._subordinates.remove(subordinate)
-                subordinate._superior = None
-                break
+        subordinate = self._detach(cid)
+        if subordinate is not None:
+            subordinate._set_district(None)
+            if self._society is not None:
+                self._society._unregister_subtree(subordinate)
+
+    def _detach(self, cid: int) -> Optional[Citizen]:
+        """Remove the direct subordinate with the ID <cid>, as in
+        remove_subordinate, and return it (or None if there is no such
+        subordinate), but leave its subtree registered in this Citizen's
+        Society, so that it can be moved elsewhere in the same Society.
+        """
+        subordinate = None
+        i = _position(self._subordinates, cid, _cid_of)
+        if i < len(self._subordinates) and self._subordinates[i].cid == cid:
+            subordinate = self._subordinates.pop(i)
+            subordinate._superior = None
+            self._remove_rated(subordinate)
+            self._update_summaries(-subordinate._count, -subordinate._total,
+                                   None, subordinate._lowest)
+        if self._society is not None:
+            self._society._tree_changed()
+        return subordinate
 
     def become_subordinate_to(self, superior: Optional[Citizen]) -> None:
         """Make this Citizen a direct subordinate of <superior>.
@@ -255,7 +521,9 @@ class Citizen:
         If this Citizen already had a superior, remove this Citizen from the
         old superior's list of subordinates.
 
-        If <superior> is None, just set this Citizen's superior to None.
+        If <superior> is None, just set this Citizen's superior to None (and,
+        if it had a superior, it leaves that superior's Society along with
+        everyone under it).
 
         >>> c1 = Citizen(1, "Starky Industries", 3024, "Labourer", 50)
         >>> c2 = Citizen(2, "Hookins National Lab", 3024, "Manager", 30)
@@ -271,7 +539,12 @@ class Citizen:
         []
         """
         if self._superior:
-            self._superior.remove_subordinate(self.cid)
+            if superior is not None and superior._society is not None \
+                    and superior._society is self._superior._society:
+                # Moving within one Society: keep the subtree registered.
+                self._superior._detach(self.cid)
+            else:
+                self._superior.remove_subordinate(self.cid)
 
         if superior:
             superior.add_subordinate(self)
@@ -295,15 +568,10 @@ class Citizen:
         >>> c2.get_citizen(3) is None
         True
         """
-        # Note: This method must call itself recursively
-        if self.cid == cid:
-            return self
-        else:
-            for subordinate in self._subordinates:
-                result = subordinate.get_citizen(cid)
-                if result is not None:
-                    return result
-            return None
+        for citizen in iter_preorder(self):
+            if citizen.cid == cid:
+                return citizen
+        return None
 
     ###########################################################################
     # Task 1.2
@@ -323,20 +591,22 @@ class Citizen:
         >>> c3.get_all_subordinates()[1].cid
         2
         """
-        # Note: This method must call itself recursively
+        return merge_all(self._subordinate_lists())
 
-        # Hints:
-        # - Recall that each Citizen's subordinates list is sorted in ascending
-        #   order.
-        # - Use the merge helper function.
-        if not self._subordinates:
-            return []
-        else:
-            result = self._subordinates[:]
-            for subordinate in self._subordinates:
-                indirect_subordinates = subordinate.get_all_subordinates()
-                result = merge(result, indirect_subordinates)
-            return result
+    def iter_all_subordinates(self) -> Iterator[Citizen]:
+        """Return an iterator over all of the subordinates (both direct and
+        indirect) of this Citizen in order of ascending IDs.
+
+        The hierarchy must not be changed while the iterator is in use.
+        """
+        return iter_merge_all(self._subordinate_lists())
+
+    def _subordinate_lists(self) -> list[list[Citizen]]:
+        """Return the non-empty _subordinates lists (not copies) of this
+        Citizen and all of its subordinates.
+        """
+        return [citizen._subordinates for citizen in iter_preorder(self)
+                if citizen._subordinates]
 
     def get_society_head(self) -> Citizen:
         """Return the head of the Society (i.e. the top-most superior Citizen,
@@ -351,12 +621,10 @@ class Citizen:
         >>> c1.get_society_head().cid
         3
         """
-        # Note: This method must call itself recursively
-
-        if not self._superior:
-            return self
-        else:
-            return self._superior.get_society_head()
+        head = self
+        for head in iter_ancestors(self):
+            pass
+        return head
 
     def get_closest_common_superior(self, cid: int) -> Citizen:
         """Return the closest common superior that this Citizen and the
@@ -387,18 +655,17 @@ class Citizen:
         >>> c3.get_closest_common_superior(5) == c2
         True
         """
-        # Note: This method must call itself recursively
-
-        if self.cid == cid:
-            return self
-
-        # if the citizen with cid is a subordinate of self
-        if self.get_citizen(cid):
-            return self
-
-        # if the citizen with cid is a superior of self
-        if self._superior is not None:
-            return self._superior.get_closest_common_superior(cid)
+        # Use the Society's index, or else the chain of superiors.
+        society = self._society
+        if society is not None and society._index_of is not None:
+            index = society._index_of(society)
+            return index.get_closest_common_superior(self.cid, cid)
+        root = self.get_society_head() if society is None else society
+        other = root.get_citizen(cid)
+        chain = {id(citizen) for citizen in iter_ancestors(self)}
+        for citizen in iter_ancestors(other):
+            if id(citizen) in chain:
+                return citizen
 
     ###########################################################################
     # Task 2.2
@@ -418,10 +685,8 @@ class Citizen:
         >>> c1.get_district_name()
         'District A'
         """
-        # Note: This method must call itself recursively
-        if self.get_superior() is None:
-            return ""
-        return self.get_superior().get_district_name()
+        leader = self._get_district_leader()
+        return "" if leader is None else leader._district_name
 
     def rename_district(self, district_name: str) -> None:
         """Rename the immediate district which this Citizen is a part of to
@@ -439,9 +704,51 @@ class Citizen:
         >>> c2.get_district_name()
         'District B'
         """
-        superior = self.get_superior()
-        if superior is not None:
-            superior.rename_district(district_name)
+        leader = self._get_district_leader()
+        if leader is not None:
+            leader.rename_district(district_name)
+
+    def _get_district_leader(self) -> Optional[DistrictLeader]:
+        """Return the closest DistrictLeader at or above this Citizen in the
+        hierarchy, or None if there is no such DistrictLeader.
+        """
+        return None if self._district is None else self._district[0]
+
+    def _set_district(self, district: Optional[list[DistrictLeader]]) -> None:
+        """Set the _district of this Citizen, unless it is a DistrictLeader,
+        and of the other members of its district below it to <district>.
+        """
+        to_visit = [self]
+        while to_visit:
+            citizen = to_visit.pop()
+            if citizen._district is not district \
+                    and not isinstance(citizen, DistrictLeader):
+                citizen._district = district
+                to_visit.extend(citizen._subordinates)
+
+    def get_rating_summary(self) -> RatingSummary:
+        """Return the RatingSummary of this Citizen and all of its
+        subordinates, in O(1).
+
+        >>> s = simple_society_example()
+        >>> s.get_citizen(5).get_rating_summary()
+        RatingSummary(count=3, total=108, lowest=5, highest=86)
+        """
+        return RatingSummary(self._count, self._total, self._lowest,
+                             self._best._rating)
+
+    def get_district_rating_summary(self) -> Optional[RatingSummary]:
+        """Return the RatingSummary of the citizens in the immediate district
+        of this Citizen, or None if it is not part of any district.
+
+        >>> s = simple_society_example()
+        >>> s.get_citizen(7).get_district_rating_summary() is None
+        True
+        >>> s.change_citizen_type(5, "Area 52").get_district_rating_summary()
+        RatingSummary(count=3, total=108, lowest=5, highest=86)
+        """
+        leader = self._get_district_leader()
+        return None if leader is None else leader.get_rating_summary()
 
     ###########################################################################
     # Task 3.2 Helper Method
@@ -467,12 +774,97 @@ class Citizen:
         """
         # Hint: This can be used as a helper function for `delete_citizen`
 
-        direct_subordinates = self.get_direct_subordinates()
-        highest_rated = direct_subordinates[0]
-        for subordinate in direct_subordinates:
-            if subordinate.rating > highest_rated.rating:
-                highest_rated = subordinate
-        return highest_rated
+        rated = self._rated_subordinates or self._subordinates
+        highest = rated[0]
+        for subordinate in rated:
+            if _by_best(subordinate) >= _by_rating(highest):
+                break
+            if _by_rating(subordinate) < _by_rating(highest):
+                highest = subordinate
+        return highest
+
+    def _add_rated(self, subordinates: list[Citizen]) -> None:
+        """Insert <subordinates>, just added to this Citizen's subordinates,
+        into _rated_subordinates (which holds the others, or is None).
+        """
+        rated = self._rated_subordinates
+        if rated is None:
+            if len(self._subordinates) < 2:
+                return
+            rated = []
+            subordinates = self._subordinates
+        if len(subordinates) == 1:
+            _insert(rated, subordinates[0], _by_best)
+        else:
+            keyed = [[(_by_best(sub), sub)] for sub in subordinates]
+            pairs = merge_all([[(_by_best(sub), sub) for sub in rated]] + keyed)
+            rated = [sub for _, sub in pairs]
+        self._rated_subordinates = rated
+
+    def _remove_rated(self, subordinate: Citizen,
+                      key: Optional[tuple[int, int]] = None) -> None:
+        """Remove <subordinate> from _rated_subordinates, where its key is
+        <key> if that is no longer _by_best(subordinate).
+        """
+        rated = self._rated_subordinates
+        if rated is None or len(self._subordinates) < 2:
+            self._rated_subordinates = None
+            return
+        if key is None:
+            key = _by_best(subordinate)
+        del rated[_position(rated, key, lambda citizen: key if citizen is
+                            subordinate else _by_best(citizen))]
+
+    def _find_best(self) -> None:
+        """Set _best from this Citizen's rating and its subordinates'.
+        """
+        rated = self._rated_subordinates or self._subordinates
+        if rated and _by_best(rated[0]) < _by_rating(self):
+            self._best = rated[0]._best
+        else:
+            self._best = self
+
+    def _summarize(self) -> None:
+        """Set the whole rating summary of this Citizen from its own rating
+        and its subordinates' summaries.
+        """
+        self._count = 1 + sum(sub._count for sub in self._subordinates)
+        self._total = self._rating + sum(sub._total
+                                         for sub in self._subordinates)
+        self._lowest = min([self._rating]
+                           + [sub._lowest for sub in self._subordinates])
+        self._find_best()
+
+    def _update_summaries(self, count: int, total: int,
+                          entered: Optional[int], gone: Optional[int],
+                          key: Optional[tuple[int, int]] = None) -> None:
+        """Update the rating summaries of this Citizen and its superiors, up
+        to the first that is unchanged. <count> and <total> are the changes
+        to the subtree's, <entered> and <gone> the lowest ratings added and
+        removed (or None), and <key> this Citizen's old _by_rating key.
+        """
+        citizen, subordinate, best = self, None, None
+        while citizen is not None:
+            old_lowest, old_best = citizen._lowest, _by_best(citizen)
+            if key is not None and citizen._best is self:
+                old_best = key
+            citizen._count += count
+            citizen._total += total
+            if subordinate is not None and _by_best(subordinate) != best:
+                citizen._remove_rated(subordinate, best)
+                citizen._add_rated([subordinate])
+            if entered is not None and entered < old_lowest:
+                citizen._lowest = entered
+            elif gone == old_lowest != entered:
+                citizen._lowest = min([citizen._rating] + [
+                    sub._lowest for sub in citizen._subordinates])
+            citizen._find_best()
+            if not count and not total and citizen._lowest == old_lowest \
+                    and _by_best(citizen) == old_best:
+                return
+            entered, gone = citizen._lowest, old_lowest
+            subordinate, best = citizen, old_best
+            citizen = citizen._superior
 
 
 class Society:
@@ -483,12 +875,31 @@ class Society:
         The root of the hierarchy, which we call the "head" of the Society.
         If _head is None, this indicates that this Society is empty (there are
         no citizens in this Society).
+    _citizens:
+        An index mapping the cid of every Citizen in this Society to it.
+    _jobs:
+        An index mapping each job held in this Society to the cids of the
+        Citizens with that job, in ascending order.
+    _version:
+        A counter that is increased every time the shape of the hierarchy
+        changes, so that lazily built indexes know when to rebuild.
+    _index:
+        The SocietyIndex of this Society (see society_index.py), or None.
+    _index_of:
+        society_index.index_of, set once society_index.py is imported.
 
     === Representation Invariants ===
     - No two Citizens in this Society have the same cid.
     - self._head._superior is None
+    - self._citizens contains exactly the Citizens in the hierarchy rooted at
+      self._head, and each of them has self as its _society.
     """
     _head: Optional[Citizen]
+    _citizens: dict[int, Citizen]
+    _jobs: dict[str, list[int]]
+    _version: int
+    _index: Optional[Any]
+    _index_of: Optional[Callable[[Society], Any]] = None
 
     def __init__(self, head: Optional[Citizen] = None) -> None:
         """Initialize this Society with the head <head>.
@@ -498,6 +909,12 @@ class Society:
         True
         """
         self._head = head
+        self._citizens = {}
+        self._jobs = {}
+        self._version = 0
+        self._index = None
+        if head is not None:
+            self._register(head)
 
     def __str__(self) -> str:
         """Return a string representation of this Society's tree.
@@ -509,6 +926,20 @@ class Society:
         """
         return str(self._head)
 
+    def render(self, out: TextIO, start_cid: Optional[int] = None,
+               max_depth: Optional[int] = None,
+               max_lines: Optional[int] = None) -> int:
+        """Write the string representation of this Society's tree to <out>,
+        one line at a time, and return the number of lines written.
+
+        Only the tree rooted at the Citizen with ID <start_cid> is written,
+        if it is given; <max_depth> and <max_lines> are as for Citizen.render.
+        """
+        start = self._head if start_cid is None else self.get_citizen(start_cid)
+        if start is None:
+            return 0
+        return start.render(out, max_depth, max_lines)
+
     ###########################################################################
     # You may use the methods below as helper methods if needed.
     ###########################################################################
@@ -521,6 +952,62 @@ class Society:
         """Set the head of this Society to <new_head>.
         """
         self._head = new_head
+        self._register(new_head)
+        self._tree_changed()
+
+    def _register(self, citizen: Citizen) -> None:
+        """Add <citizen> and all of its subordinates to this Society's cid and
+        job indexes, skipping subtrees that are already registered.
+        """
+        to_visit = [citizen]
+        while to_visit:
+            current = to_visit.pop()
+            if current._society is not self:
+                current._society = self
+                replaced = self._citizens.get(current.cid)
+                if replaced is not None:
+                    self._unindex_job(replaced.job, replaced.cid)
+                self._citizens[current.cid] = current
+                _insert(self._jobs.setdefault(current.job, []), current.cid)
+                to_visit.extend(current._subordinates)
+
+    def _unregister(self, citizen: Citizen) -> None:
+        """Remove <citizen> (but not its subordinates) from this Society's cid
+        and job indexes.
+        """
+        if self._citizens.get(citizen.cid) is citizen:
+            del self._citizens[citizen.cid]
+            self._unindex_job(citizen.job, citizen.cid)
+        citizen._society = None
+
+    def _unregister_subtree(self, citizen: Citizen) -> None:
+        """Remove <citizen>, just detached from this Society's hierarchy, and
+        all of its subordinates from this Society's cid and job indexes.
+        """
+        for current in iter_preorder(citizen):
+            if current._society is self:
+                self._unregister(current)
+        self._tree_changed()
+
+    def _unindex_job(self, job: str, cid: int) -> None:
+        """Remove <cid>, which is there, from the cids with the job <job>.
+        """
+        cids = self._jobs[job]
+        del cids[_position(cids, cid)]
+        if not cids:
+            del self._jobs[job]
+
+    def _set_job(self, citizen: Citizen, job: str) -> None:
+        """Change the job of <citizen>, a Citizen in this Society, to <job>.
+        """
+        self._unindex_job(citizen._job, citizen.cid)
+        citizen._job = job
+        _insert(self._jobs.setdefault(job, []), citizen.cid)
+
+    def _tree_changed(self) -> None:
+        """Record that the shape of this Society's hierarchy has changed.
+        """
+        self._version += 1
 
     ###########################################################################
     # Task 1.3
@@ -537,11 +1024,7 @@ class Society:
         >>> o.get_citizen(2) is None
         True
         """
-        result = None
-        for citizen in self.get_all_citizens():
-            if citizen.cid == cid:
-                result = citizen
-        return result
+        return self._citizens.get(cid)
 
     def add_citizen(self, citizen: Citizen, superior_id: int = None) -> None:
         """Add <citizen> to this Society as a subordinate of the Citizen with
@@ -576,7 +1059,7 @@ class Society:
         if superior_id is None:
             if self._head:
                 citizen.add_subordinate(self._head)
-            self._head = citizen
+            self.set_head(citizen)
         else:
             self.get_citizen(superior_id).add_subordinate(citizen)
 
@@ -602,8 +1085,7 @@ class Society:
         if not self._head:
             return []
         else:
-            subordinates = self._head.get_all_subordinates()
-            return merge([self._head], subordinates)
+            return merge_all([[self._head]] + self._head._subordinate_lists())
 
     def get_citizens_with_job(self, job: str) -> list[Citizen]:
         """Return a list of all citizens with the job <job>, in order of
@@ -625,12 +1107,8 @@ class Society:
         >>> o.get_citizens_with_job('Manager') == [c1, c2, c4]
         True
         """
-        all_citizens = self.get_all_citizens()
-        all_citizens_with_job = []
-        for citizen in all_citizens:
-            if citizen.job == job:
-                all_citizens_with_job.append(citizen)
-        return all_citizens_with_job
+        citizens = self._citizens
+        return [citizens[cid] for cid in self._jobs.get(job, [])]
 
     ###########################################################################
     # Task 2.3
@@ -642,18 +1120,9 @@ class Society:
         If the Citizen is currently a DistrictLeader, change them to become a
         regular Citizen (with no district name). If they are currently a regular
         Citizen, change them to become DistrictLeader for <district_name>.
-        Note that this requires creating a new object of type either Citizen
-        or DistrictLeader.
-
-        The new Citizen/DistrictLeader should keep the same placement in the
-        hierarchy (that is, the same superior and subordinates) that the
-        original Citizen had, as well as the same ID, manufacturer, model year,
-        job, and rating.
-
-        Return the newly created Citizen/DistrictLeader.
+        The object changes class in place, so references to it stay valid.
 
-        The original citizen that's being replaced should no longer be in the
-        hierarchy (it should not be anyone's subordinate nor superior).
+        Return the changed Citizen/DistrictLeader.
 
         Precondition:
         - <cid> exists in this society.
@@ -675,11 +1144,11 @@ class Society:
         >>> o.add_citizen(c6, 3)
         >>> original_subordinates = c1.get_direct_subordinates()
         >>> new_c1 = o.change_citizen_type(1)
-        >>> o.get_head() is new_c1
+        >>> new_c1 is c1 and o.get_head() is c1
         True
-        >>> len(c1.get_direct_subordinates())
-        0
-        >>> new_c1.get_direct_subordinates() == original_subordinates
+        >>> isinstance(c1, DistrictLeader)
+        False
+        >>> c1.get_direct_subordinates() == original_subordinates
         True
         >>> new_c3 = o.change_citizen_type(3, "Finance")
         >>> new_c3.get_district_name() == "Finance"
@@ -688,24 +1157,20 @@ class Society:
         target = self.get_citizen(cid)
 
         if target:
+            # Both classes share the same slots, so the object switches class.
             if isinstance(target, DistrictLeader):
-                new_citizen = Citizen(cid, target.manufacturer, target.model_year, target.job, target.rating)
+                del target._district_name
+                target.__class__ = Citizen
+                superior = target._superior
+                target._set_district(superior and superior._district)
             else:
-                new_citizen = DistrictLeader(cid, target.manufacturer, target.model_year, target.job, target.rating,
-                                             district_name)
-            for subordinate in target.get_direct_subordinates():
-                new_citizen.add_subordinate(subordinate)
-                target.remove_subordinate(subordinate.cid)
-
-            superior = target.get_superior()
-            if superior is not None:
-                superior.remove_subordinate(target.cid)
-                superior.add_subordinate(new_citizen)
-
-            if target is self.get_head():
-                self.set_head(new_citizen)
+                target.__class__ = DistrictLeader
+                target._district_name = district_name
+                target._district = [target]
+                for subordinate in target._subordinates:
+                    subordinate._set_district(target._district)
 
-            return new_citizen
+            return target
 
     ###########################################################################
     # Task 3.1
@@ -752,34 +1217,45 @@ class Society:
         """
         superior = citizen.get_superior()
         if isinstance(superior, DistrictLeader):
-            # swapped in wrong order!!!
-            citizen = self.change_citizen_type(citizen.cid, superior.get_district_name())
-            superior = self.change_citizen_type(superior.cid)
-
-        # copy of subordinates
-        superior_subordinates = superior.get_direct_subordinates()
-        citizen_subordinates = citizen.get_direct_subordinates()
-
-        for subordinate in superior_subordinates:
-            # idea is to
-            # remove all superior subordinates
-            # add all superior subordinates to citizen except itself
-            if (subordinate.cid != citizen.cid):
-                citizen.add_subordinate(subordinate)
-            superior.remove_subordinate(subordinate.cid)
-
-        for subordinate in citizen_subordinates:
-            if subordinate not in superior.get_all_subordinates():
-                # print("adding subordinate" + str(subordinate.cid))
-                superior.add_subordinate(subordinate)
-                citizen.remove_subordinate(subordinate.cid)
-
-        if superior.get_superior() is not None:
-            superior.get_superior().add_subordinate(citizen)
-            superior.get_superior().remove_subordinate(superior.cid)
-
-        citizen.add_subordinate(superior)
-        superior.remove_subordinate(citizen.cid)
+            # <citizen> takes over the district, whose members share its list.
+            citizen.__class__, superior.__class__ = DistrictLeader, Citizen
+            citizen._district_name = superior._district_name
+            del superior._district_name
+            superior._district[0] = citizen
+
+        # <citizen> takes <superior>'s place under the grand-superior.
+        grand_superior = superior.get_superior()
+        if grand_superior is not None:
+            siblings = grand_superior._subordinates
+            del siblings[_position(siblings, superior.cid, _cid_of)]
+            _insert(siblings, citizen, _cid_of)
+            rated = grand_superior._rated_subordinates
+            if rated is not None:
+                rated[_position(rated, _by_best(superior), _by_best)] = citizen
+        citizen._superior = grand_superior
+
+        # The two swap subordinates.
+        others = superior._subordinates
+        del others[_position(others, citizen.cid, _cid_of)]
+        superior._remove_rated(citizen)
+        superior._subordinates, citizen._subordinates = \
+            citizen._subordinates, others
+        superior._rated_subordinates, citizen._rated_subordinates = \
+            citizen._rated_subordinates, superior._rated_subordinates
+        for subordinate in superior._subordinates:
+            subordinate._superior = superior
+        for subordinate in citizen._subordinates:
+            subordinate._superior = citizen
+        superior._summarize()
+        _insert(citizen._subordinates, superior, _cid_of)
+        citizen._add_rated([superior])
+        citizen._summarize()
+        superior._superior = citizen
+
+        if grand_superior is None:
+            self.set_head(citizen)
+        self._tree_changed()
+
         superior.job, citizen.job = citizen.job, superior.job
         return citizen
 
@@ -814,24 +1290,13 @@ class Society:
         True
         """
         citizen = self.get_citizen(cid)
-
-        # if immediate superior has lower rating, begin promotion
-        if citizen.get_superior().rating < citizen.rating:
-            last_swappable_superior = citizen.get_superior()
-
-            while last_swappable_superior.cid < citizen.cid:
-                # reached the top of the district
-                if isinstance(last_swappable_superior, DistrictLeader):
-                    break
-                last_swappable_superior = last_swappable_superior.get_superior()
-
-            subordinates = last_swappable_superior.get_all_subordinates()
-            while citizen in subordinates:
-                citizen = self._swap_up(citizen)
-
-        # else, do nothing
-        else:
-            return None
+        superior = citizen.get_superior()
+        while superior is not None and superior.rating < citizen.rating:
+            leader = isinstance(superior, DistrictLeader)
+            citizen = self._swap_up(citizen)
+            if leader:
+                break
+            superior = citizen.get_superior()
 
     ###########################################################################
     # Task 3.2
@@ -872,24 +1337,39 @@ class Society:
         citizen = self.get_citizen(cid)
         superior = citizen.get_superior()
         subordinates = citizen.get_direct_subordinates()
-
-        superior.remove_subordinate(citizen.cid)
+        new_head = None
+        if superior is None and subordinates:
+            new_head = citizen.get_highest_rated_subordinate()
+        self._unregister(citizen)
+        citizen._subordinates = []
+        citizen._rated_subordinates = None
+        citizen._superior = None
         for subordinate in subordinates:
-            superior.add_subordinate(subordinate)
-
-        if citizen is self.get_head():
-            if not citizen.get_direct_subordinates():
-                self._head = None
-            else:
-                highest_rated_subordinate = citizen.get_highest_rated_subordinate()
-                subordinates = citizen.get_direct_subordinates()
-                for subordinate in subordinates:
-                    if subordinate.cid != highest_rated_subordinate.cid:
-                        highest_rated_subordinate.add_subordinate(subordinate)
-                    citizen.remove_subordinate(subordinate.cid)
+            subordinate._superior = None
 
-                highest_rated_subordinate.set_superior(None)
-                self.set_head(highest_rated_subordinate)
+        if superior is not None:
+            siblings = superior._subordinates
+            del siblings[_position(siblings, cid, _cid_of)]
+            superior._remove_rated(citizen)
+            for subordinate in subordinates:
+                subordinate._superior = superior
+                subordinate._set_district(superior._district)
+            superior._subordinates = merge(siblings, subordinates)
+            superior._add_rated(subordinates)
+            superior._update_summaries(-1, -citizen._rating, None,
+                                       citizen._rating)
+            self._tree_changed()
+        elif not subordinates:
+            self._head = None
+            self._tree_changed()
+        else:
+            new_head._set_district(None)
+            for subordinate in subordinates:
+                if subordinate is not new_head:
+                    new_head.add_subordinate(subordinate)
+            self.set_head(new_head)
+        citizen._summarize()
+        citizen._set_district(None)
 
 
 ###############################################################################
@@ -926,6 +1406,7 @@ class DistrictLeader(Citizen):
     - All Citizen RIs are inherited.
     - len(self._district_name) >= 1
     """
+    __slots__ = ()
     _district_name: str
 
     ###########################################################################
@@ -948,6 +1429,7 @@ class DistrictLeader(Citizen):
         """
         Citizen.__init__(self, cid, manufacturer, model_year, job, rating)
         self._district_name = district
+        self._district = [self]
 
     def get_district_citizens(self) -> list[Citizen]:
         """Return a list of all citizens in this DistrictLeader's district, in
@@ -965,8 +1447,7 @@ class DistrictLeader(Citizen):
         >>> c1.get_district_citizens() == [c1, c2, c3]
         True
         """
-        citizen_list = self.get_all_subordinates()
-        return merge(citizen_list, [self])
+        return merge_all([[self]] + self._subordinate_lists())
 
     ###########################################################################
     # Task 2.2
@@ -983,7 +1464,7 @@ class DistrictLeader(Citizen):
 
 
 ###########################################################################
-# ALL PROVIDED FUNCTIONS BELOW ARE COMPLETE, DO NOT CHANGE
+# Loading a Society from a file
 ###########################################################################
 def create_society_from_file(file: TextIO) -> Society:
     """Return the Society represented by the information in file.
@@ -998,27 +1479,23 @@ def create_society_from_file(file: TextIO) -> Society:
     people = {}
     for line in file:
         info: list[Any] = line.strip().split(',')
+        if len(info) < 6:
+            continue
         info[0] = int(info[0])
         info[2] = int(info[2])
         info[4] = int(info[4])
 
         if len(info) == 7:
-            inf = info[:5] + info[-1:]
-            person = DistrictLeader(*inf)
+            person = DistrictLeader(*info[:5], info[6])
         else:
             person = Citizen(*info[:5])
+        people[info[0]] = (person, int(info[5]) if info[5] else None)
 
-        superior = info[5]
-        if not info[5]:
+    for person, superior_id in people.values():
+        if superior_id is None:
             head = person
-            superior = None
         else:
-            superior = int(superior)
-        people[info[0]] = (person, superior)
-
-    for key in people:
-        if people[key][1] is not None:
-            people[people[key][1]][0].add_subordinate(people[key][0])
+            people[superior_id][0].add_subordinate(person)
 
     return Society(head)
 
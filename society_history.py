@@ -0,0 +1,316 @@
+"""Assignment 2: Undo and Redo
+
+=== Module description ===
+This module contains UndoableSimulator, a SocietySimulator whose changes to
+its Society can be undone and redone, and the functions it uses to reverse
+deletions and promotions.
+
+Each change is recorded as a small delta: the operation and its arguments
+(in the same form as a journal entry; see society_journal.py), plus just
+enough of the state before it to reverse it:
+- create_citizen: nothing (undoing it deletes the new Citizen);
+- delete_citizen: the deleted Citizen and the cids of its superior and of
+  its direct subordinates;
+- promote_citizen: the cids of the superiors it was swapped with;
+- become_district_leader: nothing;
+- become_citizen and rename_district: the old district name.
+
+Undoing or redoing a change therefore costs about as much as the change
+itself, not as much as reloading the Society. Only the latest changes are
+kept, up to a configurable number.
+"""
+from __future__ import annotations
+from collections import deque
+from typing import Any, Optional
+
+from client_code import SocietySimulator
+from society_hierarchy import Citizen, DistrictLeader, Society
+from society_journal import apply_operation
+
+# A recorded change: (operation, arguments, what is needed to reverse it).
+Delta = tuple[str, tuple, tuple]
+
+
+def promotion_path(society: Society, cid: int) -> list[int]:
+    """Return the cids of the superiors that society.promote_citizen(cid)
+    would swap the Citizen with ID <cid> with, in the order of the swaps.
+
+    Precondition: There is a Citizen with the cid <cid> in <society>.
+
+    >>> from society_hierarchy import promote_citizen_example
+    >>> promotion_path(promote_citizen_example(), 11)
+    [7, 5]
+    """
+    citizen = society.get_citizen(cid)
+    path = []
+    superior = citizen.get_superior()
+    while superior is not None and superior.rating < citizen.rating:
+        path.append(superior.cid)
+        if isinstance(superior, DistrictLeader):
+            break
+        superior = superior.get_superior()
+    return path
+
+
+def undo_promotion(society: Society, superior_ids: list[int]) -> None:
+    """Undo a promotion in <society>, given the cids <superior_ids> that
+    promotion_path returned just before it: swap each of those Citizens back
+    up, in the reverse order.
+
+    Precondition: the hierarchy has not changed since the promotion.
+
+    >>> from society_hierarchy import promote_citizen_example
+    >>> o = promote_citizen_example()
+    >>> path = promotion_path(o, 11)
+    >>> o.promote_citizen(11)
+    >>> undo_promotion(o, path)
+    >>> o.get_citizen(11).get_superior().cid
+    7
+    >>> o.get_citizen(5).get_district_name()
+    'Finance'
+    """
+    for superior_id in reversed(superior_ids):
+        society._swap_up(society.get_citizen(superior_id))
+
+
+def restore_citizen(society: Society, citizen: Citizen,
+                    superior_id: Optional[int],
+                    subordinate_ids: list[int]) -> None:
+    """Put <citizen> back into <society> after delete_citizen removed it: as
+    a subordinate of the Citizen with ID <superior_id> (or as the head, if it
+    is None), and as the superior again of the Citizens with IDs in
+    <subordinate_ids>, which were its direct subordinates.
+
+    Precondition: the hierarchy has not changed since <citizen> was deleted,
+    and <superior_id> and <subordinate_ids> are the cids of its superior and
+    direct subordinates at that time.
+
+    >>> from society_hierarchy import simple_society_example
+    >>> o = simple_society_example()
+    >>> c5 = o.get_citizen(5)
+    >>> o.delete_citizen(5)
+    >>> restore_citizen(o, c5, 6, [7, 9])
+    >>> o.get_citizen(9).get_superior() is c5
+    True
+    >>> c6 = o.get_head()
+    >>> o.delete_citizen(6)
+    >>> o.get_head().cid
+    8
+    >>> restore_citizen(o, c6, None, [2, 3, 5, 8])
+    >>> o.get_head() is c6
+    True
+    >>> [c.cid for c in c6.get_direct_subordinates()]
+    [2, 3, 5, 8]
+    """
+    for subordinate_id in subordinate_ids:
+        subordinate = society.get_citizen(subordinate_id)
+        if subordinate.get_superior() is not None:
+            # Keep the subtree registered while it moves back under <citizen>.
+            subordinate.get_superior()._detach(subordinate_id)
+        else:
+            society._head = None
+        citizen.add_subordinate(subordinate)
+    if superior_id is None:
+        society.set_head(citizen)
+    else:
+        society.get_citizen(superior_id).add_subordinate(citizen)
+
+
+class UndoableSimulator(SocietySimulator):
+    """A SocietySimulator that can undo and redo its changes to its Society.
+
+    Loading a new Society with file_to_society forgets every change.
+
+    >>> simulator = UndoableSimulator()
+    >>> simulator.file_to_society('citizens.csv')
+    >>> simulator.delete_citizen(5)
+    >>> simulator.current_society.get_citizen(5) is None
+    True
+    >>> simulator.undo()
+    True
+    >>> simulator.current_society.get_citizen(5).cid
+    5
+    >>> simulator.redo()
+    True
+    >>> simulator.current_society.get_citizen(5) is None
+    True
+    >>> simulator.redo()
+    False
+
+    === Private Attributes ===
+    _undo_deltas:
+        The changes that can be undone, the latest last. Once it holds
+        history_depth changes, the oldest is dropped when another is added.
+    _redo_deltas:
+        The changes that have been undone and can be redone, the latest undo
+        last. It is emptied whenever a new change is made.
+
+    === Representation Invariants ===
+    - Applying the changes in _redo_deltas, latest last, is possible from the
+      current Society.
+    """
+    _undo_deltas: deque[Delta]
+    _redo_deltas: list[Delta]
+
+    def __init__(self, history_depth: int = 100) -> None:
+        """Initialize this UndoableSimulator with an empty Society,
+        remembering up to <history_depth> changes to undo.
+
+        Precondition: history_depth >= 0
+        """
+        SocietySimulator.__init__(self)
+        self._undo_deltas = deque(maxlen=history_depth)
+        self._redo_deltas = []
+
+    @property
+    def history_depth(self) -> int:
+        """The number of changes that can be undone at most.
+        """
+        return self._undo_deltas.maxlen
+
+    @history_depth.setter
+    def history_depth(self, depth: int) -> None:
+        """Set the number of changes that can be undone at most to <depth>,
+        forgetting the oldest changes if there are more than that.
+
+        Precondition: depth >= 0
+        """
+        self._undo_deltas = deque(self._undo_deltas, maxlen=depth)
+
+    def can_undo(self) -> bool:
+        """Return whether there is a change that can be undone.
+        """
+        return bool(self._undo_deltas)
+
+    def can_redo(self) -> bool:
+        """Return whether there is an undone change that can be redone.
+        """
+        return bool(self._redo_deltas)
+
+    def undo(self) -> bool:
+        """Undo the latest change that has not been undone, and return True,
+        or return False if there is none.
+        """
+        if not self._undo_deltas:
+            return False
+        delta = self._undo_deltas.pop()
+        self._reverse(*delta)
+        self._redo_deltas.append(delta)
+        self._refresh_current_citizen()
+        return True
+
+    def redo(self) -> bool:
+        """Redo the latest change that was undone, and return True, or return
+        False if there is none (or a new change has been made since).
+        """
+        if not self._redo_deltas:
+            return False
+        delta = self._redo_deltas.pop()
+        op, args, _ = delta
+        apply_operation(self.current_society, op, list(args))
+        self._undo_deltas.append(delta)
+        self._refresh_current_citizen()
+        return True
+
+    def create_citizen(self, cid: int, manufacturer: str, model_year: int,
+                       rating: int, job: str,
+                       superior_id: int) -> None:
+        """Create the Citizen as in SocietySimulator.create_citizen, so that
+        it can be undone.
+        """
+        SocietySimulator.create_citizen(self, cid, manufacturer, model_year,
+                                        rating, job, superior_id)
+        self._record('create_citizen', (cid, manufacturer, model_year, rating,
+                                        job, superior_id), ())
+
+    def delete_citizen(self, cid: int) -> None:
+        """Delete the Citizen as in SocietySimulator.delete_citizen, so that
+        it can be undone.
+        """
+        citizen = self.current_society.get_citizen(cid)
+        superior = citizen.get_superior()
+        subordinate_ids = tuple(sub.cid
+                                for sub in citizen.get_direct_subordinates())
+        SocietySimulator.delete_citizen(self, cid)
+        self._record('delete_citizen', (cid,),
+                     (citizen, None if superior is None else superior.cid,
+                      subordinate_ids))
+
+    def promote_citizen(self, cid: int) -> None:
+        """Promote the Citizen as in SocietySimulator.promote_citizen, so that
+        it can be undone.
+        """
+        path = tuple(promotion_path(self.current_society, cid))
+        SocietySimulator.promote_citizen(self, cid)
+        self._record('promote_citizen', (cid,), path)
+
+    def become_district_leader(self, district_name: str) -> None:
+        """Make the current Citizen a DistrictLeader as in
+        SocietySimulator.become_district_leader, so that it can be undone.
+        """
+        cid = self.current_citizen.cid
+        SocietySimulator.become_district_leader(self, district_name)
+        self._record('become_district_leader', (cid, district_name), ())
+
+    def become_citizen(self) -> None:
+        """Make the current Citizen a regular Citizen as in
+        SocietySimulator.become_citizen, so that it can be undone.
+        """
+        cid = self.current_citizen.cid
+        district_name = self.current_citizen.get_district_name()
+        SocietySimulator.become_citizen(self)
+        self._record('become_citizen', (cid,), (district_name,))
+
+    def rename_current_district(self, district_name: str) -> None:
+        """Rename the current Citizen's district as in
+        SocietySimulator.rename_current_district, so that it can be undone.
+        """
+        cid = self.current_citizen.cid
+        old_name = self.current_citizen.get_district_name()
+        SocietySimulator.rename_current_district(self, district_name)
+        self._record('rename_district', (cid, district_name), (old_name,))
+
+    def file_to_society(self, filename: str) -> None:
+        """Replace the current Society as in SocietySimulator.file_to_society,
+        and forget every change to the old one.
+        """
+        SocietySimulator.file_to_society(self, filename)
+        self._undo_deltas.clear()
+        self._redo_deltas.clear()
+
+    def _record(self, op: str, args: tuple, undo: tuple) -> None:
+        """Record the change <op> with the arguments <args>, which can be
+        reversed using <undo>, and forget every undone change.
+        """
+        self._undo_deltas.append((op, args, undo))
+        self._redo_deltas.clear()
+
+    def _reverse(self, op: str, args: tuple, undo: tuple[Any, ...]) -> None:
+        """Reverse the change <op> with the arguments <args> and the reversing
+        information <undo>, which was the latest change to the Society.
+        """
+        society = self.current_society
+        if op == 'create_citizen':
+            society.delete_citizen(args[0])
+        elif op == 'delete_citizen':
+            citizen, superior_id, subordinate_ids = undo
+            restore_citizen(society, citizen, superior_id,
+                            list(subordinate_ids))
+        elif op == 'promote_citizen':
+            undo_promotion(society, list(undo))
+        elif op == 'become_district_leader':
+            society.change_citizen_type(args[0])
+        elif op == 'become_citizen':
+            society.change_citizen_type(args[0], undo[0])
+        else:
+            society.get_citizen(args[0]).rename_district(undo[0])
+
+    def _refresh_current_citizen(self) -> None:
+        """Make the current Citizen the Society's Citizen with the same cid
+        or, if it is no longer in the Society, the head of the Society.
+        """
+        current = self.current_citizen
+        citizen = None
+        if current is not None:
+            citizen = self.current_society.get_citizen(current.cid)
+        self.current_citizen = citizen or self.current_society.get_head()
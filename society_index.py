@@ -0,0 +1,371 @@
+"""Assignment 2: Society Indexes
+
+=== Module description ===
+This module contains SocietyIndex, the indexes that answer queries about the
+shape of a Society's hierarchy and the ratings in it quickly:
+- interval labels, for ancestor tests and for subtrees as contiguous slices
+  of a preorder list;
+- a segment tree over depths, for closest common superiors.
+
+Queries by rating or by district need no index: each Citizen keeps the
+rating summary of its subtree, its subordinates in order of their subtrees'
+best ratings, and its DistrictLeader (see Citizen.get_rating_summary,
+get_top_rated and Citizen._get_district_leader).
+
+The indexes are kept outside the Citizens, in compact arrays of positions
+in the preorder list, so a Society that never asks these queries pays
+nothing for them. Each index is built the first time a query needs it, and
+is rebuilt the first time it is needed after the hierarchy changes. Use
+index_of(society) to get the SocietyIndex of a Society.
+"""
+from __future__ import annotations
+import heapq
+from array import array
+from typing import Iterator, NamedTuple, Optional, Union
+
+from society_hierarchy import Citizen, Society, _by_best, _by_rating
+
+
+def iter_tour(root: Citizen) -> Iterator[tuple[Citizen, bool]]:
+    """Walk the tree rooted at <root> without recursion, yielding
+    (citizen, True) when entering each Citizen and (citizen, False) when
+    leaving it, after all of its subordinates have been visited.
+
+    Subordinates are visited in ascending order by ID.
+
+    >>> c1 = Citizen(1, "Starky Industries", 3024, "Labourer", 50)
+    >>> c2 = Citizen(2, "Hookins National Lab", 3024, "Manager", 30)
+    >>> c1.become_subordinate_to(c2)
+    >>> [(c.cid, entering) for c, entering in iter_tour(c2)]
+    [(2, True), (1, True), (1, False), (2, False)]
+    """
+    to_visit = [(root, True)]
+    while to_visit:
+        citizen, entering = to_visit.pop()
+        yield citizen, entering
+        if entering:
+            to_visit.append((citizen, False))
+            to_visit.extend((subordinate, True) for subordinate
+                            in reversed(citizen._subordinates))
+
+
+def index_of(society: Society) -> SocietyIndex:
+    """Return the SocietyIndex of <society>, creating it (but none of its
+    indexes yet) if it does not have one.
+
+    >>> from society_hierarchy import simple_society_example
+    >>> o = simple_society_example()
+    >>> index_of(o) is index_of(o)
+    True
+    """
+    if society._index is None:
+        society._index = SocietyIndex(society)
+    return society._index
+
+
+class Labels(NamedTuple):
+    """The interval labels of a hierarchy, in arrays indexed by each
+    Citizen's position in preorder.
+
+    The Citizen at position i is preorder[i], and its subtree is
+    preorder[i:exits[i]]. parents[i] is the position of its superior (or -1
+    for the head) and depths[i] is its number of superiors. positions maps a
+    cid to its position: it is an array indexed by cid (with -1 for unused
+    cids) when the cids are dense enough, and a dict otherwise.
+    """
+    version: int
+    preorder: list[Citizen]
+    exits: array
+    parents: array
+    depths: array
+    positions: Union[array, dict[int, int]]
+
+    def position(self, cid: int) -> int:
+        """Return the position of the Citizen with ID <cid>, or -1 if it is
+        not in the hierarchy.
+        """
+        positions = self.positions
+        if isinstance(positions, dict):
+            return positions.get(cid, -1)
+        return positions[cid] if 0 <= cid < len(positions) else -1
+
+
+def _build_labels(head: Optional[Citizen], version: int) -> Labels:
+    """Return the Labels of the hierarchy rooted at <head> (which may be
+    None), for the Society version <version>.
+    """
+    preorder = []
+    exits = array('i')
+    parents = array('i')
+    depths = array('i')
+    open_positions = []  # the positions of the Citizens entered, not left
+    if head is not None:
+        for citizen, entering in iter_tour(head):
+            if entering:
+                position = len(preorder)
+                preorder.append(citizen)
+                exits.append(0)
+                parents.append(open_positions[-1] if open_positions else -1)
+                depths.append(len(open_positions))
+                open_positions.append(position)
+            else:
+                exits[open_positions.pop()] = len(preorder)
+
+    positions: Union[array, dict[int, int]]
+    smallest = min((citizen.cid for citizen in preorder), default=0)
+    largest = max((citizen.cid for citizen in preorder), default=-1)
+    if smallest >= 0 and largest < 2 * len(preorder):
+        positions = array('i', [-1]) * (largest + 1)
+        for position, citizen in enumerate(preorder):
+            positions[citizen.cid] = position
+    else:
+        positions = {citizen.cid: position
+                     for position, citizen in enumerate(preorder)}
+    return Labels(version, preorder, exits, parents, depths, positions)
+
+
+class SocietyIndex:
+    """The indexes of a Society's hierarchy.
+
+    Attached to the Society as its _index. Every change to the hierarchy
+    increases the Society's _version, and an index built for an older version
+    is rebuilt before it is next used.
+
+    Each index is replaced by assigning a single attribute, so threads
+    reading the same (unchanging) Society can build and use the indexes at
+    the same time: each query uses one version of each index throughout.
+
+    === Private Attributes ===
+    _society:
+        The Society that these indexes are for.
+    _labels:
+        The interval labels of the hierarchy, or None if they have not been
+        built.
+    _shallowest:
+        A pair (labels, tree) of the Labels it was built for and a segment
+        tree for finding the shallowest Citizen in any slice of the preorder:
+        with n Citizens, tree[n + i] is i, and for 0 < i < n, tree[i] is
+        whichever of tree[2 * i] and tree[2 * i + 1] has the smaller depth.
+        None if it has not been built.
+    """
+    _society: Society
+    _labels: Optional[Labels]
+    _shallowest: Optional[tuple[Labels, array]]
+
+    def __init__(self, society: Society) -> None:
+        """Initialize the indexes of <society>, without building any of
+        them.
+        """
+        self._society = society
+        self._labels = None
+        self._shallowest = None
+
+    def labels(self) -> Labels:
+        """Return the interval labels of the hierarchy, rebuilding them if the
+        hierarchy has changed since they were last built.
+
+        >>> from society_hierarchy import simple_society_example
+        >>> labels = index_of(simple_society_example()).labels()
+        >>> [c.cid for c in labels.preorder]
+        [6, 2, 3, 5, 7, 9, 8]
+        >>> list(labels.exits)
+        [7, 2, 3, 6, 5, 6, 7]
+        """
+        labels = self._labels
+        version = self._society._version
+        if labels is None or labels.version != version:
+            labels = _build_labels(self._society.get_head(), version)
+            self._labels = labels
+        return labels
+
+    def is_current(self) -> bool:
+        """Return whether the interval labels are built and the hierarchy
+        has not changed since.
+        """
+        labels = self._labels
+        return labels is not None and labels.version == self._society._version
+
+    def is_in_subtree(self, cid: int, root_cid: int) -> bool:
+        """Return True if the Citizen with ID <cid> is the Citizen with ID
+        <root_cid> or one of its (direct or indirect) subordinates.
+
+        Return False if either Citizen is not in the Society's hierarchy.
+
+        >>> from society_hierarchy import simple_society_example
+        >>> index = index_of(simple_society_example())
+        >>> index.is_in_subtree(9, 5)
+        True
+        >>> index.is_in_subtree(9, 6)
+        True
+        >>> index.is_in_subtree(5, 9)
+        False
+        """
+        labels = self.labels()
+        position = labels.position(cid)
+        root = labels.position(root_cid)
+        if position < 0 or root < 0:
+            return False
+        return root <= position < labels.exits[root]
+
+    def _depth_tree(self) -> tuple[Labels, array]:
+        """Return the current labels and the segment tree over depths,
+        rebuilding the tree if the hierarchy has changed since it was last
+        built.
+        """
+        labels = self.labels()
+        built = self._shallowest
+        if built is not None and built[0] is labels:
+            return built
+        depths = labels.depths
+        n = len(depths)
+        tree = array('i', [0]) * n + array('i', range(n))
+        for i in range(n - 1, 0, -1):
+            left, right = tree[2 * i], tree[2 * i + 1]
+            tree[i] = right if depths[right] < depths[left] else left
+        built = (labels, tree)
+        self._shallowest = built
+        return built
+
+    def get_closest_common_superior(self, cid1: int,
+                                    cid2: int) -> Optional[Citizen]:
+        """Return the closest common superior of the Citizens with IDs <cid1>
+        and <cid2>. If one of them is a superior of the other, that Citizen is
+        returned.
+
+        Return None if either Citizen is not in the Society's hierarchy.
+
+        Otherwise, the closest common superior is the superior of the
+        shallowest Citizen after the first of the two in preorder, up to and
+        including the second. After the hierarchy changes, the first query
+        rebuilds the index in O(n); every query after that takes O(log n).
+
+        >>> from society_hierarchy import simple_society_example
+        >>> index = index_of(simple_society_example())
+        >>> index.get_closest_common_superior(7, 9).cid
+        5
+        >>> index.get_closest_common_superior(9, 8).cid
+        6
+        >>> index.get_closest_common_superior(5, 9).cid
+        5
+        """
+        labels, tree = self._depth_tree()
+        first = labels.position(cid1)
+        second = labels.position(cid2)
+        if first < 0 or second < 0:
+            return None
+        if first > second:
+            first, second = second, first
+        if second < labels.exits[first]:
+            return labels.preorder[first]
+
+        depths = labels.depths
+        shallowest = second
+        start = first + 1 + len(depths)
+        end = second + 1 + len(depths)
+        while start < end:
+            if start & 1:
+                if depths[tree[start]] < depths[shallowest]:
+                    shallowest = tree[start]
+                start += 1
+            if end & 1:
+                end -= 1
+                if depths[tree[end]] < depths[shallowest]:
+                    shallowest = tree[end]
+            start //= 2
+            end //= 2
+        return labels.preorder[labels.parents[shallowest]]
+
+    def get_subtree(self, cid: int) -> list[Citizen]:
+        """Return a list of the Citizen with ID <cid> followed by all of its
+        (direct and indirect) subordinates, in preorder.
+
+        Return an empty list if there is no Citizen with ID <cid> in the
+        Society's hierarchy.
+
+        >>> from society_hierarchy import simple_society_example
+        >>> index = index_of(simple_society_example())
+        >>> [c.cid for c in index.get_subtree(5)]
+        [5, 7, 9]
+        >>> [c.cid for c in index.get_subtree(6)]
+        [6, 2, 3, 5, 7, 9, 8]
+        """
+        labels = self.labels()
+        position = labels.position(cid)
+        if position < 0:
+            return []
+        return labels.preorder[position:labels.exits[position]]
+
+    def get_top_rated(self, cid: int, k: int) -> list[Citizen]:
+        """Return the <k> highest rated Citizens among the Citizen with ID
+        <cid> and all of its subordinates (or all of them, if there are fewer
+        than <k>), from the highest rating down. Citizens with the same rating
+        are in ascending order of cid.
+
+        Return an empty list if there is no Citizen with ID <cid> in the
+        Society's hierarchy.
+
+        No index is needed: a query only visits the Citizens returned, their
+        superiors up to the Citizen with ID <cid>, and one sibling of each, so
+        it costs the same right after the hierarchy changes as at any time.
+
+        >>> from society_hierarchy import simple_society_example
+        >>> o = simple_society_example()
+        >>> [c.cid for c in index_of(o).get_top_rated(6, 3)]
+        [9, 8, 2]
+        >>> o.get_citizen(7).rating = 100
+        >>> [c.cid for c in index_of(o).get_top_rated(5, 5)]
+        [7, 9, 5]
+        """
+        root = self._society.get_citizen(cid)
+        if root is None or k <= 0:
+            return []
+
+        # Each Citizen's subordinates are kept in order of the best rated
+        # Citizen in their subtrees (see Citizen._add_rated), so a subtree is
+        # only opened, and its next sibling only pushed, once its best
+        # Citizen comes up. Each entry is (key, kind, citizen, siblings, i),
+        # for the Citizen itself (kind 0) or its whole subtree (kind 1).
+        entries = [(_by_best(root), 1, root, [root], 0)]
+        top = []
+        while entries and len(top) < k:
+            _, kind, citizen, siblings, i = heapq.heappop(entries)
+            if kind == 0:
+                top.append(citizen)
+                continue
+            if i + 1 < len(siblings):
+                sibling = siblings[i + 1]
+                heapq.heappush(entries,
+                               (_by_best(sibling), 1, sibling, siblings, i + 1))
+            heapq.heappush(entries, (_by_rating(citizen), 0, citizen, None, 0))
+            ranked = citizen._rated_subordinates or citizen._subordinates
+            if ranked:
+                heapq.heappush(entries,
+                               (_by_best(ranked[0]), 1, ranked[0], ranked, 0))
+        return top
+
+    def get_top_rated_in_district(self, cid: int, k: int) -> list[Citizen]:
+        """Return the <k> highest rated citizens in the immediate district of
+        the Citizen with ID <cid>, as in get_top_rated.
+
+        Return an empty list if there is no such Citizen, or it is not part of
+        any district.
+
+        >>> from society_hierarchy import district_society_example
+        >>> index = index_of(district_society_example())
+        >>> [c.cid for c in index.get_top_rated_in_district(7, 2)]
+        [9, 5]
+        """
+        citizen = self._society.get_citizen(cid)
+        leader = None if citizen is None else citizen._get_district_leader()
+        if leader is None:
+            return []
+        return self.get_top_rated(leader.cid, k)
+
+
+Society._index_of = staticmethod(index_of)
+
+
+if __name__ == '__main__':
+    import doctest
+
+    doctest.testmod()
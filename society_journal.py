@@ -0,0 +1,347 @@
+"""Assignment 2: Society Journal
+
+=== Module description ===
+This module contains Journal, an append-only record of the changes made to a
+Society, and JournaledSimulator, a SocietySimulator that records each of its
+changes in a Journal so that they survive a restart.
+
+A journal lives in its own directory, which holds:
+- snapshot-<seq>.snap: a snapshot (see society_snapshot.py) of the Society
+  after every operation numbered up to and including <seq>;
+- journal-<seq>.ndjson: a segment of operations, one JSON object per line,
+  starting with the operation numbered <seq>.
+
+Opening a journal loads the newest snapshot and replays every later
+operation on top of it. Once the active segment grows past a size threshold,
+it is closed and a new snapshot is written by a background thread; the
+segments and snapshots that it makes redundant are then deleted.
+"""
+from __future__ import annotations
+import gc
+import json
+import os
+import threading
+from typing import Any, Optional
+
+from client_code import SocietySimulator
+from society_hierarchy import Citizen, Society
+from society_columnar import ColumnarSociety, columnar_from_society
+from society_snapshot import save_snapshot, society_from_snapshot
+
+# The operations that can appear in a journal.
+OPERATIONS = ('create_citizen', 'delete_citizen', 'promote_citizen',
+              'become_district_leader', 'become_citizen', 'rename_district')
+
+
+class Journal:
+    """An append-only journal of operations on a Society, with snapshots.
+
+    === Public Attributes ===
+    directory:
+        The directory that holds this journal's segments and snapshots.
+    sync_every:
+        The number of operations to append between calls to fsync. Up to
+        this many of the latest operations can be lost if the machine
+        crashes (but not if only the program does).
+    compact_at:
+        The size, in bytes, past which the active segment is compacted into
+        a snapshot.
+
+    === Private Attributes ===
+    _next_seq:
+        The number of the next operation to be appended.
+    _file:
+        The active segment, open for appending.
+    _unsynced:
+        The number of operations appended since the last fsync.
+    _compaction:
+        The thread writing the latest snapshot, or None if there is none.
+
+    === Representation Invariants ===
+    - 0 <= _unsynced < sync_every
+    """
+    directory: str
+    sync_every: int
+    compact_at: int
+    _next_seq: int
+    _file: Any
+    _unsynced: int
+    _compaction: Optional[threading.Thread]
+
+    def __init__(self, directory: str, sync_every: int = 100,
+                 compact_at: int = 64 * 1024 * 1024) -> None:
+        """Initialize this Journal in <directory>, creating the directory if
+        it does not exist. Call recover to load its Society.
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.sync_every = sync_every
+        self.compact_at = compact_at
+        self._next_seq = 1
+        self._file = None
+        self._unsynced = 0
+        self._compaction = None
+
+    def recover(self) -> Society:
+        """Return the Society recorded in this journal: its newest snapshot
+        (or an empty Society if there is none) with every later operation
+        replayed on top of it. Then start a new segment for the operations
+        appended from now on.
+
+        A last line that was only partly written when the program stopped
+        is discarded.
+        """
+        snapshots = self._files('snapshot-', '.snap')
+        society = Society()
+        last_seq = 0
+        if snapshots:
+            last_seq, name = snapshots[-1]
+            society = society_from_snapshot(self._path(name))
+
+        collecting = gc.isenabled()
+        gc.disable()
+        try:
+            for _, name in self._files('journal-', '.ndjson'):
+                with open(self._path(name), 'r+b') as f:
+                    end = 0
+                    for line in iter(f.readline, b''):
+                        if not line.endswith(b'\n'):
+                            break
+                        record = json.loads(line)
+                        if record['seq'] > last_seq:
+                            apply_operation(society, record['op'],
+                                            record['args'])
+                            last_seq = record['seq']
+                        end += len(line)
+                    # Drop a partly written last line, so that appending to
+                    # this segment again cannot run into it.
+                    f.truncate(end)
+        finally:
+            if collecting:
+                gc.enable()
+
+        self._next_seq = last_seq + 1
+        self._open_segment()
+        return society
+
+    def append(self, op: str, *args: Any) -> None:
+        """Append the operation <op> with the arguments <args> to this
+        journal.
+
+        Precondition: <op> is one of the operations in OPERATIONS, and it
+        has already been applied successfully with <args>.
+        """
+        record = {'seq': self._next_seq, 'op': op, 'args': args}
+        self._file.write(json.dumps(record, separators=(',', ':')) + '\n')
+        self._next_seq += 1
+        self._unsynced += 1
+        if self._unsynced >= self.sync_every:
+            self.sync()
+
+    def should_compact(self) -> bool:
+        """Return whether the active segment has grown past compact_at bytes
+        and no compaction is already running.
+        """
+        return self._file.tell() >= self.compact_at and \
+            (self._compaction is None or not self._compaction.is_alive())
+
+    def compact(self, society: Society, wait: bool = False) -> None:
+        """Close the active segment and write a snapshot of <society>, which
+        must reflect every operation appended so far, in a background
+        thread (or in this one, if <wait> is True). Start a new segment for
+        the operations appended from now on.
+        """
+        self.wait()
+        self.sync()
+        self._file.close()
+        last_seq = self._next_seq - 1
+        columnar = columnar_from_society(society)
+        self._open_segment()
+        self._compaction = threading.Thread(
+            target=self._write_snapshot, args=(columnar, last_seq))
+        self._compaction.start()
+        if wait:
+            self.wait()
+
+    def wait(self) -> None:
+        """Wait for the compaction in progress, if there is one, to finish.
+        """
+        if self._compaction is not None:
+            self._compaction.join()
+            self._compaction = None
+
+    def sync(self) -> None:
+        """Make sure that every operation appended so far is on disk.
+        """
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+
+    def close(self) -> None:
+        """Sync this journal, wait for any compaction, and close it.
+        """
+        self.sync()
+        self.wait()
+        self._file.close()
+
+    def _write_snapshot(self, columnar: ColumnarSociety,
+                        last_seq: int) -> None:
+        """Save <columnar> as the snapshot of every operation up to and
+        including <last_seq>, then delete the segments and snapshots it
+        replaces.
+        """
+        name = f'snapshot-{last_seq:012d}.snap'
+        temporary = self._path(name + '.tmp')
+        save_snapshot(columnar, temporary)
+        with open(temporary, 'rb') as f:
+            os.fsync(f.fileno())
+        os.replace(temporary, self._path(name))
+        for seq, old in self._files('snapshot-', '.snap'):
+            if seq < last_seq:
+                os.remove(self._path(old))
+        for seq, old in self._files('journal-', '.ndjson'):
+            if seq <= last_seq:
+                os.remove(self._path(old))
+
+    def _open_segment(self) -> None:
+        """Start a new active segment, beginning with operation _next_seq.
+        """
+        self._file = open(self._path(f'journal-{self._next_seq:012d}.ndjson'),
+                          'a', encoding='utf-8')
+        self._unsynced = 0
+
+    def _files(self, prefix: str, suffix: str) -> list[tuple[int, str]]:
+        """Return (seq, name) for each file in this journal's directory
+        named <prefix><seq><suffix>, in ascending order of seq.
+        """
+        found = []
+        for name in os.listdir(self.directory):
+            if name.startswith(prefix) and name.endswith(suffix):
+                number = name[len(prefix):len(name) - len(suffix)]
+                if number.isdigit():
+                    found.append((int(number), name))
+        found.sort()
+        return found
+
+    def _path(self, name: str) -> str:
+        """Return the path of the file called <name> in this journal's
+        directory.
+        """
+        return os.path.join(self.directory, name)
+
+
+def apply_operation(society: Society, op: str, args: list[Any]) -> None:
+    """Apply the journal operation <op> with the arguments <args> to
+    <society>.
+
+    Precondition: <op> is in OPERATIONS.
+    """
+    if op == 'create_citizen':
+        cid, manufacturer, model_year, rating, job, superior_id = args
+        society.add_citizen(Citizen(cid, manufacturer, model_year, job,
+                                    rating), superior_id or None)
+    elif op == 'delete_citizen':
+        society.delete_citizen(args[0])
+    elif op == 'promote_citizen':
+        society.promote_citizen(args[0])
+    elif op == 'become_district_leader':
+        society.change_citizen_type(args[0], args[1])
+    elif op == 'become_citizen':
+        society.change_citizen_type(args[0])
+    else:
+        society.get_citizen(args[0]).rename_district(args[1])
+
+
+class JournaledSimulator(SocietySimulator):
+    """A SocietySimulator that records every change to its Society in a
+    Journal, and that starts from the Society recorded there.
+
+    === Public Attributes ===
+    journal:
+        The Journal that this simulator's changes are recorded in.
+    """
+    journal: Journal
+
+    def __init__(self, directory: str, sync_every: int = 100,
+                 compact_at: int = 64 * 1024 * 1024) -> None:
+        """Initialize this JournaledSimulator with the Society recorded in
+        the journal in <directory>. See Journal for <sync_every> and
+        <compact_at>.
+        """
+        SocietySimulator.__init__(self)
+        self.journal = Journal(directory, sync_every, compact_at)
+        self.current_society = self.journal.recover()
+        self.current_citizen = self.current_society.get_head()
+
+    def create_citizen(self, cid: int, manufacturer: str, model_year: int,
+                       rating: int, job: str,
+                       superior_id: int) -> None:
+        """Create the Citizen as in SocietySimulator.create_citizen, and
+        record it in the journal.
+        """
+        SocietySimulator.create_citizen(self, cid, manufacturer, model_year,
+                                        rating, job, superior_id)
+        self._record('create_citizen', cid, manufacturer, model_year, rating,
+                     job, superior_id)
+
+    def delete_citizen(self, cid: int) -> None:
+        """Delete the Citizen as in SocietySimulator.delete_citizen, and
+        record it in the journal.
+        """
+        SocietySimulator.delete_citizen(self, cid)
+        self._record('delete_citizen', cid)
+
+    def promote_citizen(self, cid: int) -> None:
+        """Promote the Citizen as in SocietySimulator.promote_citizen, and
+        record it in the journal.
+        """
+        SocietySimulator.promote_citizen(self, cid)
+        self._record('promote_citizen', cid)
+
+    def become_district_leader(self, district_name: str) -> None:
+        """Make the current Citizen a DistrictLeader as in
+        SocietySimulator.become_district_leader, and record it in the
+        journal.
+        """
+        cid = self.current_citizen.cid
+        SocietySimulator.become_district_leader(self, district_name)
+        self._record('become_district_leader', cid, district_name)
+
+    def become_citizen(self) -> None:
+        """Make the current Citizen a regular Citizen as in
+        SocietySimulator.become_citizen, and record it in the journal.
+        """
+        cid = self.current_citizen.cid
+        SocietySimulator.become_citizen(self)
+        self._record('become_citizen', cid)
+
+    def rename_current_district(self, district_name: str) -> None:
+        """Rename the current Citizen's district as in
+        SocietySimulator.rename_current_district, and record it in the
+        journal.
+        """
+        SocietySimulator.rename_current_district(self, district_name)
+        self._record('rename_district', self.current_citizen.cid,
+                     district_name)
+
+    def file_to_society(self, filename: str) -> None:
+        """Replace the current Society as in SocietySimulator.file_to_society,
+        and record the new Society in the journal as a snapshot.
+        """
+        SocietySimulator.file_to_society(self, filename)
+        # Later operations build on the new Society, so it must be on disk
+        # before any of them are.
+        self.journal.compact(self.current_society, wait=True)
+
+    def close(self) -> None:
+        """Close this simulator's journal.
+        """
+        self.journal.close()
+
+    def _record(self, op: str, *args: Any) -> None:
+        """Append <op> with <args> to the journal, and compact the journal if
+        it has grown too large.
+        """
+        self.journal.append(op, *args)
+        if self.journal.should_compact():
+            self.journal.compact(self.current_society)
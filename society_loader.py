@@ -0,0 +1,359 @@
+"""Assignment 2: Loading a Society from a File
+
+=== Module description ===
+This module contains load_society, a streaming loader for files in the
+format of citizens.csv, and add_citizens, which adds a batch of citizens to a
+Society in a single pass.
+
+Unlike create_society_from_file in society_hierarchy.py, it reads each line
+as a CSV record (so quoted fields may contain commas), can read a large file
+a chunk of lines at a time, and reports each malformed line with its line
+number.
+"""
+from __future__ import annotations
+import csv
+import gc
+from typing import Callable, Container, Iterable, Optional
+
+from society_hierarchy import Citizen, DistrictLeader, Society, merge
+
+
+def load_society(file: Iterable[str], chunk_size: Optional[int] = None,
+                 errors: Optional[list[tuple[int, str]]] = None) -> Society:
+    """Return the Society represented by the lines of <file>.
+
+    Each line of <file> is a CSV record (quoted fields may contain commas)
+    of the form: cid, manufacturer, model year, job, rating, superior's cid
+    (empty for the head) and, for DistrictLeaders only, the district name.
+    Lines may appear in any order.
+
+    If <chunk_size> is None, the whole file is parsed and then linked in one
+    pass. Otherwise, the file is read <chunk_size> lines at a time and each
+    chunk is linked into the Society before the next one is read, so only
+    the citizens whose superior has not been seen yet are held back.
+
+    If <errors> is None, raise a ValueError naming the line number of the
+    first malformed line. Otherwise, skip every malformed line and append a
+    (line number, message) pair for it to <errors>.
+
+    >>> o = load_society(open('citizens.csv'))
+    >>> o.get_head().manufacturer
+    'Hookins National Lab'
+    >>> len(o.get_head().get_all_subordinates())
+    11
+    >>> o = load_society(open('citizens.csv'), chunk_size=2)
+    >>> len(o.get_all_citizens())
+    12
+    >>> problems = []
+    >>> o = load_society(['1,"Lab, Inc.",3000,Boss,5,,D1',
+    ...                   '2,Lab,3000,Cook,x,1',
+    ...                   '3,Lab,3000,Cook,7,9'], errors=problems)
+    >>> o.get_head().manufacturer
+    'Lab, Inc.'
+    >>> for problem in problems:
+    ...     print(problem)
+    (2, "invalid literal for int() with base 10: 'x'")
+    (3, 'superior 9 does not exist')
+    """
+    def report(line_number: int, message: str) -> None:
+        if errors is None:
+            raise ValueError(f'line {line_number}: {message}')
+        errors.append((line_number, message))
+
+    # Nothing created while loading becomes garbage, so pause the cyclic
+    # garbage collector instead of letting it repeatedly scan the new objects.
+    collecting = gc.isenabled()
+    gc.disable()
+    try:
+        return _read_society(file, chunk_size, report)
+    finally:
+        if collecting:
+            gc.enable()
+
+
+def _read_society(file: Iterable[str], chunk_size: Optional[int],
+                  report: Callable[[int, str], None]) -> Society:
+    """Return the Society represented by the CSV lines in <file>, reading
+    <chunk_size> lines at a time (or all of them, if it is None) and calling
+    <report> with the line number and a message for each malformed line.
+
+    See load_society for the format of <file>.
+    """
+    society = Society()
+    # Citizens whose superior has not been placed yet, by that superior's cid
+    waiting: dict[int, list[tuple[Citizen, int]]] = {}
+    line_numbers: dict[int, int] = {}  # cid -> line, for unplaced citizens
+    has_head = False
+    rows = enumerate(csv.reader(file), 1)
+    while True:
+        chunk = []
+        for line_number, row in rows:
+            if not row:
+                continue
+            try:
+                citizen, superior_id = _citizen_from_row(row)
+                has_head = _check_record(
+                    citizen.cid, superior_id, has_head,
+                    citizen.cid in line_numbers
+                    or society.get_citizen(citizen.cid) is not None)
+            except ValueError as error:
+                report(line_number, str(error))
+                continue
+            line_numbers[citizen.cid] = line_number
+            chunk.append((citizen, superior_id))
+            if chunk_size is not None and len(chunk) >= chunk_size:
+                break
+        if not chunk:
+            break
+
+        # Bring along waiting citizens whose superiors are in this chunk.
+        batch = chunk[:]
+        for citizen, _ in batch:
+            batch.extend(waiting.pop(citizen.cid, []))
+        orphans, cycles = add_citizens(society, batch)
+        unplaced = set(orphans) | set(cycles)
+        for citizen, superior_id in batch:
+            if citizen.cid in unplaced:
+                waiting.setdefault(superior_id, []).append(
+                    (citizen, superior_id))
+            else:
+                del line_numbers[citizen.cid]
+
+    unplaced_lines = []
+    for superior_id, citizens in waiting.items():
+        for citizen, _ in citizens:
+            unplaced_lines.append((line_numbers[citizen.cid], superior_id))
+    for line_number, message in _unplaced_problems(unplaced_lines,
+                                                   line_numbers):
+        report(line_number, message)
+    return society
+
+
+def _check_record(cid: int, superior_id: Optional[int], has_head: bool,
+                  duplicate: bool) -> bool:
+    """Raise ValueError if a citizen with ID <cid> and superior <superior_id>
+    (None for the head) cannot be loaded: if <duplicate> (its cid is taken) or
+    if it is a second head, given whether the citizens loaded so far
+    <has_head>. Otherwise, return whether there is a head once it is loaded.
+
+    >>> _check_record(2, None, False, False)
+    True
+    >>> _check_record(2, None, True, False)
+    Traceback (most recent call last):
+    ValueError: more than one head
+    """
+    if duplicate:
+        raise ValueError(f'duplicate cid {cid}')
+    if superior_id is None:
+        if has_head:
+            raise ValueError('more than one head')
+        return True
+    return has_head
+
+
+def _unplaced_problems(unplaced: list[tuple[int, int]],
+                       unplaced_cids: Container[int]
+                       ) -> list[tuple[int, str]]:
+    """Return a (line number, message) pair, in line order, for each
+    (line number, superior_id) pair in <unplaced>, which describes a citizen
+    that add_citizens could not place under <superior_id>. <unplaced_cids>
+    holds the cids of every citizen that could not be placed.
+
+    >>> for problem in _unplaced_problems([(4, 3), (3, 9)], {3, 4}):
+    ...     print(problem)
+    (3, 'superior 9 does not exist')
+    (4, 'superior 3 is part of a cycle or could not be placed')
+    """
+    problems = []
+    for line_number, superior_id in sorted(unplaced):
+        if superior_id in unplaced_cids:
+            problems.append((line_number, f'superior {superior_id} is part of '
+                                          f'a cycle or could not be placed'))
+        else:
+            problems.append((line_number,
+                             f'superior {superior_id} does not exist'))
+    return problems
+
+
+def add_citizens(society: Society,
+                 records: Iterable[tuple[Citizen, Optional[int]]]
+                 ) -> tuple[list[int], list[int]]:
+    """Add every (citizen, superior_id) pair in <records> to <society>, as if
+    by society.add_citizen(citizen, superior_id), but in a single pass.
+
+    The records may be in any order: a superior_id may refer to a Citizen
+    already in <society> or to any other Citizen in <records>. Each Citizen's
+    new subordinates are put in order once, and all of the Society's indexes
+    are updated once at the end.
+
+    Citizens that cannot be placed are skipped rather than aborting the
+    whole batch. Return a tuple (orphans, cycles) of the cids of the skipped
+    Citizens, in ascending order: orphans are those whose chain of superiors
+    leads to a superior_id that does not exist, and cycles are those whose
+    chain of superiors loops back on itself.
+
+    Preconditions:
+    - Every citizen in <records> satisfies the preconditions of add_citizen,
+      and no cid appears in <records> more than once.
+
+    >>> from society_hierarchy import simple_society_example
+    >>> o = simple_society_example()
+    >>> records = [(Citizen(11, "Lab", 3024, "Cook", 30), 10),
+    ...            (Citizen(10, "Lab", 3024, "Cook", 40), 9),
+    ...            (Citizen(12, "Lab", 3024, "Cook", 50), 13),
+    ...            (Citizen(13, "Lab", 3024, "Cook", 50), 12),
+    ...            (Citizen(14, "Lab", 3024, "Cook", 50), 99)]
+    >>> add_citizens(o, records)
+    ([14], [12, 13])
+    >>> o.get_citizen(11).get_superior().cid
+    10
+    >>> [c.cid for c in o.get_citizens_with_job("Cook")]
+    [10, 11]
+    """
+    records = list(records)
+    batch = {citizen.cid: superior_id for citizen, superior_id in records}
+    children: dict[int, list[Citizen]] = {}
+    to_visit = []
+    for citizen, superior_id in records:
+        if superior_id is None:
+            # A new head: the current head becomes its only subordinate.
+            head = society._head
+            if head is not None:
+                citizen._subordinates.append(head)
+                head._superior = citizen
+                head._set_district(citizen._district)
+            society._head = citizen
+            to_visit.append(citizen)
+        else:
+            children.setdefault(superior_id, []).append(citizen)
+    citizens = society._citizens
+    for superior_id in children:
+        if superior_id not in batch and superior_id in citizens:
+            to_visit.append(citizens[superior_id])
+
+    # Hang each Citizen's new subordinates below it, merging them in once.
+    added = []
+    grown = []  # (Citizen already in <society>, its new subordinates)
+    while to_visit:
+        superior = to_visit.pop()
+        new_subordinates = children.pop(superior.cid, None)
+        if superior._society is not society:
+            added.append(superior)
+            if new_subordinates:
+                superior._subordinates = _in_order(
+                    superior._subordinates + new_subordinates)
+        elif new_subordinates:
+            grown.append((superior, new_subordinates))
+        for subordinate in new_subordinates or []:
+            subordinate._superior = superior
+            to_visit.append(subordinate)
+
+    # Each new Citizen joins its superior's district (the superior comes
+    # first in <added>). Then summarize the new subtrees bottom-up, and add
+    # each of them to the summaries of the Citizens above it.
+    for citizen in added:
+        if citizen._superior is not None \
+                and not isinstance(citizen, DistrictLeader):
+            citizen._district = citizen._superior._district
+    for citizen in reversed(added):
+        citizen._add_rated(citizen._subordinates)
+        citizen._summarize()
+    for superior, new_subordinates in grown:
+        superior._subordinates = merge(superior._subordinates,
+                                       _in_order(new_subordinates))
+        superior._add_rated(new_subordinates)
+        superior._update_summaries(
+            sum(subordinate._count for subordinate in new_subordinates),
+            sum(subordinate._total for subordinate in new_subordinates),
+            min(subordinate._lowest for subordinate in new_subordinates),
+            None)
+    _register_all(society, added)
+
+    # Whatever is left could not be reached from <society>.
+    status: dict[int, bool] = {}  # cid -> whether it is an orphan
+    for cid in batch:
+        path = []
+        current: Optional[int] = cid
+        while current in batch and current not in status \
+                and current not in citizens:
+            status[current] = False  # provisionally part of a cycle
+            path.append(current)
+            current = batch[current]
+        if current not in batch and current not in citizens:
+            orphan = True
+        else:
+            orphan = status.get(current, False)
+        for visited in path:
+            status[visited] = orphan
+    orphans = _in_order([cid for cid in status if status[cid]])
+    cycles = _in_order([cid for cid in status if not status[cid]])
+    return orphans, cycles
+
+
+def _register_all(society: Society, citizens: list[Citizen]) -> None:
+    """Add each Citizen in <citizens> (but not their subordinates) to the cid
+    and job indexes of <society>, updating the job index once per job.
+
+    Precondition: none of <citizens> is already in <society>.
+    """
+    new_jobs: dict[str, list[int]] = {}
+    for citizen in citizens:
+        citizen._society = society
+        society._citizens[citizen.cid] = citizen
+        new_jobs.setdefault(citizen.job, []).append(citizen.cid)
+    for job, cids in new_jobs.items():
+        cids = _in_order(cids)
+        job_cids = society._jobs.setdefault(job, [])
+        if job_cids and job_cids[-1] > cids[0]:
+            society._jobs[job] = merge(job_cids, cids)
+        else:
+            job_cids.extend(cids)
+    society._tree_changed()
+
+
+def _in_order(items: list) -> list:
+    """Return a new list with the elements of <items> in ascending order.
+    """
+    return sorted(items)
+
+
+def _fields_from_row(row: list[str]) -> tuple[int, str, int, str, int,
+                                              Optional[int], str]:
+    """Return the fields of the citizen described by the CSV <row>, converted
+    but without creating a Citizen: its cid, manufacturer, model year, job,
+    rating, the cid of its superior (or None if it is the head) and its
+    district name (or '' if it is not a DistrictLeader).
+
+    Raise ValueError if <row> is malformed.
+
+    >>> _fields_from_row(['2', 'Lab', '3000', 'Cook', '7', '1', 'D1'])
+    (2, 'Lab', 3000, 'Cook', 7, 1, 'D1')
+    """
+    if len(row) not in (6, 7):
+        raise ValueError(f'expected 6 or 7 fields, found {len(row)}')
+    cid, manufacturer, model_year, job, rating, superior = row[:6]
+    return (int(cid), manufacturer, int(model_year), job, int(rating),
+            int(superior) if superior else None,
+            row[6] if len(row) == 7 else '')
+
+
+def _citizen_from_row(row: list[str]) -> tuple[Citizen, Optional[int]]:
+    """Return the Citizen described by the CSV <row>, and the cid of its
+    superior (or None if it is the head).
+
+    Raise ValueError if <row> is malformed.
+    """
+    cid, manufacturer, model_year, job, rating, superior_id, district = \
+        _fields_from_row(row)
+    if district:
+        citizen = DistrictLeader(cid, manufacturer, model_year, job, rating,
+                                 district)
+    else:
+        citizen = Citizen(cid, manufacturer, model_year, job, rating)
+    return citizen, superior_id
+
+
+if __name__ == '__main__':
+    import doctest
+
+    doctest.testmod()
@@ -0,0 +1,146 @@
+"""Assignment 2: Query Server Load Generator
+
+=== Module description ===
+This module sends a stream of queries to a running SocietyServer (see
+society_server.py) from several connections at once and reports the
+throughput and the p50 and p99 latency of the answers.
+
+Each connection keeps up to a fixed number of requests outstanding
+(pipelined), picking each query at random from a mix of cheap lookups and
+slower subtree, district and job queries.
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import json
+import random
+import time
+from typing import Any, Optional
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    """Return the value at <fraction> of the way through the sorted <values>.
+
+    Precondition: values != []
+
+    >>> percentile([3.0, 1.0, 2.0, 4.0], 0.5)
+    2.0
+    >>> percentile([3.0, 1.0, 2.0, 4.0], 0.99)
+    4.0
+    """
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(fraction * len(ordered)) - 1))
+    return ordered[index]
+
+
+def make_request(rng: random.Random, cids: list[int],
+                 jobs: list[str]) -> tuple[str, list[Any]]:
+    """Return a random (query, arguments) pair about the citizens with IDs in
+    <cids> and the jobs in <jobs>.
+    """
+    kind = rng.random()
+    if kind < 0.6:
+        return 'get_citizen', [rng.choice(cids)]
+    if kind < 0.8:
+        return 'get_common_superior', [rng.choice(cids), rng.choice(cids)]
+    if kind < 0.9:
+        return 'get_all_subordinates', [rng.choice(cids)]
+    if kind < 0.95:
+        return 'find_district_citizens', [rng.choice(cids)]
+    return 'find_citizens_with_job', [rng.choice(jobs)]
+
+
+async def _connection(connect: Any, requests: int, depth: int,
+                      cids: list[int], jobs: list[str], seed: int,
+                      latencies: list[float]) -> int:
+    """Send <requests> random requests over a new connection opened by
+    <connect>, with up to <depth> of them outstanding at once. Add the
+    latency of each answer to <latencies>, and return the number of errors.
+    """
+    reader, writer = await connect()
+    rng = random.Random(seed)
+    sent: dict[int, float] = {}
+    window = asyncio.Semaphore(depth)
+    errors = 0
+
+    async def send_all() -> None:
+        for request_id in range(requests):
+            await window.acquire()
+            query, args = make_request(rng, cids, jobs)
+            sent[request_id] = time.perf_counter()
+            writer.write(json.dumps({'id': request_id, 'query': query,
+                                     'args': args}).encode() + b'\n')
+            await writer.drain()
+
+    sender = asyncio.create_task(send_all())
+    for _ in range(requests):
+        response = json.loads(await reader.readline())
+        latencies.append(time.perf_counter() - sent.pop(response['id']))
+        errors += 'error' in response
+        window.release()
+    await sender
+    writer.close()
+    return errors
+
+
+async def run_load(requests: int = 10_000, connections: int = 8,
+                   depth: int = 16, cids: Optional[list[int]] = None,
+                   jobs: Optional[list[str]] = None,
+                   host: str = '127.0.0.1', port: int = 8148,
+                   path: Optional[str] = None) -> dict[str, float]:
+    """Send <requests> requests in total over <connections> connections to
+    the server on the Unix socket <path> (or, if it is None, at <host> and
+    <port>), each with up to <depth> requests outstanding. Queries are about
+    the citizens with IDs in <cids> and the jobs in <jobs>.
+
+    Return the throughput in requests per second, the p50 and p99 latencies
+    in milliseconds, and the number of errors.
+    """
+    if path is not None:
+        def connect() -> Any:
+            return asyncio.open_unix_connection(path)
+    else:
+        def connect() -> Any:
+            return asyncio.open_connection(host, port)
+    cids = cids or list(range(1, 1001))
+    jobs = jobs or ['Manager', 'Worker']
+    latencies: list[float] = []
+    start = time.perf_counter()
+    errors = await asyncio.gather(*(
+        _connection(connect, requests // connections, depth, cids, jobs,
+                    seed, latencies)
+        for seed in range(connections)))
+    elapsed = time.perf_counter() - start
+    return {'requests_per_second': len(latencies) / elapsed,
+            'p50_ms': 1000 * percentile(latencies, 0.5),
+            'p99_ms': 1000 * percentile(latencies, 0.99),
+            'errors': float(sum(errors))}
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    """Run the load generator with the command-line arguments <argv> and
+    print its report.
+    """
+    parser = argparse.ArgumentParser(
+        description='Measure the latency of a Society query server.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8148)
+    parser.add_argument('--unix', help='Unix socket path to connect to')
+    parser.add_argument('--requests', type=int, default=10_000)
+    parser.add_argument('--connections', type=int, default=8)
+    parser.add_argument('--depth', type=int, default=16,
+                        help='requests outstanding per connection')
+    parser.add_argument('--max-cid', type=int, default=1000,
+                        help='query citizens with IDs 1 to this')
+    parser.add_argument('--jobs', nargs='*', default=['Manager', 'Worker'])
+    options = parser.parse_args(argv)
+    results = asyncio.run(run_load(
+        options.requests, options.connections, options.depth,
+        list(range(1, options.max_cid + 1)), options.jobs, options.host,
+        options.port, options.unix))
+    for key, value in results.items():
+        print(f'{key}: {value:,.3f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,233 @@
+"""Assignment 2: Parallel Society Loading
+
+=== Module description ===
+This module contains create_society_from_file_parallel, which loads a Society
+from a file in the format of citizens.csv using several processes.
+
+The file is split into byte ranges that start and end on line boundaries.
+Each worker process parses and checks one range into compact columns (typed
+arrays of integers, with manufacturers, jobs and district names
+dictionary-encoded) without creating any Citizens, so the columns are cheap
+to build and to send back to the parent process. The parent then creates
+the Citizens straight from the columns and links them into a Society in a
+single pass.
+
+Only the parsing runs in parallel, so this only pays off with several CPUs.
+With a single worker there is nothing to run in parallel, and the file is
+simply loaded with load_society.
+
+Lines are checked exactly as load_society checks them, so both loaders
+accept the same files and report the same problems.
+
+Fields must not contain line breaks, since ranges are split at every line
+break in the file.
+"""
+from __future__ import annotations
+import csv
+import gc
+import io
+import os
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+from society_hierarchy import Citizen, DistrictLeader, Society, merge_all
+from society_loader import add_citizens, load_society, _check_record, \
+    _fields_from_row, _unplaced_problems
+
+# The result of parsing one byte range: its integer columns, its string
+# tables, its (line, message) errors, and the number of lines it contains.
+# Line numbers are relative to the start of the range.
+ParsedRange = tuple[dict[str, array], dict[str, list[str]],
+                    list[tuple[int, str]], int]
+
+# The names of the integer columns, in the order _assemble reads them.
+_COLUMNS = ('cid', 'model_year', 'rating', 'superior', 'head', 'manufacturer',
+            'job', 'district', 'line')
+
+
+def create_society_from_file_parallel(
+        filename: str, workers: Optional[int] = None,
+        errors: Optional[list[tuple[int, str]]] = None) -> Society:
+    """Return the Society represented by the information in the file named
+    <filename>, parsing it with <workers> processes (by default, one per
+    CPU). The file format and the handling of malformed lines and <errors>
+    are the same as for load_society in society_loader.
+
+    >>> o = create_society_from_file_parallel('citizens.csv', workers=2)
+    >>> o.get_head().manufacturer
+    'Hookins National Lab'
+    >>> len(o.get_head().get_all_subordinates())
+    11
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    ranges = _split_lines(filename, workers)
+    if len(ranges) <= 1:
+        # Nothing to run in parallel: the serial loader is faster.
+        problems: list[tuple[int, str]] = []
+        with open(filename, newline='', encoding='utf-8') as file:
+            society = load_society(file, errors=problems)
+        problems.sort()
+    else:
+        with ProcessPoolExecutor(workers) as pool:
+            parsed = list(pool.map(_parse_range, [filename] * len(ranges),
+                                   [start for start, _ in ranges],
+                                   [end for _, end in ranges]))
+        # Each list of (line, message) pairs is in line order.
+        problem_lists: list[list[tuple[int, str]]] = []
+        collecting = gc.isenabled()
+        gc.disable()
+        try:
+            society = _assemble(parsed, problem_lists)
+        finally:
+            if collecting:
+                gc.enable()
+        problems = merge_all(problem_lists)
+
+    if errors is None:
+        if problems:
+            raise ValueError(f'line {problems[0][0]}: {problems[0][1]}')
+    else:
+        errors.extend(problems)
+    return society
+
+
+def _split_lines(filename: str, parts: int) -> list[tuple[int, int]]:
+    """Return up to <parts> non-empty (start, end) byte ranges that together
+    cover the file named <filename>, each starting at the beginning of a
+    line.
+    """
+    size = os.path.getsize(filename)
+    bounds = [0]
+    with open(filename, 'rb') as f:
+        for i in range(1, parts):
+            position = max(bounds[-1], size * i // parts)
+            if position > 0:
+                # Move to the start of the first line at or after position.
+                f.seek(position - 1)
+                f.readline()
+                position = f.tell()
+            bounds.append(min(position, size))
+    bounds.append(size)
+    return [(bounds[i], bounds[i + 1]) for i in range(len(bounds) - 1)
+            if bounds[i] < bounds[i + 1]]
+
+
+def _parse_range(filename: str, start: int, end: int) -> ParsedRange:
+    """Parse and check the lines in bytes <start> up to <end> of the file
+    named <filename> into columns. This runs in a worker process.
+
+    The head column is 1 for the head (whose superior column is then 0) and
+    0 for everyone else, and a district code of -1 means that the citizen is
+    not a DistrictLeader.
+    """
+    with open(filename, 'rb') as f:
+        f.seek(start)
+        text = f.read(end - start).decode('utf-8')
+
+    columns = {name: array('q') for name in _COLUMNS}
+    cids, model_years, ratings, superiors, heads, manufacturer_codes, \
+        job_codes, district_codes, lines = [columns[name] for name in _COLUMNS]
+    manufacturers: dict[str, int] = {}
+    jobs: dict[str, int] = {}
+    districts: dict[str, int] = {'': -1}
+    errors = []
+    line_number = 0
+    for line_number, row in enumerate(csv.reader(io.StringIO(text)), 1):
+        if not row:
+            continue
+        try:
+            cid, manufacturer, model_year, job, rating, superior_id, \
+                district = _fields_from_row(row)
+        except ValueError as error:
+            errors.append((line_number, str(error)))
+            continue
+        cids.append(cid)
+        model_years.append(model_year)
+        ratings.append(rating)
+        superiors.append(superior_id or 0)
+        heads.append(superior_id is None)
+        manufacturer_codes.append(
+            manufacturers.setdefault(manufacturer, len(manufacturers)))
+        job_codes.append(jobs.setdefault(job, len(jobs)))
+        district_codes.append(
+            districts.setdefault(district, len(districts) - 1))
+        lines.append(line_number)
+    del districts['']
+    tables = {'manufacturers': list(manufacturers), 'jobs': list(jobs),
+              'district_names': list(districts)}
+    return columns, tables, errors, line_number
+
+
+def _assemble(parsed: list[ParsedRange],
+              problem_lists: list[list[tuple[int, str]]]) -> Society:
+    """Return a Society built from the <parsed> ranges, in file order, and
+    add lists of (line number, message) pairs to <problem_lists>, each in
+    line order, with a pair for each line that could not be used.
+
+    A range whose cids are all new and which adds at most one head is taken
+    as a whole; only the lines of any other range are checked one by one.
+    """
+    records: list[tuple[Citizen, Optional[int]]] = []
+    line_of: dict[int, int] = {}
+    has_head = False
+    first_line = 0
+    for columns, tables, range_errors, line_count in parsed:
+        problem_lists.append([(first_line + line, message)
+                              for line, message in range_errors])
+        problems = []
+        problem_lists.append(problems)
+        citizens = _citizens(columns, tables)
+        superior_ids = [None if head else superior_id for superior_id, head
+                        in zip(columns['superior'], columns['head'])]
+        lines = [first_line + line for line in columns['line']]
+        first_line += line_count
+
+        new_lines = dict(zip(columns['cid'], lines))
+        heads = superior_ids.count(None)
+        if len(new_lines) == len(lines) and has_head + heads <= 1 \
+                and line_of.keys().isdisjoint(new_lines):
+            line_of.update(new_lines)
+            records.extend(zip(citizens, superior_ids))
+            has_head = has_head or heads > 0
+            continue
+        for citizen, superior_id, line in zip(citizens, superior_ids, lines):
+            try:
+                has_head = _check_record(citizen.cid, superior_id, has_head,
+                                         citizen.cid in line_of)
+            except ValueError as error:
+                problems.append((line, str(error)))
+                continue
+            line_of[citizen.cid] = line
+            records.append((citizen, superior_id))
+
+    society = Society()
+    orphans, cycles = add_citizens(society, records)
+    unplaced = set(orphans) | set(cycles)
+    problem_lists.append(_unplaced_problems(
+        [(line_of[citizen.cid], superior_id) for citizen, superior_id
+         in records if citizen.cid in unplaced], unplaced))
+    return society
+
+
+def _citizens(columns: dict[str, array],
+              tables: dict[str, list[str]]) -> list[Citizen]:
+    """Return the Citizens described by the parsed <columns> and <tables> of
+    a range, in order.
+    """
+    manufacturers, jobs = tables['manufacturers'], tables['jobs']
+    citizens = list(map(Citizen, columns['cid'],
+                        map(manufacturers.__getitem__, columns['manufacturer']),
+                        columns['model_year'],
+                        map(jobs.__getitem__, columns['job']),
+                        columns['rating']))
+    districts = tables['district_names']
+    for i, district in enumerate(columns['district']):
+        if district >= 0:
+            citizen = citizens[i]
+            citizens[i] = DistrictLeader(
+                citizen.cid, citizen.manufacturer, citizen.model_year,
+                citizen.job, citizen.rating, districts[district])
+    return citizens
+
@@ -0,0 +1,552 @@
+"""Assignment 2: Persistent Societies
+
+=== Module description ===
+This module contains PersistentSociety, an immutable version of Society for
+"what if" analysis.
+
+A PersistentSociety never changes: add_citizen, delete_citizen,
+promote_citizen and the other updates return a new PersistentSociety and
+leave the original untouched, so every version is a snapshot that can still
+be queried (even by other threads) while later versions are built from it.
+Keeping a version around (a "fork") costs nothing.
+
+Citizens are stored as immutable records in a persistent trie keyed by cid.
+An update copies only the trie paths of the records it changes, and shares
+everything else with the version it was made from, so it costs
+O(changed records * log n) time and memory rather than the O(n) of copying
+the whole Society. Records refer to their superior and subordinates by cid,
+so changing one citizen never forces its superiors to be copied.
+
+Queries return detached Citizen and DistrictLeader copies, which have no
+superior or subordinates, just like ColumnarSociety does.
+"""
+from __future__ import annotations
+import gc
+from bisect import bisect_left, insort
+from typing import Any, Iterator, NamedTuple, Optional
+
+from society_hierarchy import Citizen, DistrictLeader, Society, \
+    iter_preorder
+from society_loader import add_citizens
+
+# The trie has 2 ** _BITS children per node.
+_BITS = 5
+_MASK = (1 << _BITS) - 1
+_EMPTY = (None,) * (1 << _BITS)
+
+
+class _Record(NamedTuple):
+    """The data of one citizen in a PersistentSociety. district_name is None
+    for citizens who are not DistrictLeaders, superior is None for the head,
+    and subordinates are in ascending order.
+    """
+    cid: int
+    manufacturer: str
+    model_year: int
+    job: str
+    rating: int
+    superior: Optional[int]
+    subordinates: tuple[int, ...]
+    district_name: Optional[str]
+
+
+def _trie_get(node: Optional[tuple], shift: int, key: int) -> Any:
+    """Return the value stored for <key> in the trie <node>, whose keys use
+    <shift> + _BITS bits, or None if there is none.
+    """
+    while shift and node is not None:
+        node = node[(key >> shift) & _MASK]
+        shift -= _BITS
+    return None if node is None else node[key & _MASK]
+
+
+def _trie_set(node: Optional[tuple], shift: int, key: int,
+              value: Any) -> tuple:
+    """Return a copy of the trie <node>, whose keys use <shift> + _BITS bits,
+    with <value> stored for <key>. Only the nodes on the path to <key> are
+    copied.
+    """
+    if node is None:
+        node = _EMPTY
+    index = (key >> shift) & _MASK
+    if shift:
+        value = _trie_set(node[index], shift - _BITS, key, value)
+    return node[:index] + (value,) + node[index + 1:]
+
+
+def _trie_build(items: list[tuple[int, Any]], shift: int) -> tuple:
+    """Return a new trie, whose keys use <shift> + _BITS bits, holding the
+    (key, value) pairs in <items>.
+    """
+    node: list[Any] = list(_EMPTY)
+    if shift == 0:
+        for key, value in items:
+            node[key & _MASK] = value
+        return tuple(node)
+    groups: dict[int, list[tuple[int, Any]]] = {}
+    for item in items:
+        groups.setdefault((item[0] >> shift) & _MASK, []).append(item)
+    for index, group in groups.items():
+        node[index] = _trie_build(group, shift - _BITS)
+    return tuple(node)
+
+
+def _shift_for(key: int) -> int:
+    """Return the smallest shift of a trie whose keys can include <key>.
+    """
+    shift = 0
+    while key >> (shift + _BITS):
+        shift += _BITS
+    return shift
+
+
+class PersistentSociety:
+    """An immutable society of citizens in a hierarchy. Updates return a new
+    PersistentSociety that shares all unchanged data with this one.
+
+    >>> from society_hierarchy import simple_society_example
+    >>> before = PersistentSociety.from_society(simple_society_example())
+    >>> after = before.promote_citizen(9)
+    >>> after.get_head().cid, before.get_head().cid
+    (9, 6)
+    >>> [c.cid for c in after.get_direct_subordinates(6)]
+    [5, 7]
+    >>> [c.cid for c in before.get_direct_subordinates(6)]
+    [2, 3, 5, 8]
+
+    === Private Attributes ===
+    _root:
+        The root of the trie that maps each cid to its _Record, or None if
+        this society is empty.
+    _shift:
+        The number of bits that keys are shifted by at the root of the trie.
+    _size:
+        The number of citizens in this society.
+    _head:
+        The cid of the head of this society, or None if it is empty.
+
+    === Representation Invariants ===
+    - The records in _root form a single hierarchy rooted at _head, and
+      every record's superior and subordinates agree with each other.
+    """
+    __slots__ = ('_root', '_shift', '_size', '_head')
+    _root: Optional[tuple]
+    _shift: int
+    _size: int
+    _head: Optional[int]
+
+    def __init__(self) -> None:
+        """Initialize this PersistentSociety with no citizens.
+        """
+        self._root = None
+        self._shift = 0
+        self._size = 0
+        self._head = None
+
+    @staticmethod
+    def from_society(society: Society) -> PersistentSociety:
+        """Return a PersistentSociety with the same citizens and hierarchy as
+        <society>.
+        """
+        head = society.get_head()
+        changes = _Changes(PersistentSociety())
+        # Nothing created here becomes garbage, so pause the cyclic garbage
+        # collector instead of letting it repeatedly scan the new records.
+        collecting = gc.isenabled()
+        gc.disable()
+        try:
+            if head is not None:
+                for citizen in iter_preorder(head):
+                    superior = citizen.get_superior()
+                    changes.set(_record_of(
+                        citizen, None if superior is None else superior.cid,
+                        tuple(sub.cid for sub in
+                              citizen.get_direct_subordinates())))
+            return changes.commit(None if head is None else head.cid,
+                                  len(changes.records))
+        finally:
+            if collecting:
+                gc.enable()
+
+    def to_society(self) -> Society:
+        """Return a new Society with the same citizens and hierarchy as this
+        PersistentSociety.
+        """
+        society = Society()
+        add_citizens(society, ((_make_citizen(record), record.superior)
+                               for record in self._records()))
+        return society
+
+    def __len__(self) -> int:
+        """Return the number of citizens in this society.
+        """
+        return self._size
+
+    def _get(self, cid: int) -> Optional[_Record]:
+        """Return the record of the citizen with ID <cid>, or None if there
+        is no such citizen.
+        """
+        if cid < 0 or cid >> (self._shift + _BITS):
+            return None
+        return _trie_get(self._root, self._shift, cid)
+
+    def _records(self) -> Iterator[_Record]:
+        """Yield the record of every citizen in this society, in preorder.
+        """
+        if self._head is None:
+            return
+        to_visit = [self._head]
+        while to_visit:
+            record = self._get(to_visit.pop())
+            yield record
+            to_visit.extend(reversed(record.subordinates))
+
+    def _subtree_cids(self, cid: int) -> list[int]:
+        """Return the cids of the citizen with ID <cid> and all of its
+        subordinates, in ascending order.
+        """
+        found = []
+        to_visit = [cid]
+        while to_visit:
+            current = to_visit.pop()
+            found.append(current)
+            to_visit.extend(self._get(current).subordinates)
+        found.sort()
+        return found
+
+    def _leader_of(self, cid: int) -> Optional[_Record]:
+        """Return the record of the closest DistrictLeader at or above the
+        citizen with ID <cid>, or None if there is none.
+        """
+        record = self._get(cid)
+        while record is not None and record.district_name is None:
+            record = None if record.superior is None \
+                else self._get(record.superior)
+        return record
+
+    ###########################################################################
+    # Queries
+    ###########################################################################
+    def get_head(self) -> Optional[Citizen]:
+        """Return the head of this society, or None if it is empty.
+        """
+        return None if self._head is None \
+            else _make_citizen(self._get(self._head))
+
+    def get_citizen(self, cid: int) -> Optional[Citizen]:
+        """Return the citizen with ID <cid>, or None if there is none.
+        """
+        record = self._get(cid)
+        return None if record is None else _make_citizen(record)
+
+    def get_all_citizens(self) -> list[Citizen]:
+        """Return a list of all citizens, in order of increasing cid.
+        """
+        records = sorted(self._records(), key=lambda record: record.cid)
+        return [_make_citizen(record) for record in records]
+
+    def get_superior(self, cid: int) -> Optional[Citizen]:
+        """Return the superior of the citizen with ID <cid>, or None if that
+        citizen is the head (or does not exist).
+        """
+        record = self._get(cid)
+        if record is None or record.superior is None:
+            return None
+        return _make_citizen(self._get(record.superior))
+
+    def get_direct_subordinates(self, cid: int) -> list[Citizen]:
+        """Return the direct subordinates of the citizen with ID <cid>, in
+        order of increasing cid.
+        """
+        record = self._get(cid)
+        if record is None:
+            return []
+        return [_make_citizen(self._get(sub)) for sub in record.subordinates]
+
+    def get_all_subordinates(self, cid: int) -> list[Citizen]:
+        """Return all of the (direct and indirect) subordinates of the citizen
+        with ID <cid>, in order of increasing cid.
+        """
+        if self._get(cid) is None:
+            return []
+        return [_make_citizen(self._get(sub))
+                for sub in self._subtree_cids(cid) if sub != cid]
+
+    def get_district_name(self, cid: int) -> str:
+        """Return the name of the immediate district that the citizen with ID
+        <cid> belongs to (or leads), or '' if it is not part of any district.
+        """
+        leader = self._leader_of(cid)
+        return '' if leader is None else leader.district_name
+
+    def get_district_citizens(self, cid: int) -> list[Citizen]:
+        """Return all citizens in the district led by the citizen with ID
+        <cid> (including that citizen and all subdistricts), in order of
+        increasing cid.
+
+        Return an empty list if that citizen is not a DistrictLeader.
+        """
+        record = self._get(cid)
+        if record is None or record.district_name is None:
+            return []
+        return [_make_citizen(self._get(sub))
+                for sub in self._subtree_cids(cid)]
+
+    def get_closest_common_superior(self, cid1: int,
+                                    cid2: int) -> Optional[Citizen]:
+        """Return the closest common superior of the citizens with IDs <cid1>
+        and <cid2>. If one of them is a superior of the other, that citizen is
+        returned.
+
+        Return None if either citizen does not exist.
+        """
+        if self._get(cid1) is None or self._get(cid2) is None:
+            return None
+        ancestors = set()
+        current = cid1
+        while current is not None:
+            ancestors.add(current)
+            current = self._get(current).superior
+        current = cid2
+        while current not in ancestors:
+            current = self._get(current).superior
+        return _make_citizen(self._get(current))
+
+    ###########################################################################
+    # Updates
+    ###########################################################################
+    def add_citizen(self, citizen: Citizen,
+                    superior_id: Optional[int] = None) -> PersistentSociety:
+        """Return a copy of this society with a copy of <citizen> added as a
+        subordinate of the citizen with ID <superior_id>, as in
+        Society.add_citizen.
+
+        If no <superior_id> is provided, the copy of <citizen> becomes the new
+        head, with the original head as its one and only subordinate.
+
+        Preconditions: as for Society.add_citizen.
+        """
+        changes = _Changes(self)
+        head = self._head
+        subordinates: tuple[int, ...] = ()
+        if superior_id is None:
+            if head is not None:
+                changes.set(changes.get(head)._replace(superior=citizen.cid))
+                subordinates = (head,)
+            head = citizen.cid
+        else:
+            superior = changes.get(superior_id)
+            changes.set(superior._replace(subordinates=_with_cids(
+                superior.subordinates, [citizen.cid])))
+        changes.set(_record_of(citizen, superior_id, subordinates))
+        return changes.commit(head, self._size + 1)
+
+    def delete_citizen(self, cid: int) -> PersistentSociety:
+        """Return a copy of this society without the citizen with ID <cid>, as
+        in Society.delete_citizen: their subordinates become subordinates of
+        their superior or, if they are the head, their most highly rated
+        direct subordinate becomes the new head.
+
+        Precondition: there is a citizen with ID <cid> in this society.
+        """
+        changes = _Changes(self)
+        record = changes.get(cid)
+        moved = record.subordinates
+        head = self._head
+        if record.superior is not None:
+            new_superior = record.superior
+            superior = changes.get(new_superior)
+            changes.set(superior._replace(subordinates=_with_cids(
+                _without_cid(superior.subordinates, cid), moved)))
+        elif not moved:
+            new_superior = head = None
+        else:
+            new_superior = head = max(
+                moved, key=lambda sub: (changes.get(sub).rating, -sub))
+            moved = tuple(sub for sub in moved if sub != head)
+            new_head = changes.get(head)
+            changes.set(new_head._replace(
+                superior=None,
+                subordinates=_with_cids(new_head.subordinates, moved)))
+        for sub in moved:
+            changes.set(changes.get(sub)._replace(superior=new_superior))
+        changes.delete(cid)
+        return changes.commit(head, self._size - 1)
+
+    def promote_citizen(self, cid: int) -> PersistentSociety:
+        """Return a copy of this society with the citizen with ID <cid>
+        promoted as in Society.promote_citizen.
+
+        Precondition: there is a citizen with ID <cid> in this society, and
+        they are not a DistrictLeader.
+        """
+        changes = _Changes(self)
+        head = self._head
+        record = changes.get(cid)
+        while record.superior is not None:
+            superior = changes.get(record.superior)
+            if superior.rating >= record.rating:
+                break
+            became_leader = superior.district_name is not None
+            if _swap_up(changes, record, superior):
+                head = cid
+            record = changes.get(cid)
+            if became_leader:
+                break
+        return changes.commit(head, self._size)
+
+    def change_citizen_type(self, cid: int,
+                            district_name: Optional[str] = None) \
+            -> PersistentSociety:
+        """Return a copy of this society in which the citizen with ID <cid> is
+        a regular citizen if they were a DistrictLeader, or the
+        DistrictLeader of <district_name> if they were not.
+
+        Precondition: there is a citizen with ID <cid> in this society.
+        """
+        changes = _Changes(self)
+        record = changes.get(cid)
+        changes.set(record._replace(
+            district_name=None if record.district_name is not None
+            else district_name))
+        return changes.commit(self._head, self._size)
+
+    def rename_district(self, cid: int,
+                        district_name: str) -> PersistentSociety:
+        """Return a copy of this society in which the immediate district of
+        the citizen with ID <cid> is named <district_name>. If that citizen
+        is not part of a district, return this society.
+        """
+        leader = self._leader_of(cid)
+        if leader is None:
+            return self
+        changes = _Changes(self)
+        changes.set(leader._replace(district_name=district_name))
+        return changes.commit(self._head, self._size)
+
+
+class _Changes:
+    """The records changed so far by an update to a PersistentSociety.
+
+    === Public Attributes ===
+    base:
+        The society being updated.
+    records:
+        The new record of each changed cid, or None for deleted cids.
+    """
+    base: PersistentSociety
+    records: dict[int, Optional[_Record]]
+
+    def __init__(self, base: PersistentSociety) -> None:
+        """Initialize an empty set of changes to <base>.
+        """
+        self.base = base
+        self.records = {}
+
+    def get(self, cid: int) -> Optional[_Record]:
+        """Return the current record of the citizen with ID <cid>.
+        """
+        if cid in self.records:
+            return self.records[cid]
+        return self.base._get(cid)
+
+    def set(self, record: _Record) -> None:
+        """Replace the record with the same cid as <record> by <record>.
+        """
+        self.records[record.cid] = record
+
+    def delete(self, cid: int) -> None:
+        """Remove the record of the citizen with ID <cid>.
+        """
+        self.records[cid] = None
+
+    def commit(self, head: Optional[int], size: int) -> PersistentSociety:
+        """Return a new PersistentSociety with these changes, the head <head>
+        and <size> citizens.
+        """
+        root, shift = self.base._root, self.base._shift
+        if root is None and self.records:
+            # Building from scratch: make every node once.
+            shift = _shift_for(max(self.records))
+            root = _trie_build([item for item in self.records.items()
+                                if item[1] is not None], shift)
+            self.records = {}
+        elif self.records:
+            needed = _shift_for(max(self.records))
+            while shift < needed:
+                root = None if root is None else \
+                    (root,) + _EMPTY[1:]
+                shift += _BITS
+        for cid, record in self.records.items():
+            root = _trie_set(root, shift, cid, record)
+        society = PersistentSociety()
+        society._root = root
+        society._shift = shift
+        society._size = size
+        society._head = head
+        return society
+
+
+def _swap_up(changes: _Changes, record: _Record, superior: _Record) -> bool:
+    """Swap the citizen of <record> with its <superior> in <changes>, as in
+    Society._swap_up. Return whether the citizen became the head.
+    """
+    district_name = superior.district_name
+    grand_cid = superior.superior
+    others = _without_cid(superior.subordinates, record.cid)
+    for sub in others:
+        changes.set(changes.get(sub)._replace(superior=record.cid))
+    for sub in record.subordinates:
+        changes.set(changes.get(sub)._replace(superior=superior.cid))
+    changes.set(superior._replace(
+        job=record.job, superior=record.cid,
+        subordinates=record.subordinates, district_name=None))
+    changes.set(record._replace(
+        job=superior.job, superior=grand_cid,
+        subordinates=_with_cids(others, [superior.cid]),
+        district_name=district_name if district_name is not None
+        else record.district_name))
+    if grand_cid is None:
+        return True
+    grand = changes.get(grand_cid)
+    changes.set(grand._replace(subordinates=_with_cids(
+        _without_cid(grand.subordinates, superior.cid), [record.cid])))
+    return False
+
+
+def _with_cids(cids: tuple[int, ...], new: Any) -> tuple[int, ...]:
+    """Return the sorted tuple <cids> with the cids in <new> added.
+    """
+    merged = list(cids)
+    for cid in new:
+        insort(merged, cid)
+    return tuple(merged)
+
+
+def _without_cid(cids: tuple[int, ...], cid: int) -> tuple[int, ...]:
+    """Return the sorted tuple <cids> without <cid>.
+    """
+    i = bisect_left(cids, cid)
+    return cids[:i] + cids[i + 1:]
+
+
+def _record_of(citizen: Citizen, superior: Optional[int],
+               subordinates: tuple[int, ...]) -> _Record:
+    """Return a record with the data of <citizen>, the superior <superior>
+    and the subordinates <subordinates>.
+    """
+    return _Record(citizen.cid, citizen.manufacturer, citizen.model_year,
+                   citizen.job, citizen.rating, superior, subordinates,
+                   citizen.get_district_name()
+                   if isinstance(citizen, DistrictLeader) else None)
+
+
+def _make_citizen(record: _Record) -> Citizen:
+    """Return a new, detached Citizen (or DistrictLeader) with the data in
+    <record>.
+    """
+    args = (record.cid, record.manufacturer, record.model_year, record.job,
+            record.rating)
+    if record.district_name is not None:
+        return DistrictLeader(*args, record.district_name)
+    return Citizen(*args)
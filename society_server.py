@@ -0,0 +1,245 @@
+"""Assignment 2: Society Query Server
+
+=== Module description ===
+This module contains SocietyServer, an asyncio server that answers queries
+about a Society for many clients at once, over a local TCP or Unix socket.
+
+Clients send one JSON object per line, such as
+    {"id": 1, "query": "get_all_subordinates", "args": [6]}
+and may send as many requests as they like without waiting for the answers.
+Each answer is one JSON line, {"id": ..., "result": ...} or {"id": ...,
+"error": "..."}, written as soon as it is ready, so answers can arrive in a
+different order than their requests; match them up by "id". Citizens in a
+result are written as their cids.
+
+The queries are the keys of QUERIES. If several clients ask the same query
+while it is being answered, it is only answered once. Queries that can take
+time proportional to the size of the Society run in a thread pool, so that
+the event loop can keep reading and answering other requests meanwhile.
+
+The Society must not change while the server is running.
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import json
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+from society_hierarchy import DistrictLeader, Society
+from society_index import index_of
+from society_loader import load_society
+from society_snapshot import is_snapshot, society_from_snapshot
+
+
+def _citizen_record(society: Society, cid: int) -> Optional[dict[str, Any]]:
+    """Return the details of the Citizen with ID <cid> in <society>, or None
+    if there is no such Citizen.
+    """
+    citizen = society.get_citizen(cid)
+    if citizen is None:
+        return None
+    superior = citizen.get_superior()
+    return {'cid': citizen.cid, 'manufacturer': citizen.manufacturer,
+            'model_year': citizen.model_year, 'job': citizen.job,
+            'rating': citizen.rating,
+            'superior': None if superior is None else superior.cid,
+            'district': citizen.get_district_name()}
+
+
+def _all_subordinates(society: Society, cid: int) -> list[int]:
+    """Return the cids of all subordinates of the Citizen with ID <cid> in
+    <society>, in ascending order.
+    """
+    citizen = society.get_citizen(cid)
+    if citizen is None:
+        return []
+    return [sub.cid for sub in citizen.get_all_subordinates()]
+
+
+def _common_superior(society: Society, cid1: int, cid2: int) -> Optional[int]:
+    """Return the cid of the closest common superior of the Citizens with
+    IDs <cid1> and <cid2> in <society>, or None if there is none.
+    """
+    superior = index_of(society).get_closest_common_superior(cid1, cid2)
+    return None if superior is None else superior.cid
+
+
+def _district_citizens(society: Society, cid: int) -> list[int]:
+    """Return the cids of the citizens in the district led by the Citizen
+    with ID <cid> in <society>, in ascending order, or an empty list if that
+    Citizen is not a DistrictLeader.
+    """
+    leader = society.get_citizen(cid)
+    if not isinstance(leader, DistrictLeader):
+        return []
+    return [citizen.cid for citizen in leader.get_district_citizens()]
+
+
+def _rating_summary(society: Society, cid: int) -> Optional[dict[str, Any]]:
+    """Return the count, total, lowest, highest and mean of the ratings of
+    the Citizen with ID <cid> in <society> and all of its subordinates, or
+    None if there is no such Citizen.
+    """
+    citizen = society.get_citizen(cid)
+    if citizen is None:
+        return None
+    summary = citizen.get_rating_summary()
+    return {**summary._asdict(), 'mean': summary.mean}
+
+
+def _top_rated(society: Society, cid: int, k: int) -> list[int]:
+    """Return the cids of the <k> highest rated of the Citizen with ID <cid>
+    in <society> and all of its subordinates, from the highest rating down.
+    """
+    return [citizen.cid for citizen in index_of(society).get_top_rated(cid, k)]
+
+
+def _citizens_with_job(society: Society, job: str) -> list[int]:
+    """Return the cids of the citizens in <society> with the job <job>, in
+    ascending order.
+    """
+    return [citizen.cid for citizen in society.get_citizens_with_job(job)]
+
+
+# Each query that the server answers, with the function that answers it and
+# whether that function is slow enough to run in the thread pool.
+QUERIES: dict[str, tuple[Callable[..., Any], bool]] = {
+    'get_citizen': (_citizen_record, False),
+    'get_all_subordinates': (_all_subordinates, True),
+    'get_common_superior': (_common_superior, True),
+    'find_district_citizens': (_district_citizens, True),
+    'find_citizens_with_job': (_citizens_with_job, True),
+    'get_rating_summary': (_rating_summary, True),
+    'get_top_rated': (_top_rated, True),
+}
+
+
+class SocietyServer:
+    """An asyncio server that answers queries about a Society.
+
+    === Public Attributes ===
+    society:
+        The Society that queries are answered about.
+
+    === Private Attributes ===
+    _executor:
+        The thread pool that slow queries run in.
+    _in_flight:
+        The query being answered for each (query, arguments) key, so that
+        identical requests that arrive meanwhile can share its answer.
+    """
+    society: Society
+    _executor: Executor
+    _in_flight: dict[str, asyncio.Future]
+
+    def __init__(self, society: Society,
+                 executor: Optional[Executor] = None) -> None:
+        """Initialize this SocietyServer to answer queries about <society>,
+        running slow queries in <executor> (or in a new thread pool, if it is
+        None).
+        """
+        self.society = society
+        self._executor = executor or ThreadPoolExecutor()
+        self._in_flight = {}
+
+    async def answer(self, query: str, args: list[Any]) -> Any:
+        """Return the answer to <query> with the arguments <args>.
+
+        Raise ValueError if <query> is not one of the QUERIES.
+        """
+        if query not in QUERIES:
+            raise ValueError(f'unknown query {query!r}')
+        function, slow = QUERIES[query]
+        if not slow:
+            return function(self.society, *args)
+
+        key = json.dumps([query, args])
+        future = self._in_flight.get(key)
+        if future is None:
+            future = asyncio.get_running_loop().run_in_executor(
+                self._executor, function, self.society, *args)
+            self._in_flight[key] = future
+            future.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        return await asyncio.shield(future)
+
+    async def handle(self, reader: asyncio.StreamReader,
+                     writer: asyncio.StreamWriter) -> None:
+        """Answer every request read from <reader>, writing each answer to
+        <writer> as soon as it is ready.
+        """
+        tasks = set()
+        try:
+            async for line in reader:
+                if line.strip():
+                    task = asyncio.create_task(self._respond(line, writer))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks)
+        finally:
+            writer.close()
+
+    async def _respond(self, line: bytes,
+                       writer: asyncio.StreamWriter) -> None:
+        """Answer the request in <line> and write the answer to <writer>.
+        """
+        request_id = None
+        try:
+            request = json.loads(line)
+            request_id = request.get('id')
+            result = await self.answer(request['query'],
+                                       request.get('args', []))
+            response = {'id': request_id, 'result': result}
+        except Exception as error:
+            response = {'id': request_id,
+                        'error': f'{type(error).__name__}: {error}'}
+        writer.write(json.dumps(response, separators=(',', ':')).encode()
+                     + b'\n')
+        await writer.drain()
+
+    async def start(self, host: str = '127.0.0.1', port: int = 0,
+                    path: Optional[str] = None) -> asyncio.AbstractServer:
+        """Start listening on the Unix socket <path> or, if it is None, on
+        <host> and <port>, and return the listening server.
+        """
+        if path is not None:
+            return await asyncio.start_unix_server(self.handle, path)
+        return await asyncio.start_server(self.handle, host, port)
+
+
+async def _serve(society: Society, host: str, port: int,
+                 path: Optional[str]) -> None:
+    """Answer queries about <society> until cancelled.
+    """
+    server = await SocietyServer(society).start(host, port, path)
+    for sock in server.sockets:
+        print(f'listening on {sock.getsockname()}', flush=True)
+    async with server:
+        await server.serve_forever()
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    """Run a SocietyServer as described by the command-line arguments
+    <argv>.
+    """
+    parser = argparse.ArgumentParser(
+        description='Answer queries about a Society over a socket.')
+    parser.add_argument('society', help='citizens file or snapshot to load')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8148)
+    parser.add_argument('--unix', help='Unix socket path to listen on instead')
+    options = parser.parse_args(argv)
+    if is_snapshot(options.society):
+        society = society_from_snapshot(options.society)
+    else:
+        with open(options.society) as f:
+            society = load_society(f)
+    try:
+        asyncio.run(_serve(society, options.host, options.port, options.unix))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
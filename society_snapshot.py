@@ -0,0 +1,206 @@
+"""Assignment 2: Society Snapshots
+
+=== Module description ===
+This module contains save_snapshot and load_snapshot, which store a Society
+in a binary file that can be opened again without parsing any text.
+
+A snapshot holds the columns of a ColumnarSociety as fixed-width 64-bit
+little-endian integers, followed by its string tables. load_snapshot maps the
+file into memory with mmap and answers queries straight from the mapped
+columns, so opening a snapshot takes the same time no matter how many
+citizens it holds, and only the citizens that a query returns are created.
+
+=== File format (version 2) ===
+- A header: the magic bytes MAGIC, the format version and the number of
+  sections, packed as HEADER.
+- A table of contents: the (offset, length in bytes) of each section, packed
+  as SECTION. The sections are the columns named in INT_COLUMNS, then, for
+  each table in STRING_TABLES, the byte offsets of its strings followed by
+  the UTF-8 text of all of its strings.
+- The sections themselves, each starting at a multiple of 8 bytes.
+"""
+from __future__ import annotations
+import mmap
+import struct
+import sys
+from array import array
+from typing import Optional, Sequence, Union, overload
+
+from society_hierarchy import Society
+from society_columnar import ColumnarSociety, INT_COLUMNS, STRING_TABLES, \
+    columnar_from_society, society_from_columnar
+
+MAGIC = b'MSOCSNAP'
+VERSION = 2
+HEADER = struct.Struct('<8sII')
+SECTION = struct.Struct('<QQ')
+_SECTIONS = len(INT_COLUMNS) + 2 * len(STRING_TABLES)
+
+
+class _StringTable(Sequence[str]):
+    """A read-only table of strings stored in a snapshot, each decoded the
+    first time it is accessed.
+
+    === Private Attributes ===
+    _offsets:
+        The byte offset of each string in _text, followed by the length of
+        _text.
+    _text:
+        The UTF-8 encoded text of all of the strings, one after another.
+    _decoded:
+        The strings decoded so far, or None for those not decoded yet.
+    """
+    _offsets: Sequence[int]
+    _text: memoryview
+    _decoded: list[Optional[str]]
+
+    def __init__(self, offsets: Sequence[int], text: memoryview) -> None:
+        """Initialize this _StringTable with the given <offsets> into <text>.
+        """
+        self._offsets = offsets
+        self._text = text
+        self._decoded = [None] * (len(offsets) - 1)
+
+    def __len__(self) -> int:
+        """Return the number of strings in this table.
+        """
+        return len(self._decoded)
+
+    @overload
+    def __getitem__(self, i: int) -> str: ...
+
+    @overload
+    def __getitem__(self, i: slice) -> list[str]: ...
+
+    def __getitem__(self, i: Union[int, slice]) -> Union[str, list[str]]:
+        """Return the string at index <i> (or the list of strings in the
+        slice <i>) of this table.
+        """
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        value = self._decoded[i]
+        if value is None:
+            if i < 0:
+                i += len(self._decoded)
+            value = str(self._text[self._offsets[i]:self._offsets[i + 1]],
+                        'utf-8')
+            self._decoded[i] = value
+        return value
+
+
+def save_snapshot(society: Union[Society, ColumnarSociety],
+                  filename: str) -> None:
+    """Write a snapshot of <society> to the file named <filename>, replacing
+    that file if it exists.
+
+    >>> import os, tempfile
+    >>> from society_hierarchy import district_society_example
+    >>> path = os.path.join(tempfile.mkdtemp(), 'society.snap')
+    >>> save_snapshot(district_society_example(), path)
+    >>> s = load_snapshot(path)
+    >>> s.get_district_name(9)
+    'Finance'
+    >>> [c.cid for c in s.get_all_subordinates(5)]
+    [7, 9]
+    """
+    if isinstance(society, Society):
+        society = columnar_from_society(society)
+    columns, strings = society.get_columns(), society.get_strings()
+    sections: list[bytes] = []
+    for name in INT_COLUMNS:
+        sections.append(_to_bytes(columns[name]))
+    for name in STRING_TABLES:
+        encoded = [value.encode('utf-8') for value in strings[name]]
+        offsets = array('q', [0])
+        for value in encoded:
+            offsets.append(offsets[-1] + len(value))
+        sections.append(_to_bytes(offsets))
+        sections.append(b''.join(encoded))
+
+    position = _aligned(HEADER.size + SECTION.size * len(sections))
+    table = []
+    for section in sections:
+        table.append(SECTION.pack(position, len(section)))
+        position = _aligned(position + len(section))
+    with open(filename, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(sections)))
+        f.write(b''.join(table))
+        written = HEADER.size + SECTION.size * len(sections)
+        for section in sections:
+            f.write(bytes(_aligned(written) - written))
+            f.write(section)
+            written = _aligned(written) + len(section)
+
+
+def load_snapshot(filename: str) -> ColumnarSociety:
+    """Return a read-only ColumnarSociety for the snapshot in the file named
+    <filename>, reading its columns lazily from the memory-mapped file.
+
+    Raise ValueError if the file is not a snapshot or uses a format version
+    that is not supported.
+    """
+    with open(filename, 'rb') as f:
+        data = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+    if len(data) < HEADER.size:
+        raise ValueError(f'{filename} is not a society snapshot')
+    magic, version, count = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError(f'{filename} is not a society snapshot')
+    if version != VERSION or count != _SECTIONS:
+        raise ValueError(f'unsupported snapshot version {version}')
+
+    sections = []
+    for i in range(count):
+        offset, length = SECTION.unpack_from(data, HEADER.size
+                                             + i * SECTION.size)
+        if offset + length > len(data):
+            raise ValueError(f'{filename} is truncated')
+        sections.append(data[offset:offset + length])
+    columns = {name: _to_ints(sections[i])
+               for i, name in enumerate(INT_COLUMNS)}
+    strings = {}
+    for i, name in enumerate(STRING_TABLES):
+        first = len(INT_COLUMNS) + 2 * i
+        strings[name] = _StringTable(_to_ints(sections[first]),
+                                     sections[first + 1])
+    return ColumnarSociety(columns, strings)
+
+
+def society_from_snapshot(filename: str) -> Society:
+    """Return a new Society with every citizen in the snapshot in the file
+    named <filename>.
+    """
+    return society_from_columnar(load_snapshot(filename))
+
+
+def is_snapshot(filename: str) -> bool:
+    """Return whether the file named <filename> starts like a snapshot.
+    """
+    with open(filename, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def _aligned(position: int) -> int:
+    """Return the first multiple of 8 that is at least <position>.
+    """
+    return (position + 7) // 8 * 8
+
+
+def _to_bytes(column: Sequence[int]) -> bytes:
+    """Return the little-endian 64-bit encoding of the integers in <column>.
+    """
+    values = array('q', column)
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values.tobytes()
+
+
+def _to_ints(section: memoryview) -> Sequence[int]:
+    """Return the 64-bit little-endian integers in <section>, without copying
+    them where possible.
+    """
+    if sys.byteorder == 'little':
+        return section.cast('q')
+    values = array('q', section.tobytes())
+    values.byteswap()
+    return values
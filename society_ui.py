@@ -26,12 +26,16 @@ the assignment. You may find it useful to run this file as one way to check that
 your code is working, but you should also develop pytests to fully test your
 solution.
 """
+from io import StringIO
 from typing import Optional, Callable
 from tkinter import *
 from tkinter import filedialog as fd, messagebox, ttk
 from society_hierarchy import Citizen
 from client_code import SocietySimulator
 
+# The most lines of the society's tree shown in the main window at once.
+MAX_SOCIETY_LINES = 500
+
 
 def get_citizen_ids() -> list[str]:
     """A helper function to get a list of each Citizen's cid"""
@@ -100,14 +104,16 @@ def update_subordinates() -> None:
 
     for subordinate in subordinates:
         subordinate_string = f"ID: {subordinate.cid}"
-        if subordinate.get_all_subordinates():
+        if subordinate.get_direct_subordinates():
             subordinate_string += ' [has subordinates]'
         subordinates_list.insert(END, subordinate_string)
 
 
 def update_society() -> None:
     """Updates the society to the current_society"""
-    current_society_content['text'] = str(simulation.current_society)
+    text = StringIO()
+    simulation.current_society.render(text, max_lines=MAX_SOCIETY_LINES)
+    current_society_content['text'] = text.getvalue().rstrip('\n') or 'None'
 
 
 def update_citizen() -> None: